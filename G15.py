@@ -13,7 +13,6 @@ import time
 import threading
 import re
 import datetime
-import winsound
 import math
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
@@ -33,13 +32,30 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 
+from alert_engine import (AlertEvaluator, compile_rules, DEFAULT_HYSTERESIS, DEFAULT_DWELL,
+                          DEFAULT_MAX_ALERTS)
+from alert_rules import RuleEngine
+from config_schema import read_document, compile_config, format_number
+from audio_engine import AudioEngine
+from log_view import LogView
+from notify import NotificationHub, build_sinks
+from worker_tuner import (WorkerAutoTuner, rebalance, plan_retire, pick_retiree,
+                          ACTION_ADD, ACTION_RETIRE)
+
 # --- 設定檔名稱 ---
 CONFIG_FILE = "monitor_config_v11.json"
 
 # --- 效能設定 ---
-WORKER_COUNT = 2  # 啟動 2 個瀏覽器分工
+WORKER_COUNT = 2  # 啟動 2 個瀏覽器分工 (開啟自動調整時為初始數量)
 HEADLESS_MODE = True # True=隱藏瀏覽器, False=顯示
 
+# --- 瀏覽器數量自動調整 ---
+AUTO_TUNE_WORKERS = True
+MIN_WORKERS = 1
+MAX_WORKERS = 4
+TARGET_QUOTE_AGE = 3.0     # 目標最大報價年齡 (秒)
+TUNE_INTERVAL_MS = 5000    # 取樣/決策間隔
+
 # ==========================================
 #  輔助與邏輯
 # ==========================================
@@ -71,6 +87,7 @@ class BrowserWorker(QThread):
     log_signal = pyqtSignal(str)
     price_signal = pyqtSignal(str, float, float, str)
     status_signal = pyqtSignal(str, str)
+    metrics_signal = pyqtSignal(int, float, object)  # (worker_id, 本輪週期秒數, {站台: 抓取秒數})
     finished_signal = pyqtSignal()
 
     def __init__(self, worker_id, assigned_sites):
@@ -79,6 +96,10 @@ class BrowserWorker(QThread):
         self.assigned_sites = assigned_sites 
         self.running = True
         self.driver = None
+        # 執行中增減站台 (由 GUI 執行緒放入，輪詢迴圈每輪開頭套用)
+        self.site_lock = threading.Lock()
+        self.pending_add = {}
+        self.pending_remove = set()
 
     def setup_driver(self):
         chrome_options = Options()
@@ -107,40 +128,104 @@ class BrowserWorker(QThread):
         self.driver = webdriver.Chrome(options=chrome_options)
         self.driver.set_page_load_timeout(30) 
 
+    def add_sites(self, sites):
+        with self.site_lock:
+            for key, cfg in sites.items():
+                self.pending_remove.discard(key)
+                self.pending_add[key] = cfg
+
+    def remove_sites(self, keys):
+        with self.site_lock:
+            for key in keys:
+                self.pending_add.pop(key, None)
+                self.pending_remove.add(key)
+
+    def site_keys(self):
+        """目前負責 (含待加入、扣除待移除) 的站台"""
+        with self.site_lock:
+            keys = [k for k in self.assigned_sites if k not in self.pending_remove]
+            return keys + [k for k in self.pending_add if k not in keys]
+
+    def apply_site_changes(self):
+        with self.site_lock:
+            to_add, self.pending_add = self.pending_add, {}
+            to_remove, self.pending_remove = self.pending_remove, set()
+
+        for key in to_remove:
+            with self.site_lock:
+                site = self.assigned_sites.pop(key, None)
+            if site and site.get("handle"):
+                self.close_site(site["handle"])
+        for key, cfg in to_add.items():
+            if not self.running: break
+            with self.site_lock:
+                self.assigned_sites[key] = dict(cfg)
+            self.open_site(key)
+        if to_add or to_remove:
+            self.log_signal.emit(f"[Worker-{self.worker_id}] 站台調整: +{list(to_add.keys())} -{list(to_remove)}，"
+                                 f"目前負責 {list(self.assigned_sites.keys())}")
+
+    def open_site(self, key):
+        """第一個站台直接使用目前分頁，其餘開新分頁"""
+        url = self.assigned_sites[key]["url"]
+        used = [s["handle"] for s in self.assigned_sites.values() if s.get("handle")]
+        if not used:
+            self.driver.switch_to.window(self.driver.window_handles[0])
+            self.driver.get(url)
+            self.assigned_sites[key]["handle"] = self.driver.current_window_handle
+        else:
+            before = set(self.driver.window_handles)
+            self.driver.execute_script(f"window.open('{url}', '_blank');")
+            new = [h for h in self.driver.window_handles if h not in before]
+            self.driver.switch_to.window(new[0] if new else self.driver.window_handles[-1])
+            self.assigned_sites[key]["handle"] = self.driver.current_window_handle
+
+    def close_site(self, handle):
+        try:
+            if len(self.driver.window_handles) > 1:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+                self.driver.switch_to.window(self.driver.window_handles[0])
+            else:
+                # 保留最後一個分頁，避免整個瀏覽器關閉
+                self.driver.switch_to.window(handle)
+                self.driver.get("about:blank")
+        except Exception:
+            pass
+
     def run(self):
         try:
             self.log_signal.emit(f"[Worker-{self.worker_id}] 啟動引擎，負責監控: {list(self.assigned_sites.keys())}")
             self.setup_driver()
             wait = WebDriverWait(self.driver, 5) 
 
-            site_keys = list(self.assigned_sites.keys())
-            if not site_keys: return
-
-            # 初始化分頁
-            first_key = site_keys[0]
-            self.driver.get(self.assigned_sites[first_key]["url"])
-            self.assigned_sites[first_key]["handle"] = self.driver.current_window_handle
-
-            for key in site_keys[1:]:
-                if not self.running: break
-                self.driver.execute_script(f"window.open('{self.assigned_sites[key]['url']}', '_blank');")
-                self.driver.switch_to.window(self.driver.window_handles[-1])
-                self.assigned_sites[key]["handle"] = self.driver.current_window_handle
-                time.sleep(0.5) 
+            # 初始化分頁 (初始站台也走「待加入」流程，自動調整新增的空 Worker 同樣適用)
+            with self.site_lock:
+                initial, self.assigned_sites = self.assigned_sites, {}
+            self.add_sites(initial)
+            self.apply_site_changes()
 
             self.log_signal.emit(f"[Worker-{self.worker_id}] 就緒，開始高速輪詢。")
 
             while self.running:
-                for key in site_keys:
+                self.apply_site_changes()
+                round_start = time.perf_counter()
+                latencies = {}
+                for key in list(self.assigned_sites.keys()):
                     if not self.running: break
+                    t0 = time.perf_counter()
                     try:
                         self.driver.switch_to.window(self.assigned_sites[key]["handle"])
                         self.scrape_site(key, wait)
                     except Exception as e:
                         self.status_signal.emit(key, "連線/切換異常")
+                    latencies[key] = time.perf_counter() - t0
                     
                     QThread.msleep(10) 
 
+                if latencies:
+                    self.metrics_signal.emit(self.worker_id, time.perf_counter() - round_start, latencies)
+
                 # 每一輪結束稍作休息
                 for _ in range(5): 
                     if not self.running: break
@@ -156,7 +241,8 @@ class BrowserWorker(QThread):
         now_str = datetime.datetime.now().strftime("%H:%M:%S")
         try:
             bid, ask = 0.0, 0.0
-            method_name = f"scrape_{key}"
+            # 可用 "scraper" 指定解析方法 (例如模擬站台 WF2 沿用 scrape_WF)
+            method_name = f"scrape_{self.assigned_sites[key].get('scraper', key)}"
             if hasattr(self, method_name):
                 func = getattr(self, method_name)
                 bid, ask = func(wait)
@@ -285,6 +371,8 @@ QCheckBox::indicator:checked { background: #007acc; border: 1px solid #007acc; i
 
 class GoldMonitorApp(QMainWindow):
     audio_log_signal = pyqtSignal(str)
+    alert_transition_signal = pyqtSignal(object)  # 警報執行緒 -> UI (只傳狀態轉換)
+    rule_event_signal = pyqtSignal(object)  # 進階規則成立 / 解除
 
     def __init__(self):
         super().__init__()
@@ -293,9 +381,23 @@ class GoldMonitorApp(QMainWindow):
         self.setStyleSheet(DARK_STYLESHEET)
 
         self.workers = [] 
+        self.retired_workers = []  # 自動調整退役中的 Worker
+        self.next_worker_id = 1
+        self.site_latency = {}     # 站台 -> 最近一次抓取秒數
+        self.worker_cycles = {}    # worker_id -> 最近一輪週期秒數
+        self.last_quote_time = {}  # 站台 -> 最後收到報價的時間
+        self.error_sites = set()   # 目前狀態異常的站台 (不納入報價年齡)
+        self.tuner = None
         self.setting_inputs = {}
         self.alert_status_labels = {}
-        self.last_triggered_levels = {}
+        self.policy_inputs = {}       # 站台 -> 回差 / 停留秒數 / 每分鐘上限
+        self.notify_config = []       # 通知通道設定 (見 notify.py)
+        self.suppressed_labels = {}
+        # 警報評估執行緒：門檻於設定變更時編譯，每筆 tick 只做二分搜尋
+        # 音效預先載入記憶體，由單一播放執行緒依層級優先播放
+        self.audio = AudioEngine(log=self.audio_log_signal.emit)
+        self.alert_evaluator = AlertEvaluator(self.alert_transition_signal.emit, self.audio.play,
+                                              self.rule_event_signal.emit, log=self.audio_log_signal.emit)
         self.sound_checkboxes = {} 
         self.chk_all_sound = None
 
@@ -323,8 +425,28 @@ class GoldMonitorApp(QMainWindow):
         self.clock_timer.timeout.connect(self.update_realtime_clock)
         self.clock_timer.start(1000)
 
+        self.tune_timer = QTimer(self)
+        self.tune_timer.timeout.connect(self.auto_tune_step)
+
         self.audio_log_signal.connect(self.log_message)
-        self.load_settings()
+        self.alert_transition_signal.connect(self.on_alert_transition)
+        self.rule_event_signal.connect(self.on_rule_event)
+        if not self.load_settings():
+            self.recompile_alerts()
+        self.apply_alert_rules(quiet=True)
+
+        # 通知分送：由警報執行緒直接送出，不經過 UI 也不阻塞評估
+        sinks, errors = build_sinks(self.notify_config)
+        self.notifier = NotificationHub(sinks, log=self.audio_log_signal.emit).start()
+        self.notifier.names = {k: v['name'] for k, v in self.all_sites_config.items()}
+        self.alert_evaluator.notify = self.notifier.publish_alert
+        for msg in errors:
+            self.log_message(msg)
+        if sinks:
+            self.log_message(f"通知通道: {', '.join(s.name for s in sinks)}")
+
+        self.audio.start()
+        self.alert_evaluator.start()
 
     def init_ui(self):
         main_widget = QWidget()
@@ -451,6 +573,7 @@ class GoldMonitorApp(QMainWindow):
             chk_sound.setToolTip(f"勾選以啟用 [{self.all_sites_config[key]['name']}] 的音效")
             
             chk_sound.toggled.connect(lambda checked, k=key: self.log_message(f"[{self.all_sites_config[k]['name']}] 音效切換: {checked}"))
+            chk_sound.toggled.connect(self.recompile_alerts)
             
             chk_layout.addWidget(chk_sound)
             self.table.setCellWidget(row, 6, container)
@@ -490,7 +613,24 @@ class GoldMonitorApp(QMainWindow):
         btn_layout.addStretch() 
         btn_layout.addWidget(btn_save)
 
+        # 進階規則 (持續時間 / 相對中位數 / 中價變動 / 跨券商)
+        grp_rules = QGroupBox("進階規則 (每行一條)")
+        rules_layout = QVBoxLayout(grp_rules)
+        self.txt_rules = QTextEdit()
+        self.txt_rules.setAcceptRichText(False)
+        self.txt_rules.setFixedHeight(110)
+        self.txt_rules.setPlaceholderText("spread(WF) > 0.5 for 10s\n"
+                                          "spread(*) > 2x median(1h)\n"
+                                          "move(WF) > 1.0 in 30s\n"
+                                          "bid(WF) > ask(IG) sound=C:/alert.wav")
+        btn_apply_rules = QPushButton("套用規則")
+        btn_apply_rules.setFixedWidth(100)
+        btn_apply_rules.clicked.connect(lambda: self.apply_alert_rules())
+        rules_layout.addWidget(self.txt_rules)
+        rules_layout.addWidget(btn_apply_rules, alignment=Qt.AlignmentFlag.AlignRight)
+
         layout.addWidget(splitter)
+        layout.addWidget(grp_rules)
         layout.addLayout(btn_layout)
 
     def create_setting_page(self, key):
@@ -532,8 +672,29 @@ class GoldMonitorApp(QMainWindow):
             grid.addWidget(txt_sound, i + 1, 2)
             grid.addWidget(btn_browse, i + 1, 3)
             grid.addWidget(lbl_status, i + 1, 4)
+            txt_diff.textChanged.connect(self.recompile_alerts)
+            txt_sound.textChanged.connect(self.recompile_alerts)
             self.setting_inputs[key].append({"diff": txt_diff, "sound": txt_sound})
 
+        # 防抖動：回差 / 最短停留 / 每分鐘警報上限
+        policy_layout = QHBoxLayout()
+        self.policy_inputs[key] = {}
+        for field, label, default in (("hysteresis", "回差", DEFAULT_HYSTERESIS),
+                                      ("dwell", "停留秒數", DEFAULT_DWELL),
+                                      ("max_alerts", "每分鐘上限", DEFAULT_MAX_ALERTS)):
+            txt = QLineEdit(str(default))
+            txt.setFixedWidth(60)
+            txt.textChanged.connect(self.recompile_alerts)
+            policy_layout.addWidget(QLabel(label))
+            policy_layout.addWidget(txt)
+            self.policy_inputs[key][field] = txt
+        policy_layout.addStretch()
+        lbl_suppressed = QLabel("已過濾: 0")
+        lbl_suppressed.setStyleSheet("color: gray")
+        policy_layout.addWidget(lbl_suppressed)
+        self.suppressed_labels[key] = lbl_suppressed
+        grid.addLayout(policy_layout, 4, 0, 1, 5)
+
         layout.addWidget(group)
         return page
 
@@ -549,16 +710,15 @@ class GoldMonitorApp(QMainWindow):
 
     def setup_log_tab(self):
         layout = QVBoxLayout(self.tab_log)
-        self.txt_log = QTextEdit()
-        self.txt_log.setReadOnly(True)
-        self.txt_log.setStyleSheet("background-color: #1e1e1e; color: #ccc; font-family: Consolas;")
-        layout.addWidget(self.txt_log)
-        btn_clear = QPushButton("清除日誌")
-        btn_clear.clicked.connect(self.txt_log.clear)
-        layout.addWidget(btn_clear)
+        # 固定筆數的環形緩衝區 + 虛擬化清單，可依層級 / 券商篩選
+        self.log_view = LogView()
+        layout.addWidget(self.log_view)
 
     def update_realtime_clock(self):
         self.lbl_clock.setText(QTime.currentTime().toString("HH:mm:ss"))
+        for key, count in self.alert_evaluator.suppressed_counts().items():
+            lbl = self.suppressed_labels.get(key)
+            if lbl: lbl.setText(f"已過濾: {count}")
 
     def browse_file(self, line_edit):
         f, _ = QFileDialog.getOpenFileName(self, "選取音效", "", "Audio (*.wav)")
@@ -566,20 +726,24 @@ class GoldMonitorApp(QMainWindow):
 
     @pyqtSlot(str)
     def log_message(self, msg):
-        ts = time.strftime("%H:%M:%S")
-        self.txt_log.append(f"[{ts}] {msg}")
-        self.txt_log.verticalScrollBar().setValue(self.txt_log.verticalScrollBar().maximum())
+        self.log_view.add(msg)
 
     def start_monitor(self):
         self.btn_start.setEnabled(False)
         self.btn_stop.setEnabled(True)
-        self.last_triggered_levels = {}
+        self.alert_evaluator.reset()
+        self.apply_alert_rules(quiet=True)  # 規則狀態 (持續時間/中位數) 重新累積
         self.log_message(f">>> 監控系統啟動，配置 {WORKER_COUNT} 個並行引擎...")
 
         keys = list(self.all_sites_config.keys())
         chunk_size = math.ceil(len(keys) / WORKER_COUNT)
         
         self.workers = []
+        self.next_worker_id = 1
+        self.site_latency = {}
+        self.worker_cycles = {}
+        self.last_quote_time = {}
+        self.error_sites = set()
         for i in range(WORKER_COUNT):
             start_idx = i * chunk_size
             end_idx = start_idx + chunk_size
@@ -588,22 +752,91 @@ class GoldMonitorApp(QMainWindow):
             if not worker_keys: continue
 
             worker_sites = {k: self.all_sites_config[k].copy() for k in worker_keys}
-            
-            worker = BrowserWorker(i + 1, worker_sites)
-            worker.log_signal.connect(self.log_message)
-            worker.price_signal.connect(self.on_price_update)
-            worker.status_signal.connect(self.on_status_update)
-            worker.finished_signal.connect(self.on_worker_finished)
-            self.workers.append(worker)
-            worker.start()
+            self.spawn_worker(worker_sites)
+
+        if AUTO_TUNE_WORKERS:
+            self.tuner = WorkerAutoTuner(MIN_WORKERS, MAX_WORKERS, TARGET_QUOTE_AGE)
+            self.tune_timer.start(TUNE_INTERVAL_MS)
+            self.log_message(f"瀏覽器自動調整已啟用: {MIN_WORKERS}~{MAX_WORKERS} 個，目標報價年齡 {TARGET_QUOTE_AGE:.1f} 秒")
+
+    def spawn_worker(self, worker_sites):
+        worker = BrowserWorker(self.next_worker_id, worker_sites)
+        self.next_worker_id += 1
+        worker.log_signal.connect(self.log_message)
+        worker.price_signal.connect(self.on_price_update)
+        worker.status_signal.connect(self.on_status_update)
+        worker.metrics_signal.connect(self.on_worker_metrics)
+        worker.finished_signal.connect(lambda w=worker: self.on_worker_finished(w))
+        # 已退役的 Worker 在執行緒真正結束後才釋放參照
+        worker.finished.connect(lambda w=worker: self.retired_workers.remove(w) if w in self.retired_workers else None)
+        self.workers.append(worker)
+        worker.start()
+        return worker
+
+    def on_worker_metrics(self, worker_id, cycle_seconds, latencies):
+        self.worker_cycles[worker_id] = cycle_seconds
+        self.site_latency.update(latencies)
+
+    def current_assignment(self):
+        return {w.worker_id: w.site_keys() for w in self.workers}
+
+    def apply_moves(self, moves):
+        by_id = {w.worker_id: w for w in self.workers}
+        for key, src, dst in moves:
+            by_id[src].remove_sites([key])
+            by_id[dst].add_sites({key: self.all_sites_config[key].copy()})
+        if moves:
+            self.log_message("   -> 站台重新分配: " + ", ".join(f"{k}: W{src}→W{dst}" for k, src, dst in moves))
+
+    def auto_tune_step(self):
+        """定期取樣報價年齡並依自動調整器的決策增減瀏覽器"""
+        if not self.workers: return
+        now = time.time()
+        # 只看有報價且狀態正常的站台；掛掉或從未報價的站台加瀏覽器也救不回來，計入只會讓年齡無限增長
+        ages = [now - ts for k, ts in self.last_quote_time.items() if k not in self.error_sites]
+        if ages:
+            self.tuner.add_sample(max(ages), list(self.worker_cycles.values()))
+
+        action, reason, metrics = self.tuner.decide(len(self.workers), now)
+        assignment = self.current_assignment()
+
+        if action == ACTION_ADD:
+            self.log_message(f"[自動調整] 增加瀏覽器 ({len(self.workers)} → {len(self.workers) + 1}): {reason}")
+            worker = self.spawn_worker({})
+            assignment[worker.worker_id] = []
+            self.apply_moves(rebalance(assignment, self.site_latency))
+        elif action == ACTION_RETIRE:
+            retiree_id = pick_retiree(assignment, self.site_latency)
+            self.log_message(f"[自動調整] 退役 Worker-{retiree_id} ({len(self.workers)} → {len(self.workers) - 1}): {reason}")
+            self.apply_moves(plan_retire(assignment, retiree_id, self.site_latency))
+            retiree = next(w for w in self.workers if w.worker_id == retiree_id)
+            self.workers.remove(retiree)
+            self.retired_workers.append(retiree)
+            retiree.stop()
+        else:
+            # 數量不變時，負載明顯不均才搬動站台
+            self.apply_moves(rebalance(assignment, self.site_latency))
 
     def stop_monitor(self):
         self.log_message("正在發送停止信號給所有引擎...")
         self.btn_stop.setEnabled(False)
+        self.tune_timer.stop()
         for w in self.workers:
             w.stop()
 
-    def on_worker_finished(self):
+    def on_worker_finished(self, worker=None):
+        # 非停止造成的結束 (例如瀏覽器啟動失敗)：把它負責的站台交給其他 Worker，避免站台從此沒人抓
+        if worker is not None and worker.running and worker in self.workers:
+            self.workers.remove(worker)
+            orphans = worker.site_keys()
+            alive = [w for w in self.workers if w.running]
+            if orphans and alive:
+                for key in orphans:
+                    dst = min(alive, key=lambda w: len(w.site_keys()))
+                    dst.add_sites({key: self.all_sites_config[key].copy()})
+                self.log_message(f"[Worker-{worker.worker_id}] 異常結束，站台改由其他瀏覽器負責: {orphans}")
+            elif orphans:
+                self.log_message(f"[Worker-{worker.worker_id}] 異常結束，沒有其他瀏覽器可接手: {orphans}")
         all_stopped = all(not w.isRunning() for w in self.workers)
         if all_stopped:
             self.log_message(">>> 所有監控引擎已安全停止")
@@ -615,6 +848,7 @@ class GoldMonitorApp(QMainWindow):
         if source not in self.row_map: return
         row = self.row_map[source]
         spread = abs(ask - bid)
+        self.last_quote_time[source] = time.time()
 
         self.table.item(row, 1).setText(f"{bid:.2f}")
         self.table.item(row, 2).setText(f"{ask:.2f}")
@@ -623,7 +857,7 @@ class GoldMonitorApp(QMainWindow):
         self.table.item(row, 5).setText("監控中")
         self.table.item(row, 5).setForeground(QColor("#4ec9b0"))
         
-        self.check_alert(source, spread, row)
+        self.check_alert(source, bid, ask)
 
     def on_status_update(self, source, msg):
         if source not in self.row_map: return
@@ -631,72 +865,75 @@ class GoldMonitorApp(QMainWindow):
         item = self.table.item(row, 5)
         item.setText(msg)
         item.setForeground(QColor("#4ec9b0") if msg == "監控中" else QColor("#f44747"))
+        if msg == "監控中":
+            self.error_sites.discard(source)
+        else:
+            self.error_sites.add(source)
 
     # ==========================================
     #  [關鍵修正] 嚴格的警報檢查邏輯
     # ==========================================
-    def check_alert(self, source, spread, row_idx):
-        inputs = self.setting_inputs.get(source, [])
-        highest_lvl = -1
-        sound_path = None
-
-        # 1. 計算最高觸發層級 (UI 更新)
-        for i, item in enumerate(inputs):
-            try: thresh = float(item['diff'].text())
-            except: thresh = 999.0
-            
+    def check_alert(self, source, bid, ask):
+        # 門檻已預先編譯，交給警報執行緒評估；UI 只處理狀態轉換
+        self.alert_evaluator.submit(source, bid, ask)
+
+    def on_alert_transition(self, tr):
+        source = tr.b_id
+        for i in range(3):
             lbl = self.alert_status_labels.get((source, i))
-            if thresh > 0 and spread >= thresh:
+            if not lbl: continue
+            if i in tr.tiers:
                 lbl.setText("● 觸發")
                 lbl.setStyleSheet("color: #ff3333; font-weight: bold;")
-                highest_lvl = i
-                # [修正] 使用 .strip() 確保沒有多餘的空白
-                sound_path = item['sound'].text().strip() 
             else:
                 lbl.setText("● 待機")
                 lbl.setStyleSheet("color: gray;")
 
-        spread_item = self.table.item(row_idx, 3)
-        spread_item.setBackground(QColor("#660000") if highest_lvl >= 0 else QColor("#252526"))
+        if source in self.row_map:
+            spread_item = self.table.item(self.row_map[source], 3)
+            spread_item.setBackground(QColor("#660000") if tr.level >= 0 else QColor("#252526"))
 
-        last = self.last_triggered_levels.get(source, -1)
-        
-        # 2. 獲取音效開關狀態 (Checkbox)
-        is_sound_enabled_for_this_broker = True
-        if source in self.sound_checkboxes:
-            is_sound_enabled_for_this_broker = self.sound_checkboxes[source].isChecked()
-
-        # 3. 判斷是否播放音效 (邏輯順序優化)
-        if highest_lvl > last:
-            self.log_message(f"[{source}] 警報觸發! 點差: {spread:.2f} (層級 {highest_lvl+1})")
-            
-            # [修正] 優先判斷開關是否開啟
-            if is_sound_enabled_for_this_broker:
-                # [修正] 只有當路徑存在且確實是檔案時才播放 (過濾掉空字串或無效路徑)
-                if sound_path and os.path.isfile(sound_path):
-                    threading.Thread(target=self.play_sound, args=(sound_path,), daemon=True).start()
-                else:
-                    # 如果設定了層級但沒檔案，這是正常的，保持安靜
-                    pass 
-            else:
+        # 音效已由警報執行緒播放，這裡只記錄
+        if tr.fired:
+            self.log_message(f"[{source}] 警報觸發! 點差: {tr.spread:.2f} (層級 {tr.level+1})")
+            if not tr.sound_enabled:
                 self.log_message(f"   -> [{source}] 音效開關已手動關閉，不播放。")
-        
-        self.last_triggered_levels[source] = highest_lvl
 
-    def play_sound(self, path):
-        try: 
-            # [修正] 加入 SND_ASYNC 確保非阻塞
-            winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_NODEFAULT | winsound.SND_ASYNC)
-        except: 
-            pass
+    def on_rule_event(self, ev):
+        state = "成立" if ev.active else "解除"
+        self.log_message(f"[{ev.b_id}] 規則{state}: {ev.rule} (數值 {ev.value:.2f})")
 
-    def save_settings(self):
+    def collect_alert_settings(self):
         data = {}
         for key, inputs in self.setting_inputs.items():
             is_checked = self.sound_checkboxes[key].isChecked() if key in self.sound_checkboxes else True
             data[key] = {"tiers": [], "sound_enabled": is_checked}
             for item in inputs:
                 data[key]["tiers"].append({"diff": item['diff'].text(), "sound": item['sound'].text()})
+            for field, txt in self.policy_inputs.get(key, {}).items():
+                data[key][field] = txt.text()
+        return data
+
+    def apply_alert_rules(self, quiet=False):
+        """解析進階規則並替換評估執行緒中的規則引擎 (規則狀態重新累積)"""
+        engine, errors = RuleEngine.from_text(self.txt_rules.toPlainText())
+        for no, msg in errors:
+            self.log_message(f"規則第 {no} 行: {msg}")
+        self.audio.preload(spec.sound for spec in engine.specs)
+        self.alert_evaluator.set_rule_engine(engine if len(engine) else None)
+        if not quiet:
+            self.log_message(f"已套用 {len(engine)} 條進階規則")
+
+    def recompile_alerts(self):
+        """警報設定變更時重新編譯門檻並整組替換給評估執行緒"""
+        rules = compile_rules(self.collect_alert_settings())
+        self.audio.preload(p for r in rules.values() for p in r.sounds.values())
+        self.alert_evaluator.set_rules(rules)
+
+    def save_settings(self):
+        data = self.collect_alert_settings()
+        data["rules"] = self.txt_rules.toPlainText().splitlines()
+        data["notify"] = self.notify_config
         try:
             with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=4)
@@ -707,44 +944,61 @@ class GoldMonitorApp(QMainWindow):
             QMessageBox.critical(self, "錯誤", f"儲存設定失敗: {e}")
 
     def load_settings(self):
-        if not os.path.exists(CONFIG_FILE): return
+        """讀取設定檔 (經 config_schema 轉換與驗證)，套用到介面並直接編譯成警報規則；有套用時回傳 True"""
+        if not os.path.exists(CONFIG_FILE): return False
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            all_checked = True 
-
-            for key, val in data.items():
-                tiers = val if isinstance(val, list) else val.get("tiers", [])
-                sound_enabled = True if isinstance(val, list) else val.get("sound_enabled", True)
-                
-                if key in self.setting_inputs:
-                    ui_inputs = self.setting_inputs[key]
-                    for i, t_data in enumerate(tiers):
-                        if i < len(ui_inputs):
-                            ui_inputs[i]['diff'].setText(t_data.get('diff', ''))
-                            ui_inputs[i]['sound'].setText(t_data.get('sound', ''))
-                
-                if key in self.sound_checkboxes:
-                    self.sound_checkboxes[key].setChecked(sound_enabled)
-                    if not sound_enabled:
-                        all_checked = False
-            
-            if self.chk_all_sound:
-                self.chk_all_sound.setChecked(all_checked)
-
+            doc, source = read_document(CONFIG_FILE)
         except Exception as e:
             self.log_message(f"讀取設定檔錯誤: {e}")
+            return False
+        config, errors = compile_config(doc, source)
+        for msg in errors:
+            self.log_message(msg)
+
+        all_checked = True
+        self.txt_rules.setPlainText("\n".join(config.rule_lines))
+        self.notify_config = [dict(item) for item in config.notify]
+
+        for key, policy in config.alerts.items():
+            if key in self.setting_inputs:
+                ui_inputs = self.setting_inputs[key]
+                for i, tier in enumerate(policy.tiers):
+                    if i < len(ui_inputs):
+                        ui_inputs[i]['diff'].setText(format_number(tier.diff))
+                        ui_inputs[i]['sound'].setText(tier.sound)
+
+            if key in self.policy_inputs:
+                for field, txt in self.policy_inputs[key].items():
+                    txt.setText(format_number(getattr(policy, field)))
+
+            if key in self.sound_checkboxes:
+                self.sound_checkboxes[key].setChecked(policy.sound_enabled)
+                if not policy.sound_enabled:
+                    all_checked = False
+
+        if self.chk_all_sound:
+            self.chk_all_sound.setChecked(all_checked)
+
+        rules = config.compile_alerts()
+        self.audio.preload(p for r in rules.values() for p in r.sounds.values())
+        self.alert_evaluator.set_rules(rules)
+        return True
 
     def closeEvent(self, event):
         if any(w.isRunning() for w in self.workers):
             reply = QMessageBox.question(self, '確認退出', '監控正在執行，確定要強制關閉嗎？', QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
                 self.stop_monitor()
+                self.alert_evaluator.stop()
+                self.audio.stop()
+                self.notifier.stop()
                 event.accept()
             else:
                 event.ignore()
         else:
+            self.alert_evaluator.stop()
+            self.audio.stop()
+            self.notifier.stop()
             event.accept()
 
 if __name__ == "__main__":
@@ -2,10 +2,8 @@ import sys
 import os
 import json
 import time
-import threading
 import re
 import datetime
-import winsound
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
@@ -23,6 +21,10 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 
+from alert_engine import AlertEvaluator, compile_rules
+from config_schema import read_document, compile_config, format_number
+from audio_engine import AudioEngine
+
 # --- 設定檔名稱 ---
 CONFIG_FILE = "monitor_config_v10_pro.json"  # 升級版號
 
@@ -365,6 +367,7 @@ QCheckBox::indicator:checked {
 
 class GoldMonitorApp(QMainWindow):
     audio_log_signal = pyqtSignal(str)
+    alert_transition_signal = pyqtSignal(object)  # 警報執行緒 -> UI (只傳狀態轉換)
 
     def __init__(self):
         super().__init__()
@@ -375,7 +378,10 @@ class GoldMonitorApp(QMainWindow):
         self.monitor_thread = None
         self.setting_inputs = {}
         self.alert_status_labels = {}
-        self.last_triggered_levels = {}
+        # 警報評估執行緒：門檻於設定變更時編譯，每筆 tick 只做二分搜尋；音效由評估執行緒直接送出
+        self.audio = AudioEngine(log=self.audio_log_signal.emit)
+        self.alert_evaluator = AlertEvaluator(self.alert_transition_signal.emit, self.audio.play,
+                                              log=self.audio_log_signal.emit)
         
         # [關鍵] 儲存每個券商的音效開關狀態與UI參考
         self.sound_enabled_map = {} 
@@ -410,9 +416,13 @@ class GoldMonitorApp(QMainWindow):
         self.clock_timer.start(1000)
 
         self.audio_log_signal.connect(self.log_message)
+        self.alert_transition_signal.connect(self.on_alert_transition)
         
         # 啟動時讀取設定
-        self.load_settings()
+        if not self.load_settings():
+            self.recompile_alerts()
+        self.audio.start()
+        self.alert_evaluator.start()
 
     def init_ui(self):
         main_widget = QWidget()
@@ -554,6 +564,7 @@ class GoldMonitorApp(QMainWindow):
 
     def toggle_sound_state(self, key, checked):
         self.sound_enabled_map[key] = checked
+        self.recompile_alerts()
         # self.log_message(f"[{self.brokers_map[key]}] 音效設定: {'開啟' if checked else '關閉'}")
 
     # ---------------------------
@@ -638,6 +649,8 @@ class GoldMonitorApp(QMainWindow):
             grid.addWidget(txt_sound, i + 1, 2)
             grid.addWidget(btn_browse, i + 1, 3)
             grid.addWidget(lbl_status, i + 1, 4)
+            txt_diff.textChanged.connect(self.recompile_alerts)
+            txt_sound.textChanged.connect(self.recompile_alerts)
 
             self.setting_inputs[key].append({"diff": txt_diff, "sound": txt_sound})
 
@@ -714,7 +727,7 @@ class GoldMonitorApp(QMainWindow):
     def start_monitor(self):
         self.btn_start.setEnabled(False)
         self.btn_stop.setEnabled(True)
-        self.last_triggered_levels = {}
+        self.alert_evaluator.reset()
         self.log_message(">>> 監控系統啟動")
 
         self.monitor_thread = UnifiedMonitorThread()
@@ -748,7 +761,7 @@ class GoldMonitorApp(QMainWindow):
         self.table.item(row, 5).setForeground(QColor("#4ec9b0"))  # Green (監控中顯示綠色)
 
         # 處理警報
-        self.check_alert(source, spread, row)
+        self.check_alert(source, bid, ask)
 
     def on_status_update(self, source, msg):
         if source not in self.row_map: return
@@ -761,60 +774,36 @@ class GoldMonitorApp(QMainWindow):
         else:
             item.setForeground(QColor("#f44747"))  # Red
 
-    def check_alert(self, source, spread, row_idx):
-        inputs = self.setting_inputs.get(source, [])
-        highest_lvl = -1
-        sound_path = None
-
-        # 檢查警報層級
-        for i, item in enumerate(inputs):
-            try:
-                thresh = float(item['diff'].text())
-            except:
-                thresh = 999.0
+    def check_alert(self, source, bid, ask):
+        # 門檻已預先編譯，交給警報執行緒評估；UI 只處理狀態轉換
+        self.alert_evaluator.submit(source, bid, ask)
 
+    def on_alert_transition(self, tr):
+        source = tr.b_id
+        for i in range(3):
             lbl = self.alert_status_labels.get((source, i))
-            if thresh > 0 and spread >= thresh:
+            if not lbl: continue
+            if i in tr.tiers:
                 lbl.setText("● 觸發")
                 lbl.setStyleSheet("color: #ff3333; font-weight: bold;")
-                highest_lvl = i
-                sound_path = item['sound'].text()
             else:
                 lbl.setText("● 待機")
                 lbl.setStyleSheet("color: gray;")
 
         # 視覺反饋
-        spread_item = self.table.item(row_idx, 3)
-        if highest_lvl >= 0:
-            spread_item.setBackground(QColor("#660000"))  # 深紅背景
-        else:
-            spread_item.setBackground(QColor("#252526"))  # 恢復原色
-
-        # 音效邏輯 (加入開關判斷)
-        last = self.last_triggered_levels.get(source, -1)
-        
-        # 判斷音效是否為開啟狀態
-        is_sound_on = self.sound_enabled_map.get(source, True)
-
-        if highest_lvl > last:
-            # 只有升級觸發時寫 Log
-            self.log_message(f"[{source}] 警報觸發! 點差: {spread:.2f} (層級 {highest_lvl+1})")
-            
-            if sound_path and os.path.exists(sound_path):
-                if is_sound_on:
-                    # [修正] 正常播放
-                    threading.Thread(target=self.play_sound, args=(sound_path,), daemon=True).start()
-                else:
-                    # [修正] 靜音時明確告知使用者
-                    self.log_message(f"   -> [{source}] 音效已關閉，略過播放。")
-            
-        self.last_triggered_levels[source] = highest_lvl
+        if source in self.row_map:
+            spread_item = self.table.item(self.row_map[source], 3)
+            if tr.level >= 0:
+                spread_item.setBackground(QColor("#660000"))  # 深紅背景
+            else:
+                spread_item.setBackground(QColor("#252526"))  # 恢復原色
 
-    def play_sound(self, path):
-        try:
-            winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_NODEFAULT)
-        except:
-            pass
+        # 音效已由警報執行緒播放，這裡只記錄 (只有升級觸發時寫 Log)
+        if tr.fired:
+            self.log_message(f"[{source}] 警報觸發! 點差: {tr.spread:.2f} (層級 {tr.level+1})")
+            if tr.sound_path and not tr.sound_enabled:
+                # [修正] 靜音時明確告知使用者
+                self.log_message(f"   -> [{source}] 音效已關閉，略過播放。")
 
     def on_thread_finished(self):
         self.log_message(">>> 監控已停止")
@@ -822,7 +811,7 @@ class GoldMonitorApp(QMainWindow):
         self.btn_stop.setEnabled(False)
         self.monitor_thread = None
 
-    def save_settings(self):
+    def collect_alert_settings(self):
         data = {}
         for key, inputs in self.setting_inputs.items():
             # [修正] 儲存結構包含 'tiers' 與 'sound_enabled'
@@ -832,6 +821,16 @@ class GoldMonitorApp(QMainWindow):
             }
             for item in inputs:
                 data[key]["tiers"].append({"diff": item['diff'].text(), "sound": item['sound'].text()})
+        return data
+
+    def recompile_alerts(self):
+        """警報設定變更時重新編譯門檻並整組替換給評估執行緒"""
+        rules = compile_rules(self.collect_alert_settings())
+        self.audio.preload(p for r in rules.values() for p in r.sounds.values())
+        self.alert_evaluator.set_rules(rules)
+
+    def save_settings(self):
+        data = self.collect_alert_settings()
         try:
             with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=4)
@@ -842,31 +841,35 @@ class GoldMonitorApp(QMainWindow):
             QMessageBox.critical(self, "錯誤", f"儲存設定失敗: {e}")
 
     def load_settings(self):
-        if not os.path.exists(CONFIG_FILE): return
+        """讀取設定檔 (經 config_schema 轉換與驗證)，套用到介面並直接編譯成警報規則；有套用時回傳 True"""
+        if not os.path.exists(CONFIG_FILE): return False
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            for key, val in data.items():
-                # [修正] 兼容舊版設定檔 (如果是 list 則轉為新格式處理)
-                tiers = val if isinstance(val, list) else val.get("tiers", [])
-                sound_enabled = True if isinstance(val, list) else val.get("sound_enabled", True)
-
-                # 1. 還原閾值與音效路徑
-                if key in self.setting_inputs:
-                    ui_inputs = self.setting_inputs[key]
-                    for i, t_data in enumerate(tiers):
-                        if i < len(ui_inputs):
-                            ui_inputs[i]['diff'].setText(t_data.get('diff', ''))
-                            ui_inputs[i]['sound'].setText(t_data.get('sound', ''))
-                
-                # 2. [修正] 還原音效開關狀態
-                if key in self.sound_checkboxes:
-                    # 這會觸發 toggled 訊號，進而更新 self.sound_enabled_map
-                    self.sound_checkboxes[key].setChecked(sound_enabled)
-                    
+            doc, source = read_document(CONFIG_FILE)
         except Exception as e:
-            self.log_message(f"讀取設定檔錯誤 (可能是格式更新，存檔一次即可修復): {e}")
+            self.log_message(f"讀取設定檔錯誤: {e}")
+            return False
+        config, errors = compile_config(doc, source)
+        for msg in errors:
+            self.log_message(msg)
+
+        for key, policy in config.alerts.items():
+            # 1. 還原閾值與音效路徑
+            if key in self.setting_inputs:
+                ui_inputs = self.setting_inputs[key]
+                for i, tier in enumerate(policy.tiers):
+                    if i < len(ui_inputs):
+                        ui_inputs[i]['diff'].setText(format_number(tier.diff))
+                        ui_inputs[i]['sound'].setText(tier.sound)
+
+            # 2. [修正] 還原音效開關狀態
+            if key in self.sound_checkboxes:
+                # 這會觸發 toggled 訊號，進而更新 self.sound_enabled_map
+                self.sound_checkboxes[key].setChecked(policy.sound_enabled)
+
+        rules = config.compile_alerts()
+        self.audio.preload(p for r in rules.values() for p in r.sounds.values())
+        self.alert_evaluator.set_rules(rules)
+        return True
 
     def closeEvent(self, event):
         if self.monitor_thread and self.monitor_thread.isRunning():
@@ -874,10 +877,14 @@ class GoldMonitorApp(QMainWindow):
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
                 self.stop_monitor()
+                self.alert_evaluator.stop()
+                self.audio.stop()
                 event.accept()
             else:
                 event.ignore()
         else:
+            self.alert_evaluator.stop()
+            self.audio.stop()
             event.accept()
 
 
@@ -2,14 +2,11 @@ import sys
 import os
 import json
 import time
-import threading
 import re
-import datetime  # 用於生成日誌檔名的日期
-import winsound  # Windows 音效
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
-                             QTextEdit, QTabWidget, QGroupBox, QGridLayout,
+                             QTabWidget, QGroupBox, QGridLayout,
                              QFileDialog, QMessageBox)
 from PyQt6.QtCore import pyqtSignal, QThread, Qt, QTimer, QTime, pyqtSlot
 from PyQt6.QtGui import QFont
@@ -20,6 +17,12 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 
+from alert_engine import AlertEvaluator, compile_rules
+from config_schema import read_document, compile_config, format_number
+from audio_engine import AudioEngine
+from log_store import LogFileWriter
+from log_view import LogView
+
 # --- 設定檔名稱 ---
 CONFIG_FILE = "monitor_config_v2.json"
 
@@ -292,6 +295,7 @@ class BrokerPanel(QGroupBox):
 
 class GoldMonitorApp(QMainWindow):
     audio_log_signal = pyqtSignal(str)
+    alert_transition_signal = pyqtSignal(object)  # 警報執行緒 -> UI (只傳狀態轉換)
 
     def __init__(self):
         super().__init__()
@@ -302,8 +306,14 @@ class GoldMonitorApp(QMainWindow):
         self.setting_inputs = {}
         self.alert_status_labels = {}
 
-        # 記錄上一次觸發的層級 (-1:無, 0:層級1, 1:層級2, 2:層級3)
-        self.last_triggered_levels = {}
+        # 日誌檔由背景執行緒批次寫入 (依日期 / 大小輪替)，GUI 執行緒不碰檔案
+        self.log_writer = LogFileWriter("monitor_log")
+        self.log_writer.start()
+
+        # 警報評估執行緒 (含回差 / 停留時間 / 頻率上限，使用預設值)
+        self.audio = AudioEngine(log=self.audio_log_signal.emit)
+        self.alert_evaluator = AlertEvaluator(self.alert_transition_signal.emit, self.audio.play,
+                                              log=self.audio_log_signal.emit)
 
         self.init_ui()
         self.clock_timer = QTimer(self)
@@ -311,8 +321,12 @@ class GoldMonitorApp(QMainWindow):
         self.clock_timer.start(1000)
 
         self.audio_log_signal.connect(self.log_message)
+        self.alert_transition_signal.connect(self.on_alert_transition)
 
-        self.load_settings()
+        if not self.load_settings():
+            self.recompile_alerts()
+        self.audio.start()
+        self.alert_evaluator.start()
 
     def init_ui(self):
         main_widget = QWidget()
@@ -415,6 +429,8 @@ class GoldMonitorApp(QMainWindow):
             layout.addWidget(btn_browse, i + 1, 3)
             layout.addWidget(lbl_status, i + 1, 4)
 
+            txt_diff.textChanged.connect(self.recompile_alerts)
+            txt_sound.textChanged.connect(self.recompile_alerts)
             self.setting_inputs[key].append({
                 "diff": txt_diff,
                 "sound": txt_sound
@@ -424,12 +440,8 @@ class GoldMonitorApp(QMainWindow):
 
     def setup_log_tab(self):
         layout = QVBoxLayout(self.tab_log)
-        self.txt_log = QTextEdit()
-        self.txt_log.setReadOnly(True)
-        layout.addWidget(self.txt_log)
-        btn_clear = QPushButton("清除介面日誌 (不影響檔案)")
-        btn_clear.clicked.connect(self.txt_log.clear)
-        layout.addWidget(btn_clear)
+        self.log_view = LogView(clear_text="清除介面日誌 (不影響檔案)")
+        layout.addWidget(self.log_view)
 
     def update_realtime_clock(self):
         self.lbl_clock.setText(QTime.currentTime().toString("HH:mm:ss"))
@@ -442,26 +454,14 @@ class GoldMonitorApp(QMainWindow):
     def log_message(self, msg):
         """
         記錄日誌功能：
-        1. 顯示在 UI 的 TextEdit
-        2. 寫入到本地的 txt 檔案
+        1. 加入 UI 的日誌環形緩衝區 (每幀批次顯示)
+        2. 交給背景執行緒寫入本地 txt 檔案 (檔名格式: monitor_log_2023-10-27.txt)
         """
-        # 取得當前時間 HH:MM:SS
-        ts = time.strftime("%H:%M:%S")
-        full_log_text = f"[{ts}] {msg}"
-
-        # 1. 更新 UI
-        self.txt_log.append(full_log_text)
+        rec = self.log_view.add(msg)
+        self.log_writer.write(f"[{rec.time_str}] {msg}")
 
-        # 2. 寫入檔案 (檔名格式: monitor_log_2023-10-27.txt)
-        today_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        log_filename = f"monitor_log_{today_date}.txt"
-
-        try:
-            with open(log_filename, "a", encoding="utf-8") as f:
-                f.write(full_log_text + "\n")
-        except Exception as e:
-            # 如果寫入檔案失敗，至少在控制台印出
-            print(f"寫入日誌檔案失敗: {e}")
+    def close_log_file(self):
+        self.log_writer.stop()
 
     def start_monitor(self):
         self.save_settings()
@@ -469,7 +469,7 @@ class GoldMonitorApp(QMainWindow):
         self.btn_stop.setEnabled(True)
 
         # 重置所有觸發狀態
-        self.last_triggered_levels = {}
+        self.alert_evaluator.reset()
 
         self.log_message("--- 系統啟動 (使用自動 Driver 管理) ---")
 
@@ -495,17 +495,16 @@ class GoldMonitorApp(QMainWindow):
             t.stop()
 
     def on_price_update(self, source, bid, ask, time_str):
-        spread = 0.0
         if source == "WF":
-            spread = self.panel_wf.update_data(bid, ask, time_str)
+            self.panel_wf.update_data(bid, ask, time_str)
         elif source == "IG":
-            spread = self.panel_ig.update_data(bid, ask, time_str)
+            self.panel_ig.update_data(bid, ask, time_str)
         elif source == "Oanda":
-            spread = self.panel_oanda.update_data(bid, ask, time_str)
+            self.panel_oanda.update_data(bid, ask, time_str)
         elif source == "Forex":
-            spread = self.panel_forex.update_data(bid, ask, time_str)
+            self.panel_forex.update_data(bid, ask, time_str)
 
-        self.check_alert(source, spread)
+        self.check_alert(source, bid, ask)
 
     def on_status_update(self, source, msg):
         if source == "WF":
@@ -524,66 +523,34 @@ class GoldMonitorApp(QMainWindow):
             self.btn_stop.setEnabled(False)
             self.log_message("--- 所有監控已結束 ---")
 
-    def check_alert(self, source, spread):
-        inputs = self.setting_inputs.get(source, [])
-
-        # 初始化：當前最高觸發的層級索引 (-1 代表無)
-        current_highest_level = -1
-        current_sound_path = None
-        current_threshold_str = "0.00"
-
-        # 1. 掃描所有層級，找出目前點差符合的最高層級
-        for i, item in enumerate(inputs):
-            try:
-                threshold_text = item['diff'].text()
-                threshold = float(threshold_text) if threshold_text else 0.0
-            except:
-                threshold = 0.0
+    def check_alert(self, source, bid, ask):
+        # 門檻已預先編譯，交給警報執行緒評估 (含回差與頻率上限)；UI 只處理狀態轉換
+        self.alert_evaluator.submit(source, bid, ask)
 
+    def on_alert_transition(self, tr):
+        source = tr.b_id
+        for i in range(3):
             status_lbl = self.alert_status_labels.get((source, i))
-
-            if threshold > 0 and spread >= threshold:
+            if not status_lbl: continue
+            if i in tr.tiers:
                 status_lbl.setText("觸發中")
                 status_lbl.setStyleSheet("color: red; font-weight: bold;")
-
-                current_highest_level = i
-                current_sound_path = item['sound'].text()
-                current_threshold_str = threshold_text  # 保存觸發的設定值
             else:
                 status_lbl.setText("正常")
                 status_lbl.setStyleSheet("color: green;")
 
-        # 2. 獲取上一次記錄的狀態
-        last_level = self.last_triggered_levels.get(source, -1)
-
-        # 3. 核心邏輯判斷 (升級觸發)
-        if current_highest_level > last_level:
-
-            # --- 格式化日誌訊息 (嚴格依照要求) ---
-            # 格式: [Source] 點差:當前點差 大於 層級點差:設定值
-            formatted_msg = f"[{source}] 點差:{spread:.2f} 大於 層級點差:{current_threshold_str}"
-            self.log_message(formatted_msg)
+        # 升級觸發才記錄 (音效已由警報執行緒播放)
+        # 格式: [Source] 點差:當前點差 大於 層級點差:設定值
+        if tr.fired:
+            self.log_message(f"[{source}] 點差:{tr.spread:.2f} 大於 層級點差:{tr.threshold:g}")
 
-            # 播放聲音
-            if current_sound_path:
-                threading.Thread(target=self.play_sound, args=(current_sound_path,), daemon=True).start()
-
-            # 更新記憶狀態
-            self.last_triggered_levels[source] = current_highest_level
-
-        elif current_highest_level < last_level:
-            # 降級了，更新狀態但不播放聲音
-            self.last_triggered_levels[source] = current_highest_level
-
-    def play_sound(self, path):
-        normalized_path = os.path.normpath(path)
-        if os.path.exists(normalized_path):
-            try:
-                winsound.PlaySound(normalized_path, winsound.SND_FILENAME | winsound.SND_NODEFAULT)
-            except Exception as e:
-                self.audio_log_signal.emit(f"音效播放失敗: {str(e)}")
-        else:
-            self.audio_log_signal.emit(f"找不到音效檔案: {normalized_path}")
+    def recompile_alerts(self):
+        """警報設定變更時重新編譯門檻並整組替換給評估執行緒"""
+        data = {key: [{"diff": item['diff'].text(), "sound": item['sound'].text()} for item in inputs]
+                for key, inputs in self.setting_inputs.items()}
+        rules = compile_rules(data)
+        self.audio.preload(p for r in rules.values() for p in r.sounds.values())
+        self.alert_evaluator.set_rules(rules)
 
     def save_settings(self):
         data = {}
@@ -602,19 +569,29 @@ class GoldMonitorApp(QMainWindow):
             self.log_message(f"儲存失敗: {e}")
 
     def load_settings(self):
-        if not os.path.exists(CONFIG_FILE): return
+        """讀取設定檔 (經 config_schema 轉換與驗證)，套用到介面並直接編譯成警報規則；有套用時回傳 True"""
+        if not os.path.exists(CONFIG_FILE): return False
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            for key, tiers in data.items():
-                if key in self.setting_inputs:
-                    ui_inputs = self.setting_inputs[key]
-                    for i, t_data in enumerate(tiers):
-                        if i < len(ui_inputs):
-                            ui_inputs[i]['diff'].setText(t_data.get('diff', ''))
-                            ui_inputs[i]['sound'].setText(t_data.get('sound', ''))
+            doc, source = read_document(CONFIG_FILE)
         except Exception as e:
             self.log_message(f"讀取設定失敗: {e}")
+            return False
+        config, errors = compile_config(doc, source)
+        for msg in errors:
+            self.log_message(msg)
+
+        for key, policy in config.alerts.items():
+            if key in self.setting_inputs:
+                ui_inputs = self.setting_inputs[key]
+                for i, tier in enumerate(policy.tiers):
+                    if i < len(ui_inputs):
+                        ui_inputs[i]['diff'].setText(format_number(tier.diff))
+                        ui_inputs[i]['sound'].setText(tier.sound)
+
+        rules = config.compile_alerts()
+        self.audio.preload(p for r in rules.values() for p in r.sounds.values())
+        self.alert_evaluator.set_rules(rules)
+        return True
 
     def closeEvent(self, event):
         if any(t.isRunning() for t in self.threads.values()):
@@ -622,11 +599,17 @@ class GoldMonitorApp(QMainWindow):
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
                 self.stop_monitor()
+                self.alert_evaluator.stop()
+                self.audio.stop()
+                self.close_log_file()
                 event.accept()
             else:
                 event.ignore()
         else:
             self.save_settings()
+            self.alert_evaluator.stop()
+            self.audio.stop()
+            self.close_log_file()
             event.accept()
 
 
@@ -2,233 +2,126 @@ import sys
 import os
 import json
 import time
-import threading
-import re
-import winsound
 import uuid
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
                              QTextEdit, QTabWidget, QGridLayout,
-                             QFileDialog, QMessageBox, QTableWidget,
-                             QTableWidgetItem, QHeaderView, QSplitter,
-                             QListWidget, QStackedWidget, QGroupBox, QTextBrowser,
-                             QCheckBox, QComboBox, QFormLayout, QScrollArea)
-from PyQt6.QtCore import pyqtSignal, QThread, Qt, QTimer, QTime, pyqtSlot
-from PyQt6.QtGui import QFont, QColor
-
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
+                             QFileDialog, QMessageBox, QHeaderView,
+                             QListWidget, QGroupBox, QTextBrowser,
+                             QComboBox, QFormLayout, QScrollArea, QTableView,
+                             QAbstractItemView)
+from PyQt6.QtCore import (pyqtSignal, QThread, Qt, QTimer, QTime, pyqtSlot, QSortFilterProxyModel,
+                          QFileSystemWatcher)
+from PyQt6.QtGui import QFont
+
+from monitor_core import UnifiedMonitor, MonitorPipeline
+from consolidated_book import STATE_NORMAL
+from tick_replay import load_session, replay_session, SPEED_MAX
+from alert_engine import (AlertEvaluator, compile_rules, DEFAULT_HYSTERESIS, DEFAULT_DWELL,
+                          DEFAULT_MAX_ALERTS)
+from alert_rules import RuleEngine
+from audio_engine import AudioEngine
+from log_store import LogFileWriter
+from log_view import LogView
+from notify import NotificationHub, build_sinks
+from tick_feed import FeedServer
+from quote_shm import QuoteTable, DEFAULT_CAPACITY as SHM_CAPACITY
+from web_dashboard import WebDashboard
+from dashboard_model import (BrokerDashboardModel, COL_NAME, COL_SOUND, COLOR_OK, COLOR_ERROR,
+                             COLOR_SUSPECT, SORT_ROLE, SORT_MODES)
+from broker_registry import BrokerRegistry
+from config_schema import (read_document, compile_config, compile_brokers, to_document,
+                           format_number, migrate, SCHEMA_VERSION)
+from spread_chart import SpreadChart, WINDOWS as CHART_WINDOWS, DEFAULT_WINDOW as CHART_DEFAULT_WINDOW
 
 # --- 設定檔名稱 ---
 CONFIG_FILE = "monitor_config_v11_dynamic.json"
+# 設定檔被外部修改後等待多久再讀取 (編輯器可能分多次寫入)
+CONFIG_RELOAD_DELAY_MS = 300
 
-# ==========================================
-#    預設券商設定 (當沒有設定檔時使用)
-#    這裡展示如何將原本硬寫的邏輯轉為參數
-# ==========================================
-DEFAULT_BROKERS = [
-    {
-        "id": "WF", "name": "永豐金業", "url": "https://www.wfbullion.com/",
-        "bid_type": "id", "bid_selector": "pm-llg",
-        "ask_type": "id", "ask_selector": "pm-llg",
-        # 備註: 永豐原本邏輯特殊(同一格換行)，通用爬蟲會嘗試解析，若不行需用更精確的XPATH
-        "note": "自動解析"
-    },
-    {
-        "id": "IG", "name": "IG Markets", "url": "https://www.ig.com/cn/commodities/markets-commodities/gold",
-        "bid_type": "css", "bid_selector": ".price-ticket__button--sell .price-ticket__price",
-        "ask_type": "css", "ask_selector": ".price-ticket__button--buy .price-ticket__price"
-    },
-    {
-        "id": "Oanda", "name": "Oanda", "url": "https://www.oanda.com/bvi-en/cfds/metals/",
-        "bid_type": "xpath", "bid_selector": "//tr[.//span[contains(text(), 'Gold')]]/td[2]",
-        "ask_type": "xpath", "ask_selector": "//tr[.//span[contains(text(), 'Gold')]]/td[3]"
-    }
-]
+# 監控表格每秒重繪次數 (10~30)，tick 只更新資料陣列，由計時器合併重繪
+DASHBOARD_FPS = 20
 
 
 # ==========================================
-#    輔助與邏輯
+#    監控執行緒 (爬蟲與處理流程見 monitor_core.py)
 # ==========================================
 
-def parse_price(text_content):
-    """
-    強大的價格解析函數：從混亂的字串中提取出第一個合理的浮點數
-    """
-    try:
-        if not text_content: return 0.0
-        # 1. 替換掉常見的非數字干擾 (保留小數點)
-        # 先把換行轉成空格，方便正則處理
-        clean_text = str(text_content).replace('\n', ' ').strip()
-
-        # 2. 使用正則表達式尋找數字 (支援 2,000.50 這種格式)
-        # 邏輯: 尋找一段包含數字和小數點的字串
-        match = re.search(r'[\d,]+\.?\d*', clean_text)
-        if match:
-            num_str = match.group(0)
-            # 移除千分位逗號
-            num_str = num_str.replace(',', '')
-            # 處理多個小數點的情況 (防呆)
-            if num_str.count('.') > 1:
-                parts = num_str.split('.')
-                num_str = f"{parts[0]}.{parts[1]}"
-            return float(num_str)
-        return 0.0
-    except:
-        return 0.0
+class UnifiedMonitorThread(QThread):
+    """在 QThread 中執行 monitor_core.UnifiedMonitor，回呼轉成 Qt 訊號"""
+    log_signal = pyqtSignal(str)
+    price_signal = pyqtSignal(str, float, float, str, float)  # (SourceID, Bid, Ask, Time, 時間戳)
+    status_signal = pyqtSignal(str, str)  # (SourceID, Status Msg)
+    finished_signal = pyqtSignal()
 
+    def __init__(self, brokers_config, tuning=None):
+        super().__init__()
+        self.core = UnifiedMonitor(brokers_config, self.log_signal.emit, self.emit_price,
+                                   self.status_signal.emit, tuning=tuning)
 
-class UnifiedMonitorThread(QThread):
+    def emit_price(self, source, bid, ask, time_str):
+        # 抓到報價時就蓋時間戳，GUI 忙碌造成的排隊延遲不影響統計與警報時間
+        self.price_signal.emit(source, bid, ask, time_str, time.time())
+
+    def run(self):
+        try:
+            self.core.run()
+        finally:
+            self.finished_signal.emit()
+
+    def stop(self):
+        self.core.stop()
+
+    def reconfigure(self, brokers):
+        """執行中套用新的券商清單 (只開關 / 重新載入受影響的分頁)"""
+        self.core.reconfigure(brokers)
+
+
+class ReplayMonitorThread(QThread):
+    """
+    Tick 紀錄回放執行緒：以與 UnifiedMonitorThread 相同的訊號介面送出回放資料
+    原始時間戳隨 price_signal 一起送出
+    """
     log_signal = pyqtSignal(str)
-    price_signal = pyqtSignal(str, float, float, str)  # (SourceID, Bid, Ask, Time)
+    price_signal = pyqtSignal(str, float, float, str, float)  # (SourceID, Bid, Ask, Time, 時間戳)
     status_signal = pyqtSignal(str, str)  # (SourceID, Status Msg)
     finished_signal = pyqtSignal()
 
-    def __init__(self, brokers_config):
+    def __init__(self, paths, speed=1.0):
         super().__init__()
         self.running = True
-        self.driver = None
-        self.brokers = brokers_config  # 接收動態的券商列表
-        self.site_handles = {}  # 儲存視窗 Handle
-
-    def setup_driver(self):
-        chrome_options = Options()
-        chrome_options.add_argument("--headless=new")  # 隱藏瀏覽器模式
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--log-level=3")
-        chrome_options.add_argument("--mute-audio")
-        chrome_options.add_argument(
-            "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        self.driver = webdriver.Chrome(options=chrome_options)
+        self.paths = paths
+        self.speed = speed
 
     def run(self):
         try:
-            if not self.brokers:
-                self.log_signal.emit("錯誤: 沒有設定任何券商，無法啟動。")
+            self.log_signal.emit(f"讀取回放紀錄: {len(self.paths)} 個檔案 ...")
+            events = load_session(self.paths)
+            if not events:
+                self.log_signal.emit("回放紀錄沒有任何資料。")
                 return
+            speed_txt = "極速" if self.speed == SPEED_MAX else f"{self.speed:g}x"
+            self.log_signal.emit(f"開始回放 {len(events)} 筆 ({speed_txt})")
 
-            self.log_signal.emit("系統核心啟動中 (Chrome Driver)...")
-            self.setup_driver()
-            wait = WebDriverWait(self.driver, 10)
-
-            # --- 初始化分頁 ---
-            # 開啟第一個網址
-            first_broker = self.brokers[0]
-            self.log_signal.emit(f"初始化主分頁: {first_broker['name']} ...")
-            self.driver.get(first_broker['url'])
-            self.site_handles[first_broker['id']] = self.driver.current_window_handle
-
-            # 開啟其餘分頁
-            for broker in self.brokers[1:]:
-                if not self.running: break
-                self.log_signal.emit(f"開啟背景分頁: {broker['name']} ...")
-                self.driver.execute_script(f"window.open('{broker['url']}', '_blank');")
-                self.driver.switch_to.window(self.driver.window_handles[-1])
-                self.site_handles[broker['id']] = self.driver.current_window_handle
-                time.sleep(1)
-
-            self.log_signal.emit("所有連線建立完成，開始即時監控。")
-
-            # --- 監控迴圈 ---
-            while self.running:
-                for broker in self.brokers:
-                    if not self.running: break
-                    b_id = broker['id']
-
-                    try:
-                        # 切換視窗
-                        if b_id in self.site_handles:
-                            self.driver.switch_to.window(self.site_handles[b_id])
-                            self.scrape_generic(broker, wait)
-                        else:
-                            self.status_signal.emit(b_id, "視窗遺失")
-                    except Exception as e:
-                        # self.log_signal.emit(f"[{broker['name']}] 錯誤: {str(e)}") # Debug用
-                        self.status_signal.emit(b_id, "連線異常")
-
-                    time.sleep(0.2)  # 每個分頁間隔
-
-                # 每一大輪休息
-                for _ in range(10):  # 1秒
-                    if not self.running: break
-                    time.sleep(0.1)
-
+            t0 = time.perf_counter()
+            count = replay_session(events, self.emit_price, self.emit_status, self.speed,
+                                   should_stop=lambda: not self.running)
+            self.log_signal.emit(f"回放結束: {count} 筆，耗時 {time.perf_counter() - t0:.2f} 秒")
         except Exception as e:
-            self.log_signal.emit(f"核心錯誤: {str(e)}")
+            self.log_signal.emit(f"回放錯誤: {str(e)}")
         finally:
-            self.stop_driver()
             self.finished_signal.emit()
 
-    def scrape_generic(self, broker, wait):
-        """
-        通用的爬蟲邏輯：根據設定檔中的 Type 和 Selector 去抓取
-        """
-        now_str = time.strftime("%H:%M:%S")
-        bid, ask = 0.0, 0.0
-
-        try:
-            # 1. 抓取 Bid
-            bid_ele = self.find_element_dynamic(wait, broker['bid_type'], broker['bid_selector'])
-            if bid_ele:
-                # 特殊處理: 如果 Bid 和 Ask 是同一個元素 (例如換行分隔)
-                text = bid_ele.text
-                if broker['bid_selector'] == broker['ask_selector']:
-                    lines = text.strip().split('\n')
-                    # 嘗試解析多行
-                    if len(lines) >= 2:
-                        bid = parse_price(lines[-2] if len(lines) > 1 else lines[0])
-                        ask = parse_price(lines[-1])
-                    else:
-                        bid = parse_price(text)
-                else:
-                    bid = parse_price(text)
-
-            # 2. 抓取 Ask (如果尚未從 Bid 邏輯中取得)
-            if ask == 0.0:
-                ask_ele = self.find_element_dynamic(wait, broker['ask_type'], broker['ask_selector'])
-                if ask_ele:
-                    ask = parse_price(ask_ele.text)
-
-            # 3. 發送訊號
-            if bid > 0 and ask > 0:
-                self.price_signal.emit(broker['id'], bid, ask, now_str)
-                self.status_signal.emit(broker['id'], "監控中")
-            else:
-                self.status_signal.emit(broker['id'], "解析失敗")
-
-        except Exception:
-            self.status_signal.emit(broker['id'], "等待數據")
+    def emit_price(self, source, bid, ask, time_str, ts):
+        self.price_signal.emit(source, bid, ask, time_str, ts)
 
-    def find_element_dynamic(self, wait, method, selector):
-        """根據方法 (ID/CSS/XPATH) 尋找元素"""
-        if not selector: return None
-        by_method = By.ID
-        if method == "css":
-            by_method = By.CSS_SELECTOR
-        elif method == "xpath":
-            by_method = By.XPATH
-
-        try:
-            return wait.until(EC.presence_of_element_located((by_method, selector)))
-        except:
-            return None
+    def emit_status(self, source, msg, ts):
+        self.status_signal.emit(source, msg)
 
     def stop(self):
         self.running = False
 
-    def stop_driver(self):
-        if self.driver:
-            try:
-                self.driver.quit()
-            except:
-                pass
-            self.driver = None
-
 
 # ==========================================
 #   UI 樣式與設計
@@ -238,8 +131,8 @@ QMainWindow, QWidget { background-color: #1e1e1e; color: #e0e0e0; font-family: "
 QTabWidget::pane { border: 1px solid #3c3c3c; background: #2b2b2b; }
 QTabBar::tab { background: #3c3c3c; color: #aaa; padding: 8px 20px; margin-right: 2px; }
 QTabBar::tab:selected { background: #007acc; color: white; font-weight: bold; }
-QTableWidget { background-color: #252526; gridline-color: #3c3c3c; border: none; font-size: 15px; }
-QTableWidget::item { padding: 5px; border-bottom: 1px solid #333; }
+QTableView { background-color: #252526; gridline-color: #3c3c3c; border: none; font-size: 15px; }
+QTableView::item { padding: 5px; border-bottom: 1px solid #333; }
 QHeaderView::section { background-color: #333337; color: #cccccc; padding: 6px; border: none; font-weight: bold; }
 QPushButton { background-color: #0e639c; color: white; border: none; padding: 6px 12px; border-radius: 4px; }
 QPushButton:hover { background-color: #1177bb; }
@@ -252,6 +145,8 @@ QGroupBox::title { subcontrol-origin: margin; left: 10px; padding: 0 3px; color:
 
 class GoldMonitorApp(QMainWindow):
     audio_log_signal = pyqtSignal(str)
+    alert_transition_signal = pyqtSignal(object)  # 警報執行緒 -> UI (只傳狀態轉換)
+    rule_event_signal = pyqtSignal(object)  # 進階規則成立 / 解除
 
     def __init__(self):
         super().__init__()
@@ -260,63 +155,213 @@ class GoldMonitorApp(QMainWindow):
         self.setStyleSheet(DARK_STYLESHEET)
 
         self.monitor_thread = None
+        self.replaying = False  # 目前的 monitor_thread 是否為回放
+        self.last_tick_ts = None
 
-        # 資料結構
+        # 資料結構 (介面編輯中的設定；config 為最近一次載入 / 儲存並驗證過的版本，見 config_schema.py)
+        self.config = None
+        self.config_errors = []
         self.brokers_data = []  # 存放所有券商設定的列表
+        self.broker_specs = ()  # brokers_data 編譯後的 BrokerSpec (表格與爬蟲使用)
+        self.registry = BrokerRegistry()  # b_id -> 列位置 (表格、警報、紀錄共用)
         self.alert_settings = {}  # 存放警報閾值設定
         self.sound_enabled_map = {}  # 存放音效開關
-        self.last_triggered_levels = {}
+        self.alert_rules = []  # 進階規則 (每行一條，語法見 alert_rules.py)
+        self.notify_config = []  # 通知通道設定 (webhook / telegram / smtp / syslog，見 notify.py)
+        # 報價串流 {"address": "tcp:127.0.0.1:7410", "shm": "spread_quotes", "web": "0.0.0.0:8080",
+        # "web_token": "..."}，未設定則不發布 (見 tick_feed.py / quote_shm.py / web_dashboard.py)
+        self.feed_config = {}
+        self.engine_config = {}  # 爬蟲調校 (分頁間隔 / 每輪休息 / 等待元素秒數)
+        # 警報評估執行緒：門檻於設定變更時編譯，每筆 tick 只做二分搜尋
+        # 音效預先載入記憶體，由單一播放執行緒依層級優先播放
+        self.audio = AudioEngine(log=self.audio_log_signal.emit)
+        # 日誌檔由背景執行緒批次寫入 (依日期 / 大小輪替)
+        self.log_writer = LogFileWriter("monitor_log_dynamic")
+        self.log_writer.start()
+        self.alert_evaluator = AlertEvaluator(self.alert_transition_signal.emit, self.audio.play,
+                                              self.rule_event_signal.emit, log=self.audio_log_signal.emit)
+        # 報價處理流程 (統計 / 報價簿 / K 棒 / tick 紀錄 / 警報送出)，與 monitor_daemon.py 共用
+        self.pipeline = MonitorPipeline(self.alert_evaluator, log=self.log_message, name_of=self.broker_name)
+        self.feed = None
+        self.quotes = None
+        self.web = None
 
         # 介面參照
         self.ui_inputs_alert = {}
         self.ui_alert_labels = {}
-        self.ui_sound_checks = {}
+        self.ui_policy_inputs = {}  # b_id -> 回差 / 停留秒數 / 每分鐘上限
+        self.ui_suppressed_labels = {}
 
         self.init_data()  # 載入或初始化資料
         self.init_ui()
+        if self.config.source:
+            self.log_message(f"設定已由舊版格式轉換 ({self.config.source})，儲存後改用新格式")
+        for msg in self.config_errors:
+            self.log_message(f"設定錯誤: {msg}")
+
+        # 通知分送：由警報執行緒直接送出，不經過 UI 也不阻塞評估
+        sinks, errors = build_sinks(self.notify_config)
+        self.notifier = NotificationHub(sinks, log=self.audio_log_signal.emit).start()
+        self.notifier.names = dict(self.registry.items())
+        self.alert_evaluator.notify = self.notifier.publish_alert
+        for msg in errors:
+            self.log_message(msg)
+        if sinks:
+            self.log_message(f"通知通道: {', '.join(s.name for s in sinks)}")
 
         self.clock_timer = QTimer(self)
         self.clock_timer.timeout.connect(self.update_realtime_clock)
         self.clock_timer.start(1000)
 
         self.audio_log_signal.connect(self.log_message)
-
-    def init_data(self):
-        """載入設定檔，若無則使用預設"""
-        if os.path.exists(CONFIG_FILE):
+        self.alert_transition_signal.connect(self.on_alert_transition)
+        self.rule_event_signal.connect(self.on_rule_event)
+
+        # 本機報價串流：供下單機器人等其他程式訂閱，不必各自再開爬蟲
+        feed = self.config.feed
+        if feed.address:
+            self.feed = FeedServer(feed.address, log=self.audio_log_signal.emit)
+            self.feed.names = {b.id: b.name for b in self.broker_specs}
+            self.feed.instruments = {b.id: [i.symbol for i in b.instruments] for b in self.broker_specs}
+            self.feed.start()
+            self.pipeline.feed = self.feed
+        # 共享記憶體最新報價表：同機程式直接讀取，不經過 socket
+        if feed.shm:
             try:
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.brokers_data = data.get("brokers", DEFAULT_BROKERS)
-                    self.alert_settings = data.get("alerts", {})
+                self.quotes = QuoteTable(feed.shm, capacity=max(SHM_CAPACITY, len(self.registry)),
+                                         log=self.log_message).open()
+                self.pipeline.quotes = self.quotes
+                self.log_message(f"共享記憶體報價表: {feed.shm}")
             except Exception as e:
-                print(f"載入失敗: {e}")
-                self.brokers_data = DEFAULT_BROKERS
-        else:
-            self.brokers_data = DEFAULT_BROKERS
+                self.log_message(f"共享記憶體報價表建立失敗: {e}")
+        # 網頁看板：其他電腦 / 手機以瀏覽器觀看，不影響爬蟲
+        if feed.web:
+            self.web = WebDashboard(feed.web, token=feed.web_token,
+                                    log=self.audio_log_signal.emit)
+            self.web.names = dict(self.registry.items())
+            self.web.start()
+            self.pipeline.web = self.web
+
+        self.apply_alert_rules(quiet=True)
+        self.audio.start()
+        self.alert_evaluator.start()
+
+        # 監看設定檔：外部修改 (其他編輯器 / 部署腳本) 時不停止監控，直接套用差異
+        self.config_reload_timer = QTimer(self)
+        self.config_reload_timer.setSingleShot(True)
+        self.config_reload_timer.setInterval(CONFIG_RELOAD_DELAY_MS)
+        self.config_reload_timer.timeout.connect(self.reload_config_file)
+        self.config_watcher = QFileSystemWatcher(self)
+        self.config_watcher.fileChanged.connect(lambda _: self.config_reload_timer.start())
+        self.watch_config_file()
 
-        # 初始化音效開關
-        for b in self.brokers_data:
-            if b['id'] not in self.sound_enabled_map:
-                self.sound_enabled_map[b['id']] = True
+    def init_data(self):
+        """載入設定檔 (舊版設定檔自動轉換)，若無則使用預設"""
+        doc, source = None, None
+        try:
+            doc, source = read_document(CONFIG_FILE)
+        except Exception as e:
+            print(f"載入失敗: {e}")
+        self.config, self.config_errors = compile_config(doc or {}, source)
+        self.load_config_document(to_document(self.config))
+
+        # 初始化音效開關 (每個報價代號一個)
+        for key in self.config.stream_names():
+            if key not in self.sound_enabled_map:
+                self.sound_enabled_map[key] = True
+
+    def load_config_document(self, doc):
+        """驗證過的設定內容 -> 介面編輯用的資料 (數值已正規化)"""
+        self.brokers_data = doc["brokers"]
+        self.alert_settings = doc["alerts"]
+        self.alert_rules = doc["rules"]
+        self.notify_config = doc["notify"]
+        self.feed_config = doc["feed"]
+        self.engine_config = doc["engine"]
 
     def save_to_file(self):
         """儲存所有設定到 JSON"""
         # 1. 從介面更新 Alert 設定到記憶體
         self.update_alert_memory()
 
+        self.alert_rules = self.txt_rules.toPlainText().splitlines()
+
         data = {
+            "version": SCHEMA_VERSION,
             "brokers": self.brokers_data,
-            "alerts": self.alert_settings
+            "alerts": self.alert_settings,
+            "rules": self.alert_rules,
+            "notify": self.notify_config,
+            "feed": self.feed_config,
+            "engine": self.engine_config
         }
+        # 先記下驗證後的內容，監看到自己的寫入時不重複套用
+        self.config, errors = compile_config(data)
+        for msg in errors:
+            self.log_message(f"設定錯誤: {msg}")
         try:
             with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=4)
+            self.watch_config_file()
             self.log_message("設定已儲存 (brokers + alerts)")
             QMessageBox.information(self, "成功", "所有設定已儲存！")
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"儲存失敗: {e}")
 
+    def watch_config_file(self):
+        # 部分編輯器以「寫入新檔再改名」儲存，原本的監看會失效，需重新加入
+        if os.path.exists(CONFIG_FILE) and CONFIG_FILE not in self.config_watcher.files():
+            self.config_watcher.addPath(CONFIG_FILE)
+
+    def reload_config_file(self):
+        """設定檔被外部修改：只套用有變動的部分 (券商 / 警報 / 規則)，監控不中斷"""
+        self.watch_config_file()
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config, errors = compile_config(migrate(json.load(f)))
+        except Exception as e:
+            self.log_message(f"設定檔讀取失敗，保留目前設定: {e}")
+            return
+        # 以驗證後的內容比較：格式 / 數值寫法不同但意義相同的修改不重新套用
+        old, self.config = self.config, config
+        if config._replace(source=None) == old._replace(source=None): return
+        self.log_message("偵測到設定檔變更，套用中...")
+        for msg in errors:
+            self.log_message(f"設定錯誤: {msg}")
+
+        doc = to_document(config)
+        if config.brokers != old.brokers or config.alerts != old.alerts:
+            self.brokers_data = doc["brokers"]
+            self.alert_settings = doc["alerts"]
+            self.refresh_manager_list()
+            self.apply_broker_changes()
+        if config.rule_lines != old.rule_lines:
+            self.txt_rules.setPlainText("\n".join(config.rule_lines))
+            self.apply_alert_rules()
+        if config.notify != old.notify or config.feed != old.feed or config.engine != old.engine:
+            self.notify_config = doc["notify"]
+            self.feed_config = doc["feed"]
+            self.engine_config = doc["engine"]
+            self.log_message("通知通道 / 報價串流 / 爬蟲調校設定需重新啟動才會生效")
+
+    def apply_broker_changes(self):
+        """券商清單變更後同步表格、警報設定、處理流程與執行中的爬蟲 (未變動的分頁持續監控)"""
+        keys = {inst.key for b in compile_brokers(self.brokers_data) for inst in b.instruments}
+        now = self.current_time()
+        for key in self.registry.ids:
+            if key not in keys: self.pipeline.forget(key, now)
+        self.rebuild_monitor_table()
+        self.rebuild_settings_ui()  # 重新編譯門檻後整組替換給評估執行緒
+
+        names = dict(self.registry.items())
+        self.notifier.names = names
+        if self.web: self.web.names = dict(names)
+        if self.feed:
+            self.feed.names = {b.id: b.name for b in self.broker_specs}
+            self.feed.instruments = {b.id: [i.symbol for i in b.instruments] for b in self.broker_specs}
+        if self.monitor_thread and not self.replaying:
+            self.monitor_thread.reconfigure(self.broker_specs)
+
     def update_alert_memory(self):
         """將警報設定頁面的數值寫回 self.alert_settings"""
         for b_id, inputs in self.ui_inputs_alert.items():
@@ -327,16 +372,22 @@ class GoldMonitorApp(QMainWindow):
                     "sound": item['sound'].text()
                 })
 
-            # 取得音效開關狀態
-            is_sound_on = True
-            if b_id in self.ui_sound_checks:
-                is_sound_on = self.ui_sound_checks[b_id].isChecked()
-                self.sound_enabled_map[b_id] = is_sound_on
+            # 取得音效開關狀態 (表格勾選框)
+            is_sound_on = self.sound_enabled_map.get(b_id, True)
 
             self.alert_settings[b_id] = {
                 "tiers": tiers,
                 "sound_enabled": is_sound_on
             }
+            for field, txt in self.ui_policy_inputs.get(b_id, {}).items():
+                self.alert_settings[b_id][field] = txt.text()
+
+    def recompile_alerts(self):
+        """警報設定變更時重新編譯門檻並整組替換給評估執行緒"""
+        self.update_alert_memory()
+        rules = compile_rules(self.alert_settings)
+        self.audio.preload(p for r in rules.values() for p in r.sounds.values())
+        self.alert_evaluator.set_rules(rules)
 
     def init_ui(self):
         main_widget = QWidget()
@@ -360,6 +411,15 @@ class GoldMonitorApp(QMainWindow):
 
         top_bar.addWidget(self.btn_start)
         top_bar.addWidget(self.btn_stop)
+
+        # 回放紀錄 (調整警報門檻/效能測試用)
+        self.cmb_replay_speed = QComboBox()
+        self.cmb_replay_speed.addItems(["1x", "10x", "100x", "極速"])
+        self.btn_replay = QPushButton(" ⏩ 回放紀錄")
+        self.btn_replay.setStyleSheet("font-size: 14px; padding: 8px;")
+        self.btn_replay.clicked.connect(self.start_replay)
+        top_bar.addWidget(self.cmb_replay_speed)
+        top_bar.addWidget(self.btn_replay)
         top_bar.addStretch()
         top_bar.addWidget(QLabel("系統時間:"))
         top_bar.addWidget(self.lbl_clock)
@@ -374,6 +434,11 @@ class GoldMonitorApp(QMainWindow):
         self.setup_monitor_tab()
         self.tabs.addTab(self.tab_monitor, "即時行情")
 
+        # Tab 1b: Chart
+        self.tab_chart = QWidget()
+        self.setup_chart_tab()
+        self.tabs.addTab(self.tab_chart, "即時圖表")
+
         # Tab 2: Alert Settings
         self.tab_settings = QWidget()
         self.setup_settings_tab()
@@ -394,69 +459,118 @@ class GoldMonitorApp(QMainWindow):
     # ---------------------------
     def setup_monitor_tab(self):
         layout = QVBoxLayout(self.tab_monitor)
-        self.table = QTableWidget()
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels(
-            ["券商 (Broker)", "Bid (賣出)", "Ask (買入)", "點差 (Spread)", "最後更新", "狀態", "音效"])
+
+        # 跨券商最佳報價 (BBO) 與交叉狀態
+        self.lbl_bbo = QLabel("最佳 Bid: -- | 最佳 Ask: -- | 狀態: --")
+        self.lbl_bbo.setFont(QFont("Consolas", 12, QFont.Weight.Bold))
+        self.lbl_bbo.setStyleSheet("color: #dcdcaa; padding: 4px;")
+        layout.addWidget(self.lbl_bbo)
+        # Model/View：tick 只寫入 model 的陣列，每幀合併一次 dataChanged
+        self.table_model = BrokerDashboardModel(self, DASHBOARD_FPS)
+        self.table_model.sound_toggled.connect(self.toggle_sound_state)
+        self.table_model.timer.timeout.connect(self.flush_bbo_label)
+        self.bbo_dirty = False
+        # 排序 proxy：dynamicSortFilter 在每幀 dataChanged 時只重新排序有變動的列
+        self.table_proxy = QSortFilterProxyModel(self)
+        self.table_proxy.setSourceModel(self.table_model)
+        self.table_proxy.setSortRole(SORT_ROLE)
+        self.table_proxy.setDynamicSortFilter(True)
+        self.table = QTableView()
+        self.table.setModel(self.table_proxy)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(COL_NAME, Qt.SortOrder.AscendingOrder)
+
+        sort_bar = QHBoxLayout()
+        sort_bar.addWidget(QLabel("排序:"))
+        self.cmb_sort = QComboBox()
+        self.cmb_sort.addItems([m[0] for m in SORT_MODES])
+        self.cmb_sort.currentIndexChanged.connect(self.apply_sort_mode)
+        sort_bar.addWidget(self.cmb_sort)
+        sort_bar.addStretch()
+        layout.addLayout(sort_bar)
 
         header = self.table.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
-        header.setSectionResizeMode(6, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(COL_NAME, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(COL_SOUND, QHeaderView.ResizeMode.ResizeToContents)
 
         self.table.verticalHeader().setVisible(False)
-        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
 
         layout.addWidget(self.table)
         self.rebuild_monitor_table()  # 根據資料建立表格
 
+    # ---------------------------
+    #    Tab 1b: 即時圖表
+    # ---------------------------
+    def setup_chart_tab(self):
+        layout = QVBoxLayout(self.tab_chart)
+        bar = QHBoxLayout()
+        bar.addWidget(QLabel("時間窗:"))
+        self.cmb_chart_window = QComboBox()
+        self.cmb_chart_window.addItems([w[0] for w in CHART_WINDOWS])
+        self.cmb_chart_window.setCurrentIndex([w[1] for w in CHART_WINDOWS].index(CHART_DEFAULT_WINDOW))
+        self.cmb_chart_window.currentIndexChanged.connect(
+            lambda i: self.chart.set_window(CHART_WINDOWS[i][1]))
+        bar.addWidget(self.cmb_chart_window)
+        # 不同商品的價格尺度不同，圖表一次只畫一個商品
+        self.lbl_chart_instrument = QLabel("商品:")
+        self.cmb_chart_instrument = QComboBox()
+        self.cmb_chart_instrument.currentTextChanged.connect(
+            lambda symbol: self.chart.set_instrument(symbol) if symbol else None)
+        bar.addWidget(self.lbl_chart_instrument)
+        bar.addWidget(self.cmb_chart_instrument)
+        bar.addStretch()
+        layout.addLayout(bar)
+        # tick 只寫入環形緩衝區，繪圖由圖表自己的計時器每幀抽樣一次
+        self.chart = SpreadChart(self)
+        self.chart.set_brokers(self.registry.items())
+        self.refresh_chart_instruments()
+        layout.addWidget(self.chart)
+
+    def refresh_chart_instruments(self):
+        """商品選單跟著券商清單更新；只有一種商品時隱藏"""
+        symbols = self.chart.instruments()
+        self.cmb_chart_instrument.blockSignals(True)
+        self.cmb_chart_instrument.clear()
+        self.cmb_chart_instrument.addItems(symbols)
+        if self.chart.instrument in symbols:
+            self.cmb_chart_instrument.setCurrentIndex(symbols.index(self.chart.instrument))
+        self.cmb_chart_instrument.blockSignals(False)
+        self.lbl_chart_instrument.setVisible(len(symbols) > 1)
+        self.cmb_chart_instrument.setVisible(len(symbols) > 1)
+
     def rebuild_monitor_table(self):
-        """根據 brokers_data 重建表格列"""
-        self.table.setRowCount(0)
-        self.table.setRowCount(len(self.brokers_data))
-        self.ui_sound_checks = {}  # 清空重置
-
-        font_price = QFont("Arial", 14)
-        font_spread = QFont("Arial", 16, QFont.Weight.Bold)
-
-        for row, broker in enumerate(self.brokers_data):
-            b_id = broker['id']
-            # Name
-            item_name = QTableWidgetItem(broker['name'])
-            item_name.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            item_name.setFont(QFont("Microsoft JhengHei", 11, QFont.Weight.Bold))
-            self.table.setItem(row, 0, item_name)
-
-            # Bid/Ask/Spread/Time/Status
-            for col in range(1, 6):
-                item = QTableWidgetItem("--")
-                item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                if col in [1, 2]:
-                    item.setFont(font_price)
-                    item.setForeground(QColor("#4ec9b0")) if col == 1 else item.setForeground(QColor("#f44747"))
-                if col == 3:
-                    item.setFont(font_spread)
-                    item.setForeground(QColor("#dcdcaa"))
-                self.table.setItem(row, col, item)
-
-            # Sound Checkbox
-            container = QWidget()
-            chk_layout = QHBoxLayout(container)
-            chk_layout.setContentsMargins(0, 0, 0, 0)
-            chk_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            chk = QCheckBox()
-
-            # 從 alert_settings 恢復狀態，若無則預設 True
-            is_checked = self.alert_settings.get(b_id, {}).get("sound_enabled", True)
-            chk.setChecked(is_checked)
-
-            chk.toggled.connect(lambda checked, bid=b_id: self.toggle_sound_state(bid, checked))
-            chk_layout.addWidget(chk)
-            self.table.setCellWidget(row, 6, container)
-            self.ui_sound_checks[b_id] = chk
+        """根據 brokers_data 重建表格列 (每個券商的每個商品一列)"""
+        self.broker_specs = compile_brokers(self.brokers_data)
+        self.registry.set_brokers(self.broker_specs)
+        # 從 alert_settings 恢復音效開關，若無則預設 True
+        for key in self.registry.ids:
+            self.sound_enabled_map[key] = self.alert_settings.get(key, {}).get("sound_enabled", True)
+        self.table_model.set_brokers(self.registry.items(), self.sound_enabled_map)
+        if hasattr(self, "chart"):
+            self.chart.set_brokers(self.registry.items())
+            self.refresh_chart_instruments()
+        if hasattr(self, "log_view"): self.log_view.set_brokers(self.registry.names)
+
+    def apply_sort_mode(self, index):
+        _, col, order = SORT_MODES[index]
+        self.table.sortByColumn(col, order)
+
+    def apply_alert_rules(self, quiet=False):
+        """解析進階規則並替換評估執行緒中的規則引擎 (規則狀態重新累積)"""
+        self.alert_rules = self.txt_rules.toPlainText().splitlines()
+        engine, errors = RuleEngine.from_text(self.alert_rules)
+        for no, msg in errors:
+            self.log_message(f"規則第 {no} 行: {msg}")
+        self.audio.preload(spec.sound for spec in engine.specs)
+        self.alert_evaluator.set_rule_engine(engine if len(engine) else None)
+        if not quiet:
+            self.log_message(f"已套用 {len(engine)} 條進階規則")
 
     def toggle_sound_state(self, b_id, checked):
         self.sound_enabled_map[b_id] = checked
+        self.recompile_alerts()
 
     # ---------------------------
     #    Tab 2: 警報設定
@@ -473,6 +587,24 @@ class GoldMonitorApp(QMainWindow):
 
         layout.addWidget(scroll)
 
+        # 進階規則 (持續時間 / 相對中位數 / 中價變動 / 跨券商)
+        grp_rules = QGroupBox("進階規則 (每行一條)")
+        rules_layout = QVBoxLayout(grp_rules)
+        self.txt_rules = QTextEdit()
+        self.txt_rules.setAcceptRichText(False)
+        self.txt_rules.setFixedHeight(110)
+        self.txt_rules.setPlaceholderText("spread(WF) > 0.5 for 10s\n"
+                                          "spread(*) > 2x median(1h)\n"
+                                          "move(WF) > 1.0 in 30s\n"
+                                          "bid(WF) > ask(IG) sound=C:/alert.wav")
+        self.txt_rules.setPlainText("\n".join(self.alert_rules))
+        btn_apply_rules = QPushButton("套用規則")
+        btn_apply_rules.setFixedWidth(100)
+        btn_apply_rules.clicked.connect(lambda: self.apply_alert_rules())
+        rules_layout.addWidget(self.txt_rules)
+        rules_layout.addWidget(btn_apply_rules, alignment=Qt.AlignmentFlag.AlignRight)
+        layout.addWidget(grp_rules)
+
         btn_save = QPushButton("💾 儲存所有設定")
         btn_save.setFixedSize(200, 45)
         btn_save.clicked.connect(self.save_to_file)
@@ -493,10 +625,14 @@ class GoldMonitorApp(QMainWindow):
 
         self.ui_inputs_alert = {}
         self.ui_alert_labels = {}
-
-        for broker in self.brokers_data:
-            b_id = broker['id']
-            group = QGroupBox(f"{broker['name']} ({broker['url'][:30]}...)")
+        self.ui_policy_inputs = {}
+        self.ui_suppressed_labels = {}
+
+        # 每個 (券商, 商品) 一組門檻，以報價代號為鍵
+        streams = [(inst, broker.url) for broker in self.broker_specs for inst in broker.instruments]
+        for inst, url in streams:
+            b_id = inst.key
+            group = QGroupBox(f"{inst.name} ({url[:30]}...)")
             grid = QGridLayout(group)
 
             grid.addWidget(QLabel("層級"), 0, 0)
@@ -521,8 +657,8 @@ class GoldMonitorApp(QMainWindow):
 
                 # 填入舊值
                 if i < len(saved_tiers):
-                    txt_diff.setText(saved_tiers[i].get("diff", ""))
-                    txt_sound.setText(saved_tiers[i].get("sound", ""))
+                    txt_diff.setText(format_number(saved_tiers[i].get("diff")))
+                    txt_sound.setText(saved_tiers[i].get("sound") or "")
 
                 btn_browse = QPushButton("選取")
                 btn_browse.setFixedSize(50, 25)
@@ -538,11 +674,35 @@ class GoldMonitorApp(QMainWindow):
                 grid.addWidget(btn_browse, i + 1, 3)
                 grid.addWidget(lbl_status, i + 1, 4)
 
+                # 填完舊值才連接，避免重建時逐欄重新編譯
+                txt_diff.textChanged.connect(self.recompile_alerts)
+                txt_sound.textChanged.connect(self.recompile_alerts)
                 self.ui_inputs_alert[b_id].append({"diff": txt_diff, "sound": txt_sound})
 
+            # 防抖動：回差 / 最短停留 / 每分鐘警報上限
+            saved = self.alert_settings.get(b_id, {})
+            policy_layout = QHBoxLayout()
+            self.ui_policy_inputs[b_id] = {}
+            for field, label, default in (("hysteresis", "回差", DEFAULT_HYSTERESIS),
+                                          ("dwell", "停留秒數", DEFAULT_DWELL),
+                                          ("max_alerts", "每分鐘上限", DEFAULT_MAX_ALERTS)):
+                txt = QLineEdit(format_number(saved.get(field, default)))
+                txt.setFixedWidth(60)
+                txt.textChanged.connect(self.recompile_alerts)
+                policy_layout.addWidget(QLabel(label))
+                policy_layout.addWidget(txt)
+                self.ui_policy_inputs[b_id][field] = txt
+            policy_layout.addStretch()
+            lbl_suppressed = QLabel("已過濾: 0")
+            lbl_suppressed.setStyleSheet("color: gray")
+            policy_layout.addWidget(lbl_suppressed)
+            self.ui_suppressed_labels[b_id] = lbl_suppressed
+            grid.addLayout(policy_layout, 4, 0, 1, 5)
+
             self.settings_form_layout.addWidget(group)
 
         self.settings_form_layout.addStretch()
+        self.recompile_alerts()
 
     def browse_audio_file(self, line_edit):
         f, _ = QFileDialog.getOpenFileName(self, "選取音效", "", "Audio (*.wav)")
@@ -679,9 +839,8 @@ class GoldMonitorApp(QMainWindow):
         # 3. 儲存檔案
         self.save_to_file()
 
-        # 4. 觸發介面重建 (重要)
-        self.rebuild_monitor_table()
-        self.rebuild_settings_ui()
+        # 4. 觸發介面重建 (重要)；監控中則同步到爬蟲
+        self.apply_broker_changes()
         self.log_message(f"券商 [{target['name']}] 資料已更新。")
 
     def delete_current_broker(self):
@@ -693,11 +852,16 @@ class GoldMonitorApp(QMainWindow):
                                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
 
         if ret == QMessageBox.StandardButton.Yes:
+            # 刪除的券商 (所有商品) 的警報設定一併移除；設定頁面還沒重建，不能讓儲存時寫回
+            for b in compile_brokers([self.brokers_data[row]]):
+                for inst in b.instruments:
+                    self.alert_settings.pop(inst.key, None)
+                    self.ui_inputs_alert.pop(inst.key, None)
+                    self.ui_policy_inputs.pop(inst.key, None)
             del self.brokers_data[row]
             self.refresh_manager_list()
             self.save_to_file()
-            self.rebuild_monitor_table()
-            self.rebuild_settings_ui()
+            self.apply_broker_changes()
 
             # 清空編輯區
             self.txt_edit_name.clear()
@@ -708,24 +872,67 @@ class GoldMonitorApp(QMainWindow):
     # ---------------------------
     def setup_log_tab(self):
         layout = QVBoxLayout(self.tab_log)
-        self.txt_log = QTextEdit()
-        self.txt_log.setReadOnly(True)
-        self.txt_log.setStyleSheet("background-color: #1e1e1e; color: #ccc; font-family: Consolas;")
-        layout.addWidget(self.txt_log)
-        btn_clear = QPushButton("清除日誌")
-        btn_clear.clicked.connect(self.txt_log.clear)
-        layout.addWidget(btn_clear)
+        # 固定筆數的環形緩衝區 + 虛擬化清單，可依層級 / 券商篩選
+        self.log_view = LogView()
+        self.log_view.set_brokers(self.registry.names)
+        layout.addWidget(self.log_view)
 
     # ---------------------------
     #    核心功能
     # ---------------------------
     def update_realtime_clock(self):
         self.lbl_clock.setText(QTime.currentTime().toString("HH:mm:ss"))
+        # 過期報價 / K 棒收棒 / tick 紀錄落地
+        self.pipeline.housekeeping(self.current_time())
+        self.refresh_bbo_label()
+        self.refresh_suppressed_labels()
+
+    def refresh_suppressed_labels(self):
+        for b_id, count in self.alert_evaluator.suppressed_counts().items():
+            lbl = self.ui_suppressed_labels.get(b_id)
+            if lbl: lbl.setText(f"已過濾: {count}")
+
+    def current_time(self):
+        if self.replaying and self.last_tick_ts is not None:
+            return self.last_tick_ts
+        return time.time()
+
+    def reset_pipeline(self, replay=False):
+        """重置統計/報價簿/K 棒；回放時 K 棒不落地，避免和實盤紀錄混在一起"""
+        self.pipeline.reset(replay)
+        self.apply_alert_rules(quiet=True)  # 規則狀態 (持續時間/中位數) 重新累積
+        self.chart.clear()
+        self.last_tick_ts = None
+
+    def broker_name(self, b_id):
+        return self.registry.name(b_id)
+
+    def flush_bbo_label(self):
+        # 與表格同一幀更新，避免每筆 tick 都重設標籤
+        if self.bbo_dirty:
+            self.bbo_dirty = False
+            self.refresh_bbo_label()
+
+    def refresh_bbo_label(self):
+        book = self.pipeline.book
+        best_bid, bid_key, best_ask, ask_key = book.best()
+        if bid_key is None:
+            self.lbl_bbo.setText("最佳 Bid: -- | 最佳 Ask: -- | 狀態: --")
+            self.lbl_bbo.setStyleSheet("color: #dcdcaa; padding: 4px;")
+            return
+        text = (f"最佳 Bid: {best_bid:.2f} ({self.broker_name(bid_key)}) | "
+                f"最佳 Ask: {best_ask:.2f} ({self.broker_name(ask_key)}) | 狀態: {book.state}")
+        if book.state != STATE_NORMAL:
+            text += f" {book.state_duration(self.current_time()):.1f}s"
+            self.lbl_bbo.setStyleSheet("color: #ff3333; padding: 4px;")
+        else:
+            self.lbl_bbo.setStyleSheet("color: #dcdcaa; padding: 4px;")
+        self.lbl_bbo.setText(text)
 
     @pyqtSlot(str)
     def log_message(self, msg):
-        ts = time.strftime("%H:%M:%S")
-        self.txt_log.append(f"[{ts}] {msg}")
+        rec = self.log_view.add(msg)
+        self.log_writer.write(f"[{rec.time_str}] {msg}")
 
     def start_monitor(self):
         if not self.brokers_data:
@@ -733,18 +940,47 @@ class GoldMonitorApp(QMainWindow):
             return
 
         self.btn_start.setEnabled(False)
+        self.btn_replay.setEnabled(False)
         self.btn_stop.setEnabled(True)
-        self.grp_edit.setEnabled(False)  # 鎖定編輯功能
+        # 執行中仍可編輯券商：儲存後只開關 / 重新載入受影響的分頁 (見 apply_broker_changes)
 
         self.log_message(">>> 監控系統啟動")
+        self.reset_pipeline()  # 新的監控時段重新累積統計
+        self.replaying = False
 
         # 將設定傳入 Thread
-        self.monitor_thread = UnifiedMonitorThread(self.brokers_data)
+        self.monitor_thread = UnifiedMonitorThread(self.broker_specs, self.config.engine)
+        self.connect_monitor_thread()
+        self.monitor_thread.start()
+
+    def start_replay(self):
+        if self.monitor_thread:
+            QMessageBox.warning(self, "警告", "請先停止目前的監控再回放。")
+            return
+        paths, _ = QFileDialog.getOpenFileNames(self, "選取 tick 紀錄", "ticks", "Tick CSV (*.csv)")
+        if not paths: return
+
+        speed_map = {"1x": 1.0, "10x": 10.0, "100x": 100.0, "極速": SPEED_MAX}
+        speed = speed_map.get(self.cmb_replay_speed.currentText(), 1.0)
+
+        self.btn_start.setEnabled(False)
+        self.btn_replay.setEnabled(False)
+        self.btn_stop.setEnabled(True)
+        self.grp_edit.setEnabled(False)
+
+        self.log_message(">>> 回放模式啟動")
+        self.reset_pipeline(replay=True)
+        self.replaying = True
+
+        self.monitor_thread = ReplayMonitorThread(paths, speed)
+        self.connect_monitor_thread()
+        self.monitor_thread.start()
+
+    def connect_monitor_thread(self):
         self.monitor_thread.log_signal.connect(self.log_message)
         self.monitor_thread.price_signal.connect(self.on_price_update)
         self.monitor_thread.status_signal.connect(self.on_status_update)
         self.monitor_thread.finished_signal.connect(self.on_thread_finished)
-        self.monitor_thread.start()
 
     def stop_monitor(self):
         self.log_message("正在停止所有程序...")
@@ -752,87 +988,63 @@ class GoldMonitorApp(QMainWindow):
         if self.monitor_thread:
             self.monitor_thread.stop()
 
-    def on_price_update(self, b_id, bid, ask, time_str):
-        # 尋找這個 ID 在 Table 中的 Row
-        row = -1
-        for i, b in enumerate(self.brokers_data):
-            if b['id'] == b_id:
-                row = i
-                break
-        if row == -1: return
+    def on_price_update(self, b_id, bid, ask, time_str, ts):
+        # ts 隨訊號送達：即時模式為抓取時間，回放時為紀錄中的原始時間
+        self.last_tick_ts = ts
 
-        spread = abs(ask - bid)
-        self.table.item(row, 1).setText(f"{bid:.2f}")
-        self.table.item(row, 2).setText(f"{ask:.2f}")
-        self.table.item(row, 3).setText(f"{spread:.2f}")
-        self.table.item(row, 4).setText(time_str)
-        self.table.item(row, 5).setText("監控中")
-        self.table.item(row, 5).setForeground(QColor("#4ec9b0"))
+        # 由索引取得這個 ID 在 model 中的列 (O(1))
+        row = self.registry.slot(b_id)
+        if row == -1: return
+        self.table_model.update_quote(row, bid, ask, time_str, ts)
+        self.chart.append(b_id, ts, bid, ask)
 
-        self.check_alert(b_id, spread, row)
+        # 可疑報價 (偏離共識/凍結) 不進入統計、報價簿與警報
+        result = self.pipeline.on_tick(b_id, bid, ask, ts)
+        if result.suspect:
+            self.table_model.set_status(row, f"可疑: {result.suspect}", COLOR_SUSPECT)
+        else:
+            self.table_model.update_stats(row, result.stats.vs_median('1h'), result.stats.rank('1h'))
+            self.table_model.set_status(row, "監控中", COLOR_OK)
+        self.bbo_dirty = True
 
     def on_status_update(self, b_id, msg):
-        row = -1
-        for i, b in enumerate(self.brokers_data):
-            if b['id'] == b_id:
-                row = i
-                break
-        if row != -1:
-            item = self.table.item(row, 5)
-            item.setText(msg)
-            item.setForeground(QColor("#f44747") if msg != "監控中" else QColor("#4ec9b0"))
-
-    def check_alert(self, b_id, spread, row_idx):
-        # 檢查閾值
-        inputs = self.ui_inputs_alert.get(b_id, [])
-        highest_lvl = -1
-        sound_path = None
-
-        for i, item in enumerate(inputs):
-            try:
-                val = item['diff'].text()
-                thresh = float(val) if val else 999.0
-            except:
-                thresh = 999.0
-
-            lbl = self.ui_alert_labels.get((b_id, i))
-            if lbl:
-                if spread >= thresh and thresh > 0:
-                    lbl.setText("● 觸發")
-                    lbl.setStyleSheet("color: #ff3333; font-weight: bold;")
-                    highest_lvl = i
-                    sound_path = item['sound'].text()
-                else:
-                    lbl.setText("● 待機")
-                    lbl.setStyleSheet("color: gray;")
+        self.pipeline.on_status(b_id, msg)
+        row = self.registry.slot(b_id)
+        # 可疑報價期間保留可疑標示，不被一般的「監控中」覆蓋
+        if row != -1 and not (msg == "監控中" and b_id in self.pipeline.suspect_brokers):
+            self.table_model.set_status(row, msg, COLOR_ERROR if msg != "監控中" else COLOR_OK)
+
+    def on_alert_transition(self, tr):
+        self.pipeline.on_transition(tr)
+        for i in range(3):
+            lbl = self.ui_alert_labels.get((tr.b_id, i))
+            if not lbl: continue
+            if i in tr.tiers:
+                lbl.setText("● 觸發")
+                lbl.setStyleSheet("color: #ff3333; font-weight: bold;")
+            else:
+                lbl.setText("● 待機")
+                lbl.setStyleSheet("color: gray;")
 
         # 更新表格視覺
-        item_spread = self.table.item(row_idx, 3)
-        if highest_lvl >= 0:
-            item_spread.setBackground(QColor("#660000"))
-        else:
-            item_spread.setBackground(QColor("#252526"))
-
-        # 播放音效
-        last = self.last_triggered_levels.get(b_id, -1)
-        is_sound_on = self.sound_enabled_map.get(b_id, True)
-
-        if highest_lvl > last:
-            self.log_message(f"[{self.brokers_data[row_idx]['name']}] 警報觸發! 點差: {spread:.2f}")
-            if sound_path and os.path.exists(sound_path) and is_sound_on:
-                threading.Thread(target=self.play_sound, args=(sound_path,), daemon=True).start()
+        row = self.registry.slot(tr.b_id)
+        if row != -1:
+            self.table_model.set_alert(row, tr.level >= 0)
 
-        self.last_triggered_levels[b_id] = highest_lvl
+        if tr.fired:
+            self.log_message(f"[{self.broker_name(tr.b_id)}] 警報觸發! 點差: {tr.spread:.2f}")
 
-    def play_sound(self, path):
-        try:
-            winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_NODEFAULT)
-        except:
-            pass
+    def on_rule_event(self, ev):
+        self.pipeline.on_rule_event(ev)
+        state = "成立" if ev.active else "解除"
+        self.log_message(f"[{self.broker_name(ev.b_id)}] 規則{state}: {ev.rule} (數值 {ev.value:.2f})")
 
     def on_thread_finished(self):
         self.log_message(">>> 監控已停止")
+        self.pipeline.close()
+        self.replaying = False
         self.btn_start.setEnabled(True)
+        self.btn_replay.setEnabled(True)
         self.btn_stop.setEnabled(False)
         self.grp_edit.setEnabled(True)  # 解鎖編輯
         self.monitor_thread = None
@@ -843,10 +1055,24 @@ class GoldMonitorApp(QMainWindow):
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
                 self.stop_monitor()
+                self.alert_evaluator.stop()
+                self.audio.stop()
+                self.notifier.stop()
+                if self.feed: self.feed.stop()
+                if self.quotes: self.quotes.close()
+                if self.web: self.web.stop()
+                self.log_writer.stop()
                 event.accept()
             else:
                 event.ignore()
         else:
+            self.alert_evaluator.stop()
+            self.audio.stop()
+            self.notifier.stop()
+            if self.feed: self.feed.stop()
+            if self.quotes: self.quotes.close()
+            if self.web: self.web.stop()
+            self.log_writer.stop()
             event.accept()
 
 
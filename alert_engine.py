@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+點差警報規則引擎 (獨立執行緒)
+1. 設定變更時把各券商的層級門檻「編譯」成排序好的陣列 (不可變物件，整組原子替換)
+2. 每筆 tick 只做一次二分搜尋找出觸發層級，不再讀取 QLineEdit 文字
+3. 評估在專用執行緒進行，只有「狀態轉換」才回呼 UI；音效直接由評估執行緒觸發，
+   UI 忙碌時也不會延遲警報
+4. 進階規則 (持續時間、相對中位數、中價變動、跨券商，見 alert_rules.py) 在同一執行緒增量評估
+5. 防抖動：回差 (hysteresis)、最短停留時間 (dwell)、每券商警報頻率上限；
+   被過濾掉的警報數 (相較於原本「每次跨越門檻就觸發」) 記在 suppressed_counts()
+"""
+
+import os
+import time
+import queue
+import bisect
+import threading
+from collections import namedtuple, deque, defaultdict
+
+# 防抖動預設值 (可於各券商設定覆寫)；全部預設關閉，舊版程式與轉換後的設定行為與原本相同
+DEFAULT_HYSTERESIS = 0.0     # 點差需跌破「門檻 - 回差」才解除該層級 (價格單位，需小於最低門檻)
+DEFAULT_DWELL = 0.0          # 層級變化需維持的秒數才生效 (觸發與重新武裝皆適用)；0 = 立即生效
+                             # 停留需等到同券商下一筆 tick 才確認，爬蟲每輪 1~3 秒，預設不啟用
+DEFAULT_MAX_ALERTS = 0       # 每券商在 rate_window 秒內最多觸發次數 (0 = 不限)
+DEFAULT_RATE_WINDOW = 60.0
+
+# 評估結果 (只在狀態轉換時產生)
+# level: 最高觸發層級 (-1 代表未觸發)；tiers: 目前觸發的層級索引；fired: 是否為「升級」觸發
+# threshold: level 對應的門檻；suppressed: 升級但被頻率上限擋下
+AlertTransition = namedtuple("AlertTransition", ["b_id", "level", "prev_level", "tiers", "spread", "ts",
+                                                 "fired", "sound_path", "sound_enabled", "threshold",
+                                                 "suppressed"])
+
+
+def _number(value, default):
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+class BrokerAlertRule:
+    """單一券商編譯後的門檻 (不可變)"""
+    __slots__ = ("thresholds", "levels", "top_level", "sounds", "sound_enabled", "level_thresholds",
+                 "hysteresis", "dwell", "max_alerts", "rate_window")
+
+    def __init__(self, tiers, sound_enabled=True, hysteresis=DEFAULT_HYSTERESIS, dwell=DEFAULT_DWELL,
+                 max_alerts=DEFAULT_MAX_ALERTS, rate_window=DEFAULT_RATE_WINDOW):
+        valid = []
+        for i, t in enumerate(tiers):
+            try:
+                thresh = float(str(t.get("diff", "")).strip())
+            except ValueError:
+                continue
+            if thresh > 0:
+                valid.append((thresh, i, str(t.get("sound", "")).strip()))
+        valid.sort()
+
+        self.thresholds = tuple(v[0] for v in valid)   # 遞增門檻
+        self.levels = tuple(v[1] for v in valid)       # 對應的原始層級索引
+        # top_level[k] = 前 k+1 個門檻中最高的原始層級 (門檻與層級順序不一致時仍正確)
+        top, best = [], -1
+        for lvl in self.levels:
+            best = max(best, lvl)
+            top.append(best)
+        self.top_level = tuple(top)
+        self.sounds = {v[1]: v[2] for v in valid}
+        self.level_thresholds = {v[1]: v[0] for v in valid}
+        self.sound_enabled = sound_enabled
+        self.hysteresis = max(_number(hysteresis, DEFAULT_HYSTERESIS), 0.0)
+        # 回差不超過最低門檻的一半，否則門檻小於回差的層級 (例如白銀) 永遠無法解除
+        if self.thresholds:
+            self.hysteresis = min(self.hysteresis, self.thresholds[0] / 2.0)
+        self.dwell = max(_number(dwell, DEFAULT_DWELL), 0.0)
+        self.max_alerts = int(max(_number(max_alerts, DEFAULT_MAX_ALERTS), 0))
+        self.rate_window = max(_number(rate_window, DEFAULT_RATE_WINDOW), 1.0)
+
+    def evaluate(self, spread, current=None):
+        """
+        回傳觸發的門檻數量 (狀態)，O(log n)
+        current 為目前狀態：往下時需跌破 (門檻 - 回差) 才解除
+        """
+        up = bisect.bisect_right(self.thresholds, spread)
+        if current is None or up >= current or self.hysteresis <= 0:
+            return up
+        return min(current, bisect.bisect_right(self.thresholds, spread + self.hysteresis))
+
+    def level_for(self, state):
+        return self.top_level[state - 1] if state > 0 else -1
+
+    def tiers_for(self, state):
+        return self.levels[:state]
+
+
+def compile_rules(settings):
+    """
+    由設定檔格式編譯規則
+    settings: {b_id: {"tiers": [{"diff": "0.5", "sound": "a.wav"}, ...], "sound_enabled": True,
+                      "hysteresis": 0.05, "dwell": 0, "max_alerts": 5, "rate_window": 60}}
+    (舊版格式直接是 tiers 列表也可；防抖動欄位省略時使用預設值)
+    """
+    rules = {}
+    for b_id, val in settings.items():
+        if isinstance(val, list):
+            rules[b_id] = BrokerAlertRule(val)
+        elif isinstance(val, dict):
+            rules[b_id] = BrokerAlertRule(val.get("tiers", []), val.get("sound_enabled", True),
+                                          val.get("hysteresis", DEFAULT_HYSTERESIS),
+                                          val.get("dwell", DEFAULT_DWELL),
+                                          val.get("max_alerts", DEFAULT_MAX_ALERTS),
+                                          val.get("rate_window", DEFAULT_RATE_WINDOW))
+    return rules
+
+
+class AlertEvaluator(threading.Thread):
+    """
+    警報評估執行緒
+    submit() 可由任何執行緒呼叫；on_transition(AlertTransition) 與 on_rule(RuleEvent)
+    在評估執行緒中被呼叫，GUI 端應以 Qt 訊號轉回主執行緒
+    play_sound(path, priority) 於升級觸發 / 規則成立且音效開啟時直接呼叫 (priority 為層級，
+    可直接接 AudioEngine.play)
+    notify(item) 於升級觸發 / 規則成立時呼叫 (可直接接 NotificationHub.publish_alert)，不經過 UI
+    log(msg) 記錄評估錯誤 (於評估執行緒呼叫，GUI 端應傳入轉回主執行緒的訊號)
+    """
+
+    # 控制訊息 (放在佇列 b_id 欄位)；用私有物件而非字串，券商 id 不會被誤認為控制訊息
+    _RESET = object()
+    _RESET_STATES = object()
+    _FORGET = object()   # 券商 id 放在 bid 欄位
+    _SUSPECT = object()  # 券商 id 放在 bid 欄位，可疑與否放在 ask 欄位
+
+    def __init__(self, on_transition, play_sound=None, on_rule=None, notify=None, log=None):
+        super().__init__(daemon=True)
+        self.on_transition = on_transition
+        self.play_sound = play_sound
+        self.on_rule = on_rule
+        self.notify = notify
+        self.log = log
+        self.rules = {}
+        self.rule_engine = None
+        self.queue = queue.SimpleQueue()
+        self.states = {}   # b_id -> 觸發門檻數
+        self.levels = {}   # b_id -> 最高觸發層級
+        self.pending = {}  # b_id -> (候選狀態, 開始時間)，等待 dwell
+        self.fire_times = defaultdict(deque)  # b_id -> 最近觸發時間 (頻率上限)
+        # 觸發次數統計：naive 為不做防抖動時會觸發的次數
+        self.fires = defaultdict(int)
+        self.naive_fires = defaultdict(int)
+        self.naive_levels = {}
+
+    def set_rules(self, rules):
+        """整組替換 (單一參照指派，評估執行緒不會看到一半的設定)"""
+        self.rules = rules
+        # 門檻變動後下一筆 tick 重新比較狀態並通知 UI
+        self.queue.put((self._RESET_STATES, None, None, None))
+
+    def set_rule_engine(self, engine):
+        """替換進階規則 (alert_rules.RuleEngine)；新引擎從空狀態開始累積"""
+        self.rule_engine = engine
+
+    def reset(self):
+        self.queue.put((self._RESET, None, None, None))
+
+    def forget(self, b_id):
+        """券商被移除：在評估執行緒中清掉它的狀態與統計"""
+        self.queue.put((self._FORGET, b_id, None, None))
+
+    def set_suspect(self, b_id, suspect):
+        """券商報價被判定可疑 / 恢復正常；跨券商規則在可疑期間不使用其最後報價"""
+        self.queue.put((self._SUSPECT, b_id, suspect, None))
+
+    def submit(self, b_id, bid, ask, ts=None):
+        self.queue.put((b_id, bid, ask, time.time() if ts is None else ts))
+
+    def stop(self):
+        self.queue.put(None)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None: break
+            b_id, bid, ask, ts = item
+            if b_id is self._RESET:
+                self.states.clear()
+                self.levels.clear()
+                self.pending.clear()
+                self.fire_times.clear()
+                self.fires.clear()
+                self.naive_fires.clear()
+                self.naive_levels.clear()
+                continue
+            if b_id is self._RESET_STATES:
+                self.states.clear()
+                self.pending.clear()
+                continue
+            if b_id is self._FORGET:
+                for d in (self.states, self.levels, self.pending, self.fire_times, self.fires,
+                          self.naive_fires, self.naive_levels):
+                    d.pop(bid, None)
+                if self.rule_engine is not None:
+                    self.rule_engine.forget(bid)
+                continue
+            if b_id is self._SUSPECT:
+                if self.rule_engine is not None:
+                    self.rule_engine.set_suspect(bid, ask)
+                continue
+            try:
+                self.evaluate(b_id, abs(ask - bid), ts)
+                if self.rule_engine is not None:
+                    self.evaluate_rules(b_id, bid, ask, ts)
+            except Exception as e:
+                self._log(f"警報評估錯誤 [{b_id}]: {e}")
+
+    def _log(self, msg):
+        if self.log:
+            try:
+                self.log(msg)
+            except Exception:
+                pass
+
+    def suppressed_counts(self):
+        """b_id -> 被防抖動過濾掉的警報數 (可由其他執行緒讀取)"""
+        return {b: max(n - self.fires.get(b, 0), 0) for b, n in list(self.naive_fires.items())}
+
+    def allow_fire(self, b_id, rule, ts):
+        if rule.max_alerts <= 0: return True
+        times = self.fire_times[b_id]
+        while times and ts - times[0] >= rule.rate_window:
+            times.popleft()
+        if len(times) >= rule.max_alerts: return False
+        times.append(ts)
+        return True
+
+    def evaluate(self, b_id, spread, ts):
+        rule = self.rules.get(b_id)
+        if rule is None: return
+
+        # 不做防抖動時的觸發次數 (每次往上跨越門檻算一次)
+        naive = rule.level_for(rule.evaluate(spread))
+        if naive > self.naive_levels.get(b_id, -1):
+            self.naive_fires[b_id] += 1
+        self.naive_levels[b_id] = naive
+
+        current = self.states.get(b_id)
+        state = rule.evaluate(spread, current)
+        if current == state:
+            self.pending.pop(b_id, None)
+            return
+
+        prev = self.levels.get(b_id, -1)
+        level = rule.level_for(state)
+        # 層級改變需維持 dwell 秒才生效；設定變更後的重新同步 (層級不變) 直接套用
+        if rule.dwell > 0 and level != prev:
+            pending = self.pending.get(b_id)
+            if pending is None or pending[0] != state:
+                self.pending[b_id] = (state, ts)
+                return
+            if ts - pending[1] < rule.dwell:
+                return
+        self.pending.pop(b_id, None)
+        self.states[b_id] = state
+        self.levels[b_id] = level
+
+        fired = level > prev
+        suppressed = False
+        if fired and not self.allow_fire(b_id, rule, ts):
+            fired, suppressed = False, True
+        if fired:
+            self.fires[b_id] += 1
+        sound_path = rule.sounds.get(level, "") if level >= 0 else ""
+
+        if fired and rule.sound_enabled and self.play_sound and sound_path and os.path.isfile(sound_path):
+            self.play_sound(sound_path, level)
+
+        tr = AlertTransition(b_id, level, prev, rule.tiers_for(state), spread, ts, fired, sound_path,
+                             rule.sound_enabled, rule.level_thresholds.get(level, 0.0), suppressed)
+        if fired and self.notify:
+            self.notify(tr)
+        self.on_transition(tr)
+
+    def evaluate_rules(self, b_id, bid, ask, ts):
+        for ev in self.rule_engine.on_tick(b_id, bid, ask, ts):
+            if ev.active and ev.sound and self.play_sound and os.path.isfile(ev.sound):
+                self.play_sound(ev.sound, 0)
+            if ev.active and self.notify:
+                self.notify(ev)
+            if self.on_rule: self.on_rule(ev)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+進階警報規則 (增量評估)
+每行一條規則，# 之後為註解；券商代號可用 * 代表所有券商：
+
+    spread(WF) > 0.5 for 10s              點差持續大於 0.5 超過 10 秒
+    spread(*) > 2x median(1h)             點差大於自身 1 小時滾動中位數的 2 倍
+    spread(IG) > 1.5x median(15m) for 5s  (比例規則也可加持續時間)
+    move(WF) > 1.0 in 30s                 中價在 30 秒內的高低差超過 1.0
+    bid(WF) > ask(IG)                     WF 的買價高於 IG 的賣價 (可加 + 0.1 容差)
+    ... sound=C:/alert.wav                規則成立時播放的音效 (選填，放在行尾)
+    spread(Oanda:XAGUSD) > 0.05           XAUUSD 以外的商品以「券商:商品」表示 (見 config_schema.stream_key)
+
+每個券商的共用狀態 (最新報價、滾動中位數、中價高低) 只維護一份，
+規則本身只保存「條件成立起點」與「目前是否成立」，每筆 tick 成本為常數，
+數百條規則也不會拖慢資料流；只有規則狀態改變時才產生事件
+"""
+
+import re
+from collections import namedtuple
+
+from spread_stats import WindowStats, MonotonicMinMax
+from consolidated_book import DEFAULT_STALE_SECONDS
+
+KIND_SPREAD = "spread"
+KIND_MEDIAN = "median"
+KIND_MOVE = "move"
+KIND_CROSS = "cross"
+
+WILDCARD = "*"
+
+# 規則事件：active=True 代表規則開始成立，False 代表解除
+RuleEvent = namedtuple("RuleEvent", ["rule", "b_id", "active", "value", "ts", "sound"])
+
+RuleSpec = namedtuple("RuleSpec", ["text", "kind", "broker", "other", "threshold", "window", "hold", "sound"])
+
+_DURATION = r"(\d+(?:\.\d+)?)\s*([smh]?)"
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_BROKER = r"([\w\-\.:]+|\*)"
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+_RE_SOUND = re.compile(r"\s+sound\s*=\s*(.+)$", re.I)
+_RE_HOLD = re.compile(r"\s+for\s+" + _DURATION + r"$", re.I)
+_RE_MEDIAN = re.compile(r"^spread\(\s*" + _BROKER + r"\s*\)\s*>\s*" + _NUMBER + r"\s*x\s*median\(\s*" + _DURATION + r"\s*\)$", re.I)
+_RE_SPREAD = re.compile(r"^spread\(\s*" + _BROKER + r"\s*\)\s*>\s*" + _NUMBER + r"$", re.I)
+_RE_MOVE = re.compile(r"^move\(\s*" + _BROKER + r"\s*\)\s*>\s*" + _NUMBER + r"\s+in\s+" + _DURATION + r"$", re.I)
+_RE_CROSS = re.compile(r"^bid\(\s*([\w\-\.:]+)\s*\)\s*>\s*ask\(\s*([\w\-\.:]+)\s*\)(?:\s*\+\s*" + _NUMBER + r")?$", re.I)
+
+
+def _seconds(value, unit):
+    return float(value) * _UNITS[unit.lower()]
+
+
+def parse_rule(line):
+    """解析單行規則，格式錯誤時拋出 ValueError"""
+    text = line.split("#", 1)[0].strip()
+    if not text: return None
+    body, sound = text, ""
+
+    m = _RE_SOUND.search(body)
+    if m:
+        sound = m.group(1).strip().strip('"')
+        body = body[:m.start()].strip()
+
+    hold = 0.0
+    m = _RE_HOLD.search(body)
+    if m:
+        hold = _seconds(m.group(1), m.group(2))
+        body = body[:m.start()].strip()
+
+    m = _RE_MEDIAN.match(body)
+    if m:
+        return RuleSpec(text, KIND_MEDIAN, m.group(1), None, float(m.group(2)),
+                        _seconds(m.group(3), m.group(4)), hold, sound)
+    m = _RE_SPREAD.match(body)
+    if m:
+        return RuleSpec(text, KIND_SPREAD, m.group(1), None, float(m.group(2)), None, hold, sound)
+    m = _RE_MOVE.match(body)
+    if m:
+        return RuleSpec(text, KIND_MOVE, m.group(1), None, float(m.group(2)),
+                        _seconds(m.group(3), m.group(4)), hold, sound)
+    m = _RE_CROSS.match(body)
+    if m:
+        return RuleSpec(text, KIND_CROSS, m.group(1), m.group(2), float(m.group(3) or 0), None, hold, sound)
+    raise ValueError(f"無法解析規則: {text}")
+
+
+def parse_rules(lines):
+    """回傳 (規則列表, 錯誤列表 [(行號, 訊息)])"""
+    if isinstance(lines, str): lines = lines.splitlines()
+    specs, errors = [], []
+    for no, line in enumerate(lines, 1):
+        try:
+            spec = parse_rule(line)
+        except ValueError as e:
+            errors.append((no, str(e)))
+            continue
+        if spec: specs.append(spec)
+    return specs, errors
+
+
+# ==========================================
+#  共用市場狀態
+# ==========================================
+
+class MarketState:
+    """單一券商的最新報價與規則需要的滾動統計 (依規則需求建立，多條規則共用)"""
+    __slots__ = ("bid", "ask", "ts", "suspect", "medians", "moves")
+
+    def __init__(self):
+        self.bid = None
+        self.ask = None
+        self.ts = None
+        self.suspect = False  # 目前報價被判定為可疑 (可疑 tick 不會更新 bid / ask)
+        self.medians = {}  # 窗口秒數 -> WindowStats
+        self.moves = {}    # 窗口秒數 -> MonotonicMinMax (中價)
+
+    def update(self, bid, ask, ts):
+        self.bid, self.ask, self.ts = bid, ask, ts
+        spread = abs(ask - bid)
+        for stats in self.medians.values():
+            stats.update(spread, ts)
+        mid = (bid + ask) / 2.0
+        for mm in self.moves.values():
+            mm.push(mid, ts)
+
+
+# ==========================================
+#  規則實例
+# ==========================================
+
+class Rule:
+    """規則實例：condition() 回傳 (條件是否成立, 數值)，持續時間由基底類別處理"""
+    __slots__ = ("spec", "b_id", "since", "active")
+
+    def __init__(self, spec, b_id):
+        self.spec = spec
+        self.b_id = b_id
+        self.since = None
+        self.active = False
+
+    def condition(self, states, ts):
+        raise NotImplementedError
+
+    def step(self, states, ts):
+        """回傳 RuleEvent (狀態改變時) 或 None"""
+        ok, value = self.condition(states, ts)
+        if ok:
+            if self.since is None: self.since = ts
+            active = ts - self.since >= self.spec.hold
+        else:
+            self.since = None
+            active = False
+        if active == self.active: return None
+        self.active = active
+        return RuleEvent(self.spec.text, self.b_id, active, value, ts, self.spec.sound)
+
+
+class SpreadRule(Rule):
+    __slots__ = ()
+
+    def condition(self, states, ts):
+        s = states[self.b_id]
+        spread = abs(s.ask - s.bid)
+        return spread > self.spec.threshold, spread
+
+
+class MedianRule(Rule):
+    __slots__ = ()
+
+    def condition(self, states, ts):
+        s = states[self.b_id]
+        spread = abs(s.ask - s.bid)
+        median = s.medians[self.spec.window].median()
+        if median <= 0: return False, 0.0
+        ratio = spread / median
+        return ratio > self.spec.threshold, ratio
+
+
+class MoveRule(Rule):
+    __slots__ = ()
+
+    def condition(self, states, ts):
+        mm = states[self.b_id].moves[self.spec.window]
+        move = mm.max - mm.min
+        return move > self.spec.threshold, move
+
+
+class CrossRule(Rule):
+    """跨券商比較：任一邊過期 (同 ConsolidatedBook) 或可疑時不成立，避免凍結的報價一直觸發"""
+    __slots__ = ()
+
+    def condition(self, states, ts):
+        a = states.get(self.spec.broker)
+        b = states.get(self.spec.other)
+        if a is None or b is None or a.bid is None or b.ask is None: return False, 0.0
+        if a.suspect or b.suspect: return False, 0.0
+        if ts - a.ts > DEFAULT_STALE_SECONDS or ts - b.ts > DEFAULT_STALE_SECONDS: return False, 0.0
+        diff = a.bid - b.ask
+        return diff > self.spec.threshold, diff
+
+
+_RULE_CLASSES = {KIND_SPREAD: SpreadRule, KIND_MEDIAN: MedianRule, KIND_MOVE: MoveRule, KIND_CROSS: CrossRule}
+
+
+class RuleEngine:
+    """
+    依券商索引規則；每筆 tick 只評估與該券商相關的規則
+    * 規則在券商第一次出現報價時才建立實例
+    """
+
+    def __init__(self, specs=()):
+        self.specs = list(specs)
+        self.states = {}       # b_id -> MarketState
+        self.by_broker = {}    # b_id -> [Rule]
+        self.wildcards = [s for s in self.specs if s.broker == WILDCARD]
+        for spec in self.specs:
+            if spec.broker == WILDCARD: continue
+            self._add(spec, spec.broker)
+            if spec.kind == KIND_CROSS:
+                # 跨券商規則任一邊更新都要重新評估 (共用同一個實例)
+                self.by_broker.setdefault(spec.other, []).append(self.by_broker[spec.broker][-1])
+                self._state(spec.other)
+
+    @classmethod
+    def from_text(cls, lines):
+        specs, errors = parse_rules(lines)
+        return cls(specs), errors
+
+    def __len__(self):
+        return len(self.specs)
+
+    def _state(self, b_id):
+        s = self.states.get(b_id)
+        if s is None:
+            s = self.states[b_id] = MarketState()
+        return s
+
+    def _add(self, spec, b_id):
+        state = self._state(b_id)
+        if spec.kind == KIND_MEDIAN and spec.window not in state.medians:
+            state.medians[spec.window] = WindowStats(spec.window)
+        elif spec.kind == KIND_MOVE and spec.window not in state.moves:
+            state.moves[spec.window] = MonotonicMinMax(spec.window)
+        rule = _RULE_CLASSES[spec.kind](spec, b_id)
+        self.by_broker.setdefault(b_id, []).append(rule)
+        return rule
+
+    def set_suspect(self, b_id, suspect):
+        """報價被判定可疑 / 恢復正常 (可疑 tick 不送進規則引擎，最後一筆正常報價會停在原值)"""
+        state = self.states.get(b_id)
+        if state is not None: state.suspect = suspect
+
+    def forget(self, b_id):
+        """券商被移除：丟掉萬用規則為它建立的狀態 (設定中明確指名的規則保留)"""
+        if any(spec.broker == b_id or (spec.kind == KIND_CROSS and spec.other == b_id) for spec in self.specs):
+            return
+        self.states.pop(b_id, None)
+        self.by_broker.pop(b_id, None)
+
+    def on_tick(self, b_id, bid, ask, ts):
+        """回傳此 tick 造成的規則事件列表"""
+        state = self.states.get(b_id)
+        if state is None:
+            if not self.wildcards: return []
+            state = self._state(b_id)
+        if state.ts is None:
+            for spec in self.wildcards:
+                self._add(spec, b_id)
+        state.update(bid, ask, ts)
+
+        events = []
+        for rule in self.by_broker.get(b_id, ()):
+            ev = rule.step(self.states, ts)
+            if ev: events.append(ev)
+        return events
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+警報音效引擎
+1. 設定的音效檔只在設定變更時讀進記憶體一次 (檔案修改後自動重新載入)，播放時不再讀檔
+2. 單一播放執行緒 + 優先佇列：同一音效尚未播放前重複觸發會合併，較高層級優先播放，
+   等待過久的請求直接丟棄，警報風暴時不會無限開執行緒或疊音
+3. 跨平台後端 (依序嘗試)：
+   winsound (Windows, 記憶體播放) → simpleaudio (記憶體播放) → playsound → 系統播放程式 (paplay / aplay / afplay)
+"""
+
+import os
+import time
+import heapq
+import shutil
+import threading
+import subprocess
+
+try:
+    import winsound
+except ImportError:
+    winsound = None
+
+try:
+    import simpleaudio
+except ImportError:
+    simpleaudio = None
+
+try:
+    from playsound import playsound
+except ImportError:
+    playsound = None
+
+DEFAULT_MAX_DELAY = 3.0   # 排隊超過此秒數的請求直接丟棄 (已過時的警報)
+PLAYER_COMMANDS = ("paplay", "aplay", "afplay")
+
+
+class Sound:
+    """已載入的音效：data 為 WAV 原始位元組 (winsound)，wave 為 simpleaudio 物件"""
+    __slots__ = ("path", "mtime", "data", "wave")
+
+    def __init__(self, path, mtime, data=None, wave=None):
+        self.path = path
+        self.mtime = mtime
+        self.data = data
+        self.wave = wave
+
+
+def detect_backend():
+    if winsound is not None: return "winsound"
+    if simpleaudio is not None: return "simpleaudio"
+    if playsound is not None: return "playsound"
+    for cmd in PLAYER_COMMANDS:
+        if shutil.which(cmd): return cmd
+    return None
+
+
+class AudioEngine(threading.Thread):
+    """
+    用法:
+        audio = AudioEngine(log=callback); audio.start()
+        audio.preload([...])              # 設定變更時
+        audio.play(path, priority=level)  # 任何執行緒皆可呼叫，不會阻塞
+    """
+
+    def __init__(self, log=None, max_delay=DEFAULT_MAX_DELAY, backend=None):
+        super().__init__(daemon=True)
+        self.log = log
+        self.max_delay = max_delay
+        self.backend = backend or detect_backend()
+        # 後端無法處理的格式 (如 mp3) 最後改用系統播放程式
+        self.player = next((cmd for cmd in PLAYER_COMMANDS if shutil.which(cmd)), None)
+        self.sounds = {}        # 正規化路徑 -> Sound
+        self.cond = threading.Condition()
+        self.heap = []          # [-priority, 序號, 路徑, 請求時間, 重複次數, 有效]
+        self.pending = {}       # 路徑 -> heap entry (合併重複請求)
+        self.seq = 0
+        self.running = True
+        # 統計
+        self.played = 0
+        self.coalesced = 0
+        self.dropped = 0
+        if self.backend is None:
+            self._log("找不到可用的音效後端，警報將不會發聲")
+
+    def _log(self, msg):
+        if self.log:
+            try:
+                self.log(msg)
+            except Exception:
+                pass
+
+    # ==========================================
+    #  載入
+    # ==========================================
+
+    def preload(self, paths):
+        """載入 (或重新載入已修改的) 音效檔；不存在的路徑忽略"""
+        for path in paths:
+            if not path: continue
+            key = os.path.normpath(path)
+            try:
+                mtime = os.path.getmtime(key)
+            except OSError:
+                continue
+            cached = self.sounds.get(key)
+            if cached is not None and cached.mtime == mtime: continue
+            try:
+                self.sounds[key] = self._load(key, mtime)
+            except Exception as e:
+                self._log(f"音效載入失敗: {key} ({e})")
+
+    def _load(self, path, mtime):
+        is_wav = path.lower().endswith(".wav")
+        if self.backend == "winsound" and is_wav:
+            with open(path, "rb") as f:
+                return Sound(path, mtime, data=f.read())
+        if self.backend == "simpleaudio" and is_wav:
+            return Sound(path, mtime, wave=simpleaudio.WaveObject.from_wave_file(path))
+        # 其他格式 / 後端：只記錄路徑，由後端自行讀檔
+        return Sound(path, mtime)
+
+    # ==========================================
+    #  播放佇列
+    # ==========================================
+
+    def play(self, path, priority=0, repeat=1):
+        if not path or self.backend is None: return
+        key = os.path.normpath(path)
+        now = time.time()
+        with self.cond:
+            entry = self.pending.get(key)
+            if entry is not None:
+                # 尚未播放的相同音效：合併，保留較高優先權
+                self.coalesced += 1
+                if priority <= -entry[0]:
+                    entry[4] = max(entry[4], repeat)
+                    return
+                entry[5] = False
+                repeat = max(entry[4], repeat)
+                now = entry[3]
+            self.seq += 1
+            entry = [-priority, self.seq, key, now, repeat, True]
+            self.pending[key] = entry
+            heapq.heappush(self.heap, entry)
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def _next(self):
+        with self.cond:
+            while self.running:
+                while self.heap and not self.heap[0][5]:
+                    heapq.heappop(self.heap)
+                if self.heap:
+                    entry = heapq.heappop(self.heap)
+                    self.pending.pop(entry[2], None)
+                    return entry
+                self.cond.wait()
+        return None
+
+    def run(self):
+        while True:
+            entry = self._next()
+            if entry is None: break
+            _, _, path, requested, repeat, _ = entry
+            if time.time() - requested > self.max_delay:
+                self.dropped += 1
+                continue
+            for _ in range(repeat):
+                self._play_now(path)
+            self.played += 1
+
+    def _play_now(self, path):
+        sound = self.sounds.get(path)
+        if sound is None:
+            # 未預先載入 (例如設定剛改)：載入後快取
+            self.preload([path])
+            sound = self.sounds.get(path)
+            if sound is None:
+                self._log(f"找不到音效檔案: {path}")
+                return
+        try:
+            if sound.data is not None:
+                winsound.PlaySound(sound.data, winsound.SND_MEMORY | winsound.SND_NODEFAULT)
+            elif sound.wave is not None:
+                sound.wave.play().wait_done()
+            elif playsound is not None:
+                playsound(path)
+            elif self.backend == "winsound":
+                winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_NODEFAULT)
+            elif self.player:
+                subprocess.run([self.player, path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            else:
+                self._log(f"無法播放此格式: {path}")
+        except Exception as e:
+            self._log(f"音效播放失敗: {e}")
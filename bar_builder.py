@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+即時 K 棒 (OHLC) 聚合
+1. 串流模式: 逐筆 tick 聚合每個券商的中價 (mid) 與點差 K 棒 (預設 1s / 1m / 5m)
+2. 每根 K 棒另記錄 tick 數與最大點差；由計時器呼叫 flush() 即使沒有 tick 也會收棒
+3. 收棒後批次寫入 CSV (每個週期每天一個檔案)
+4. 向量化模式: build_bars() 以 NumPy 由大量 tick 陣列直接重建 K 棒
+"""
+
+import os
+import csv
+import time
+import datetime
+
+import numpy as np
+
+# 預設 K 棒週期 (秒)
+DEFAULT_INTERVALS = (1, 60, 300)
+
+# 輸出資料夾
+BAR_DIR = "bars"
+
+BAR_FIELDS = ["broker", "interval", "start", "mid_open", "mid_high", "mid_low", "mid_close",
+              "spread_open", "spread_max", "spread_min", "spread_close", "ticks"]
+
+
+def interval_label(seconds):
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+class Bar:
+    """單根 K 棒 (中價與點差各一組 OHLC)"""
+    __slots__ = ("broker", "interval", "start", "mid_open", "mid_high", "mid_low", "mid_close",
+                 "spread_open", "spread_max", "spread_min", "spread_close", "ticks")
+
+    def __init__(self, broker, interval, start, mid, spread):
+        self.broker = broker
+        self.interval = interval
+        self.start = start
+        self.mid_open = self.mid_high = self.mid_low = self.mid_close = mid
+        self.spread_open = self.spread_max = self.spread_min = self.spread_close = spread
+        self.ticks = 1
+
+    @property
+    def end(self):
+        return self.start + self.interval
+
+    def add(self, mid, spread):
+        if mid > self.mid_high: self.mid_high = mid
+        if mid < self.mid_low: self.mid_low = mid
+        self.mid_close = mid
+        if spread > self.spread_max: self.spread_max = spread
+        if spread < self.spread_min: self.spread_min = spread
+        self.spread_close = spread
+        self.ticks += 1
+
+    def as_row(self):
+        return [self.broker, self.interval, f"{self.start:.0f}",
+                f"{self.mid_open:.3f}", f"{self.mid_high:.3f}", f"{self.mid_low:.3f}", f"{self.mid_close:.3f}",
+                f"{self.spread_open:.3f}", f"{self.spread_max:.3f}", f"{self.spread_min:.3f}",
+                f"{self.spread_close:.3f}", self.ticks]
+
+
+class BarWriter:
+    """將收好的 K 棒批次附加到 CSV：bars/bars_<週期>_<日期>.csv"""
+
+    def __init__(self, folder=BAR_DIR):
+        self.folder = folder
+        self.pending = []
+
+    def add(self, bars):
+        self.pending.extend(bars)
+
+    def flush(self):
+        if not self.pending: return 0
+        os.makedirs(self.folder, exist_ok=True)
+        groups = {}
+        for bar in self.pending:
+            day = datetime.datetime.fromtimestamp(bar.start).strftime("%Y%m%d")
+            path = os.path.join(self.folder, f"bars_{interval_label(bar.interval)}_{day}.csv")
+            groups.setdefault(path, []).append(bar.as_row())
+
+        for path, rows in groups.items():
+            is_new = not os.path.exists(path)
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if is_new:
+                    writer.writerow(BAR_FIELDS)
+                writer.writerows(rows)
+
+        count = len(self.pending)
+        self.pending = []
+        return count
+
+
+class BarBuilder:
+    """
+    串流 K 棒聚合器
+    用法: on_tick(b_id, bid, ask) 每筆呼叫；計時器每秒呼叫 flush() 取得已收棒清單
+    """
+
+    def __init__(self, intervals=DEFAULT_INTERVALS, writer=None):
+        self.intervals = tuple(intervals)
+        self.writer = writer
+        self.current = {}  # (b_id, interval) -> Bar
+        self.closed = []
+
+    def on_tick(self, b_id, bid, ask, ts=None):
+        if ts is None: ts = time.time()
+        mid = (bid + ask) / 2.0
+        spread = abs(ask - bid)
+        for iv in self.intervals:
+            key = (b_id, iv)
+            bar = self.current.get(key)
+            start = ts - (ts % iv)
+            if bar is not None and bar.start == start:
+                bar.add(mid, spread)
+                continue
+            if bar is not None:
+                self.closed.append(bar)
+            self.current[key] = Bar(b_id, iv, start, mid, spread)
+
+    def flush(self, now=None):
+        """收掉所有已到期的 K 棒，回傳本次收棒列表 (並交給 writer 落地)"""
+        if now is None: now = time.time()
+        for key, bar in list(self.current.items()):
+            if now >= bar.end:
+                self.closed.append(bar)
+                del self.current[key]
+
+        closed, self.closed = self.closed, []
+        if self.writer is not None and closed:
+            self.writer.add(closed)
+            self.writer.flush()
+        return closed
+
+    def close_all(self):
+        """停止監控時收掉所有未完成的 K 棒"""
+        self.closed.extend(self.current.values())
+        self.current.clear()
+        return self.flush()
+
+    def remove(self, b_id):
+        for iv in self.intervals:
+            bar = self.current.pop((b_id, iv), None)
+            if bar is not None:
+                self.closed.append(bar)
+
+
+# ==========================================
+#  向量化重建 (離線/批次)
+# ==========================================
+
+def build_bars(ts, bid, ask, interval):
+    """
+    由單一券商的 tick 陣列 (依時間排序) 重建 K 棒
+    回傳 dict，每個欄位皆為長度 = K 棒數的 NumPy 陣列
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    bid = np.asarray(bid, dtype=np.float64)
+    ask = np.asarray(ask, dtype=np.float64)
+    if ts.size == 0:
+        return {name: np.empty(0) for name in BAR_FIELDS[2:]}
+
+    mid = (bid + ask) / 2.0
+    spread = np.abs(ask - bid)
+    bucket = np.floor(ts / interval).astype(np.int64)
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    ends = np.concatenate((starts[1:], [ts.size]))
+
+    return {
+        "start": bucket[starts].astype(np.float64) * interval,
+        "mid_open": mid[starts],
+        "mid_high": np.maximum.reduceat(mid, starts),
+        "mid_low": np.minimum.reduceat(mid, starts),
+        "mid_close": mid[ends - 1],
+        "spread_open": spread[starts],
+        "spread_max": np.maximum.reduceat(spread, starts),
+        "spread_min": np.minimum.reduceat(spread, starts),
+        "spread_close": spread[ends - 1],
+        "ticks": ends - starts,
+    }
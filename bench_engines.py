@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+爬蟲引擎基準測試
+對同一組模擬站台 (site_simulator.py) 依序執行各種抓取架構並量測：
+1. 每個站台單次抓取延遲 (p50/p90/p99)
+2. 完整輪詢週期 (同一站台兩次更新的間隔)
+3. 每秒 tick 數、最大報價年齡、掉 tick 率 (對照模擬器產生的報價序號)
+4. Chrome + Python 的 CPU 與 RSS (需要 psutil)
+5. 啟動時間 (開始 → 所有站台都收到第一筆報價)
+結果輸出為 JSON (含 git commit)，方便跨版本比較
+
+引擎:
+    single        S.py UnifiedMonitorThread，單一瀏覽器輪詢全部分頁 (同 G9 / 單核版架構)
+    per-site      每個站台一個 UnifiedMonitorThread (同 LP/LP1 一站一執行緒架構)
+    workers:N     G15 BrowserWorker，N 個瀏覽器分工
+
+用法:
+    python bench_engines.py --engine single --engine workers:2 --engine workers:4 --sites 12 --duration 60
+"""
+
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+import subprocess
+
+from PyQt6.QtCore import QCoreApplication, QTimer
+
+from site_simulator import SiteSimulator, DEFAULT_RATE
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DEFAULT_DURATION = 60.0
+SAMPLE_MS = 200
+
+
+def percentile(values, q):
+    if not values: return 0.0
+    data = sorted(values)
+    k = min(len(data) - 1, max(0, int(math.ceil(q / 100.0 * len(data))) - 1))
+    return data[k]
+
+
+def summarize(values):
+    return {"p50": percentile(values, 50), "p90": percentile(values, 90), "p99": percentile(values, 99),
+            "max": max(values) if values else 0.0, "count": len(values)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+# ==========================================
+#  引擎建立
+# ==========================================
+
+def build_engines(spec, sim):
+    """
+    回傳 (執行緒列表, 單次抓取的方法名稱, 實際分派的站台 id)
+    引擎不支援的樣板 (S.py 通用爬蟲的 MF iframe、G15 已移除的 Oanda 等) 不分派
+    """
+    if spec == "single":
+        import S
+        brokers = sim.brokers_config()
+        return [S.UnifiedMonitorThread(brokers)], "scrape_generic", [b["id"] for b in brokers]
+
+    if spec == "per-site":
+        import S
+        brokers = sim.brokers_config()
+        return [S.UnifiedMonitorThread([b]) for b in brokers], "scrape_generic", [b["id"] for b in brokers]
+
+    if spec.startswith("workers:"):
+        import G15
+        count = max(1, int(spec.split(":", 1)[1]))
+        sites = {k: v for k, v in sim.sites_config().items()
+                 if hasattr(G15.BrowserWorker, f"scrape_{v['scraper']}")}
+        keys = list(sites.keys())
+        chunk = math.ceil(len(keys) / count)
+        workers = []
+        for i in range(count):
+            part = keys[i * chunk:(i + 1) * chunk]
+            if part:
+                workers.append(G15.BrowserWorker(i + 1, {k: dict(sites[k]) for k in part}))
+        return workers, "scrape_site", keys
+
+    raise ValueError(f"未知引擎: {spec}")
+
+
+class Collector:
+    """收集訊號與取樣資料 (訊號可能來自多個執行緒，以鎖保護)"""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.lock = threading.Lock()
+        self.t_start = time.perf_counter()
+        self.first_tick = {}       # sid -> 第一筆時間 (相對開始)
+        self.last_update = {}      # sid -> 最後更新 (perf_counter)
+        self.cycle_times = []
+        self.scrape_times = []
+        self.quote_lags = []       # 收到報價時，該報價在模擬器產生後經過的秒數
+        self.seen_seqs = {}        # sid -> set(seq)
+        self.ticks = 0
+        self.max_age_samples = []
+        self.cpu_samples = []
+        self.rss_samples = []
+        self.seq_start = {s.sid: s.seq for s in sim.sites}
+
+    def on_price(self, sid, bid, ask, time_str):
+        now = time.perf_counter()
+        wall = time.time()
+        with self.lock:
+            self.ticks += 1
+            if sid not in self.first_tick:
+                self.first_tick[sid] = now - self.t_start
+            prev = self.last_update.get(sid)
+            if prev is not None:
+                self.cycle_times.append(now - prev)
+            self.last_update[sid] = now
+
+        # 對照模擬器歷史：找出這個報價的產生時間與序號 (以報價為鍵，不複製 / 掃描整段歷史)
+        site = self.sim.site_map.get(sid)
+        if site is None: return
+        hit = site.lookup(bid, ask)
+        if hit is None: return
+        ts, seq = hit
+        with self.lock:
+            self.quote_lags.append(wall - ts)
+            self.seen_seqs.setdefault(sid, set()).add(seq)
+
+    def wrap_scrape(self, engine, method_name):
+        original = getattr(engine, method_name)
+        collector = self
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                with collector.lock:
+                    collector.scrape_times.append(time.perf_counter() - t0)
+        setattr(engine, method_name, timed)
+
+    def sample(self, processes):
+        now = time.perf_counter()
+        with self.lock:
+            if self.last_update:
+                ages = [now - t for t in self.last_update.values()]
+                if ages: self.max_age_samples.append(max(ages))
+        if processes is None: return
+        cpu, rss = 0.0, 0
+        for p in processes():
+            try:
+                cpu += p.cpu_percent(None)
+                rss += p.memory_info().rss
+            except Exception:
+                pass
+        self.cpu_samples.append(cpu)
+        self.rss_samples.append(rss)
+
+
+def process_tree():
+    """目前 Python 行程與其子行程 (chromedriver / chrome)"""
+    if psutil is None: return None
+    me = psutil.Process()
+    cache = {}
+
+    def collect():
+        procs = [me]
+        try:
+            procs += me.children(recursive=True)
+        except Exception:
+            pass
+        # 重用 Process 物件，cpu_percent 才有前後兩次取樣可比較
+        return [cache.setdefault(p.pid, p) for p in procs]
+    return collect
+
+
+def run_engine(app, spec, sim, duration):
+    collector = Collector(sim)
+    engines, method, site_ids = build_engines(spec, sim)
+    for e in engines:
+        # S.py 的執行緒只是 monitor_core.UnifiedMonitor 的 Qt 轉接，抓取方法在 core 上
+        collector.wrap_scrape(getattr(e, "core", e), method)
+        e.price_signal.connect(collector.on_price)
+
+    processes = process_tree()
+    sampler = QTimer()
+    sampler.timeout.connect(lambda: collector.sample(processes))
+    sampler.start(SAMPLE_MS)
+
+    collector.t_start = time.perf_counter()
+    for e in engines:
+        e.start()
+
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+
+    sampler.stop()
+    for e in engines:
+        e.stop()
+    for e in engines:
+        e.wait(30000)
+    app.processEvents()
+
+    elapsed = time.perf_counter() - collector.t_start
+    generated = sum(sim.site_map[sid].seq - collector.seq_start[sid] for sid in site_ids)
+    observed = sum(len(collector.seen_seqs.get(sid, ())) for sid in site_ids)
+    started = len(collector.first_tick) == len(site_ids)
+
+    return {
+        "engine": spec,
+        "engines": len(engines),
+        "sites": len(site_ids),
+        "duration": elapsed,
+        "startup_seconds": max(collector.first_tick.values()) if started else None,
+        "sites_with_data": len(collector.first_tick),
+        "ticks": collector.ticks,
+        "ticks_per_second": collector.ticks / elapsed if elapsed > 0 else 0.0,
+        "scrape_latency": summarize(collector.scrape_times),
+        "cycle_time": summarize(collector.cycle_times),
+        "quote_lag": summarize(collector.quote_lags),
+        "max_quote_age": summarize(collector.max_age_samples),
+        "tick_loss": 1.0 - observed / generated if generated else 0.0,
+        "cpu_percent": summarize(collector.cpu_samples) if collector.cpu_samples else None,
+        "rss_mb": summarize([r / 1048576.0 for r in collector.rss_samples]) if collector.rss_samples else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="爬蟲引擎基準測試")
+    parser.add_argument("--engine", action="append", help="single / per-site / workers:N (可重複)")
+    parser.add_argument("--sites", type=int, default=12)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="模擬站台每秒報價次數")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="每個引擎量測秒數")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--out", default="bench_results.json")
+    args = parser.parse_args(argv)
+    specs = args.engine or ["single", "workers:2"]
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    if psutil is None:
+        print("未安裝 psutil，略過 CPU/RSS 量測")
+
+    results = []
+    for spec in specs:
+        # 每個引擎使用全新的模擬器，避免前一輪的狀態影響
+        sim = SiteSimulator(args.sites, args.rate, args.port, seed=1).start()
+        try:
+            print(f"=== {spec}: {args.sites} 站台, {args.duration:g} 秒 ===")
+            r = run_engine(app, spec, sim, args.duration)
+            results.append(r)
+            print(f"  啟動 {r['startup_seconds']} 秒 | {r['ticks_per_second']:.1f} tick/秒 | "
+                  f"週期 p50 {r['cycle_time']['p50']:.2f}s | 抓取 p99 {r['scrape_latency']['p99'] * 1000:.0f}ms | "
+                  f"最大報價年齡 {r['max_quote_age']['max']:.2f}s | 掉 tick {r['tick_loss']:.1%}")
+        finally:
+            sim.stop()
+
+    report = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "sites": args.sites, "rate": args.rate, "results": results}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+券商索引 (報價代號 -> 列位置)
+表格 model、警報與紀錄共用同一份索引，每筆 tick 以 dict 查詢 O(1) 取得列位置與名稱，
+不再逐一掃描 brokers_data；券商增減時整份重建
+一個券商頁面有多個商品時每個商品一列，以報價代號 (config_schema.stream_key) 為 id
+BrokerDiff 比對新舊券商設定，供執行中只開關 / 重新載入受影響的分頁
+"""
+
+
+class BrokerRegistry:
+    def __init__(self, brokers=()):
+        self.ids = []
+        self.names = []
+        self.slots = {}  # b_id -> 列位置
+        self.set_brokers(brokers)
+
+    def set_brokers(self, brokers):
+        """brokers: config_schema.BrokerSpec 列表 (依券商 / 商品順序展開)"""
+        self.ids = [inst.key for b in brokers for inst in b.instruments]
+        self.names = [inst.name for b in brokers for inst in b.instruments]
+        self.slots = {b_id: i for i, b_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, b_id):
+        return b_id in self.slots
+
+    def slot(self, b_id):
+        """回傳列位置，不存在時為 -1"""
+        return self.slots.get(b_id, -1)
+
+    def name(self, b_id):
+        i = self.slots.get(b_id)
+        return self.names[i] if i is not None else b_id
+
+    def items(self):
+        return list(zip(self.ids, self.names))
+
+
+# ==========================================
+#  設定差異 (執行中套用券商變更)
+# ==========================================
+
+class BrokerDiff:
+    """
+    old / new 為 BrokerSpec 列表
+    added / removed / changed 為券商 id 列表；reloaded 為網址變更、需重新載入分頁的 id
+    (名稱 / 選擇器變更只影響下一輪抓取，分頁不動)
+    """
+
+    def __init__(self, old, new):
+        old_map = {b.id: b for b in old}
+        new_map = {b.id: b for b in new}
+        self.added = [b_id for b_id in new_map if b_id not in old_map]
+        self.removed = [b_id for b_id in old_map if b_id not in new_map]
+        self.changed = [b_id for b_id in new_map if b_id in old_map and old_map[b_id] != new_map[b_id]]
+        self.reloaded = [b_id for b_id in self.changed if old_map[b_id].url != new_map[b_id].url]
+        self.reordered = [b.id for b in old if b.id in new_map] != [b.id for b in new if b.id in old_map]
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed or self.reordered)
+
+    def summary(self, name_of=None):
+        name_of = name_of or (lambda b_id: b_id)
+        parts = []
+        for label, ids in (("新增", self.added), ("移除", self.removed), ("修改", self.changed)):
+            if ids: parts.append(f"{label} {', '.join(name_of(b) for b in ids)}")
+        if self.reordered and not parts: parts.append("順序調整")
+        return "；".join(parts) or "無變更"
@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""
+統一設定檔格式 (不依賴 Qt)
+各版程式原本各用一種設定檔，本模組定義單一有版本號的格式，並自動轉換所有舊版檔案:
+    monitor_config.json            price5      [{"diff": 0.5, "sound": ...}, ...] (只有永豐一組門檻)
+    monitor_config_v2.json         LP / LP1 / Goldcompare   {b_id: [tiers]}
+    monitor_config_v9_pro.json     G8 / GOLD_PRO            {b_id: [tiers]}
+    monitor_config_v10_pro.json    G9          {b_id: {"tiers", "sound_enabled"}}
+    monitor_config_v11.json        G15         同上 + 防抖動欄位 + "rules" / "notify"
+    monitor_config_v11_dynamic.json  S.py      {"brokers", "alerts", "rules", "notify", "feed"}
+舊版固定券商的程式 (G8 ~ G15) 使用各站專屬爬蟲，沒有通用選擇器可轉換；券商清單改用預設值，
+門檻照原 id 保留，日後新增同 id 的券商即生效
+
+多商品: 券商層級的選擇器為主要商品 (instrument，省略為 XAUUSD)，instruments 列出同一頁面上的其他商品
+    {"id": "Oanda", ..., "instruments": [{"symbol": "XAGUSD", "bid_type": "xpath", "bid_selector": "...",
+                                           "ask_type": "xpath", "ask_selector": "..."}]}
+每個 (券商, 商品) 以報價代號識別 (stream_key: "Oanda" / "Oanda:XAGUSD")，警報設定與規則也以報價代號為鍵
+
+載入流程: 讀檔 -> migrate() 轉成目前版本 -> compile_config() 驗證一次並編譯成不可變物件 (Config)
+錯誤不中斷載入：無效欄位改用預設值、無法使用的項目略過，訊息與 build_sinks / parse_rules 相同以列表回傳
+
+用法:
+    config, errors = load_config("monitor_config_v11_dynamic.json")
+    config.brokers -> (BrokerSpec, ...)      config.compile_alerts() -> {b_id: BrokerAlertRule}
+    python config_schema.py check monitor_config_v11.json
+    python config_schema.py migrate monitor_config_v2.json -o monitor_config_v11_dynamic.json
+"""
+
+import os
+import re
+import json
+from types import MappingProxyType
+from collections import namedtuple
+
+from alert_engine import (BrokerAlertRule, DEFAULT_HYSTERESIS, DEFAULT_DWELL, DEFAULT_MAX_ALERTS,
+                          DEFAULT_RATE_WINDOW)
+from alert_rules import parse_rules
+from notify import SINK_TYPES
+from feed_client import parse_address, DEFAULT_INSTRUMENT
+from web_dashboard import parse_host_port
+
+SCHEMA_VERSION = 1
+DEFAULT_CONFIG = "monitor_config_v11_dynamic.json"
+
+# 目前格式不存在時依序尋找的舊版檔案 (新到舊)
+LEGACY_FILES = ["monitor_config_v11.json", "monitor_config_v10_pro.json", "monitor_config_v9_pro.json",
+                "monitor_config_v2.json", "monitor_config.json"]
+
+FETCH_MODES = ("id", "css", "xpath")
+KEY_SEPARATOR = ":"   # 報價代號 = 券商 id[:商品]，XAUUSD 省略商品 (與舊版設定 / 紀錄相容)
+_RE_SYMBOL = re.compile(r"^[A-Za-z0-9._\-]+$")
+ENGINE_LAYOUTS = ("single", "per-site")   # 另有 workers:N
+
+# ==========================================
+#    預設券商設定 (當沒有設定檔時使用)
+#    這裡展示如何將原本硬寫的邏輯轉為參數
+# ==========================================
+DEFAULT_BROKERS = [
+    {
+        "id": "WF", "name": "永豐金業", "url": "https://www.wfbullion.com/",
+        "bid_type": "id", "bid_selector": "pm-llg",
+        "ask_type": "id", "ask_selector": "pm-llg",
+        # 備註: 永豐原本邏輯特殊(同一格換行)，通用爬蟲會嘗試解析，若不行需用更精確的XPATH
+        "note": "自動解析"
+    },
+    {
+        "id": "IG", "name": "IG Markets", "url": "https://www.ig.com/cn/commodities/markets-commodities/gold",
+        "bid_type": "css", "bid_selector": ".price-ticket__button--sell .price-ticket__price",
+        "ask_type": "css", "ask_selector": ".price-ticket__button--buy .price-ticket__price"
+    },
+    {
+        "id": "Oanda", "name": "Oanda", "url": "https://www.oanda.com/bvi-en/cfds/metals/",
+        "bid_type": "xpath", "bid_selector": "//tr[.//span[contains(text(), 'Gold')]]/td[2]",
+        "ask_type": "xpath", "ask_selector": "//tr[.//span[contains(text(), 'Gold')]]/td[3]"
+    }
+]
+
+# 引擎調校預設值 (UnifiedMonitor)
+DEFAULT_ENGINE = {
+    "layout": "single",      # single / per-site / workers:N (monitor_daemon.py)
+    "tab_interval": 0.2,     # 每個分頁之間的間隔秒數
+    "round_interval": 1.0,   # 每一大輪之後的休息秒數
+    "wait_timeout": 10.0,    # 等待元素出現的秒數
+}
+
+
+# ==========================================
+#    編譯後的不可變物件
+# ==========================================
+
+def stream_key(b_id, symbol):
+    """(券商, 商品) -> 報價代號；表格、統計、警報、紀錄都以報價代號為鍵"""
+    return b_id if symbol == DEFAULT_INSTRUMENT else f"{b_id}{KEY_SEPARATOR}{symbol}"
+
+
+def split_key(key):
+    """報價代號 -> (券商, 商品)"""
+    b_id, _, symbol = key.partition(KEY_SEPARATOR)
+    return b_id, symbol or DEFAULT_INSTRUMENT
+
+
+class InstrumentSpec(namedtuple("InstrumentSpec", ["symbol", "key", "name", "bid_type", "bid_selector",
+                                                   "ask_type", "ask_selector"])):
+    """券商頁面上的單一商品；key 為報價代號，name 為顯示名稱"""
+    __slots__ = ()
+
+    @property
+    def combined(self):
+        """Bid / Ask 在同一個元素 (換行分隔)"""
+        return self.bid_type == self.ask_type and self.bid_selector == self.ask_selector
+
+
+class BrokerSpec(namedtuple("BrokerSpec", ["id", "name", "url", "note", "instruments"])):
+    """單一券商的抓取設定；instruments[0] 為主要商品 (設定中券商層級的選擇器)，同一頁一次抓完所有商品"""
+    __slots__ = ()
+
+    @property
+    def primary(self):
+        return self.instruments[0]
+
+
+# diff 為 None 代表該層級未設定 (層級索引維持原位置，警報層級號碼不變)
+Tier = namedtuple("Tier", ["diff", "sound"])
+
+
+class AlertPolicy(namedtuple("AlertPolicy", ["tiers", "sound_enabled", "hysteresis", "dwell", "max_alerts",
+                                             "rate_window"])):
+    """單一券商的門檻與防抖動設定"""
+    __slots__ = ()
+
+    def compile(self):
+        tiers = [{"diff": "" if t.diff is None else t.diff, "sound": t.sound} for t in self.tiers]
+        return BrokerAlertRule(tiers, self.sound_enabled, self.hysteresis, self.dwell, self.max_alerts,
+                               self.rate_window)
+
+
+FeedSpec = namedtuple("FeedSpec", ["address", "shm", "web", "web_token"])
+EngineSpec = namedtuple("EngineSpec", ["layout", "tab_interval", "round_interval", "wait_timeout"])
+
+
+class Config(namedtuple("Config", ["version", "brokers", "alerts", "rules", "rule_lines", "notify", "feed",
+                                   "engine", "source"])):
+    """
+    brokers: (BrokerSpec, ...)；alerts: {b_id: AlertPolicy} (唯讀)；rules: 解析後的 RuleSpec；
+    rule_lines: 原始規則文字 (含註解)；notify: 通知通道設定 (唯讀 dict)；
+    source: 轉換來源 (目前格式為 None，否則為舊版檔名或格式名稱)
+    """
+    __slots__ = ()
+
+    def compile_alerts(self):
+        """{b_id: BrokerAlertRule}，可直接交給 AlertEvaluator.set_rules"""
+        return {b_id: policy.compile() for b_id, policy in self.alerts.items()}
+
+    def names(self):
+        """券商 id -> 名稱"""
+        return {b.id: b.name for b in self.brokers}
+
+    def stream_names(self):
+        """報價代號 -> 顯示名稱 (依券商 / 商品順序)"""
+        return {inst.key: inst.name for b in self.brokers for inst in b.instruments}
+
+    def instruments(self):
+        """券商 id -> [商品, ...]"""
+        return {b.id: [inst.symbol for inst in b.instruments] for b in self.brokers}
+
+
+# ==========================================
+#    舊版轉換
+# ==========================================
+
+def detect_format(data):
+    """回傳 current / dynamic (S.py 舊版) / per-broker (LP ~ G15) / price5"""
+    if isinstance(data, list):
+        return "price5"
+    if not isinstance(data, dict):
+        raise ValueError("設定檔內容必須是物件或列表")
+    if "version" in data:
+        return "current"
+    if isinstance(data.get("brokers"), list):
+        return "dynamic"
+    return "per-broker"
+
+
+def migrate(data):
+    """任何版本的設定內容 -> 目前版本的設定內容 (dict，不修改傳入的資料)"""
+    kind = detect_format(data)
+    if kind == "current":
+        return dict(data)
+    if kind == "price5":
+        return {"version": SCHEMA_VERSION, "brokers": DEFAULT_BROKERS, "alerts": {"WF": {"tiers": data}}}
+    if kind == "dynamic":
+        doc = dict(data)
+        doc["version"] = SCHEMA_VERSION
+        return doc
+
+    # 以券商 id 為鍵：值為門檻列表 (v2 / v9) 或含 tiers 的物件 (v10 / v11)
+    doc = {"version": SCHEMA_VERSION, "brokers": DEFAULT_BROKERS, "alerts": {},
+           "rules": data.get("rules", []), "notify": data.get("notify", [])}
+    for key, val in data.items():
+        if key in ("rules", "notify"): continue
+        doc["alerts"][key] = {"tiers": val} if isinstance(val, list) else val
+    return doc
+
+
+def find_config(path):
+    """path 存在時回傳 (path, None)，否則回傳同目錄下最新的舊版檔案 (path, 舊版檔名)"""
+    if os.path.exists(path):
+        return path, None
+    folder = os.path.dirname(path)
+    for name in LEGACY_FILES:
+        legacy = os.path.join(folder, name)
+        if os.path.exists(legacy) and os.path.abspath(legacy) != os.path.abspath(path):
+            return legacy, name
+    return None, None
+
+
+def read_document(path):
+    """讀取並轉換成目前版本；檔案不存在時回傳 (None, None)"""
+    real, legacy = find_config(path)
+    if real is None:
+        return None, None
+    with open(real, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    kind = detect_format(data)
+    source = legacy or (None if kind == "current" else kind)
+    return migrate(data), source
+
+
+# ==========================================
+#    驗證與編譯
+# ==========================================
+
+def _number(value, default, errors, where, minimum=0.0):
+    if value is None or str(value).strip() == "":
+        return default
+    fallback = "視為未設定" if default is None else f"使用預設值 {default}"
+    try:
+        num = float(str(value).strip())
+    except ValueError:
+        errors.append(f"{where}: 不是數字 {value!r}，{fallback}")
+        return default
+    if num < minimum:
+        errors.append(f"{where}: 不可小於 {minimum}，{fallback}")
+        return default
+    return num
+
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+def compile_brokers(items, errors=None):
+    """
+    券商設定 (dict 或 BrokerSpec) -> (BrokerSpec, ...)；errors 為列表時附加訊息
+    缺少 id 或 id 重複的項目略過；其他欄位無效時使用預設值 (仍保留券商，介面上會顯示抓取失敗)
+    """
+    errors = [] if errors is None else errors
+    specs, seen = [], set()
+    for i, item in enumerate(items or []):
+        if isinstance(item, BrokerSpec):
+            spec = item
+        elif isinstance(item, dict):
+            b_id = _text(item.get("id"))
+            where = f"券商第 {i + 1} 筆"
+            if not b_id:
+                errors.append(f"{where}: 缺少 id，已略過")
+                continue
+            if KEY_SEPARATOR in b_id:
+                errors.append(f"{where}: id 不可包含 {KEY_SEPARATOR!r}，已略過")
+                continue
+            where = f"券商 {b_id}"
+            url = _text(item.get("url"))
+            if not url.startswith(("http://", "https://", "file:", "about:")):
+                errors.append(f"{where}: 網址格式錯誤 {url!r}")
+            spec = BrokerSpec(b_id, _text(item.get("name")) or b_id, url, _text(item.get("note")),
+                              _compile_instruments(item, b_id, _text(item.get("name")) or b_id, errors))
+        else:
+            errors.append(f"券商第 {i + 1} 筆: 格式錯誤，已略過")
+            continue
+        if spec.id in seen:
+            errors.append(f"券商 {spec.id}: id 重複，已略過")
+            continue
+        seen.add(spec.id)
+        specs.append(spec)
+    return tuple(specs)
+
+
+def _selectors(item, where, errors):
+    fields = []
+    for side in ("bid", "ask"):
+        mode = _text(item.get(f"{side}_type")) or "id"
+        if mode not in FETCH_MODES:
+            errors.append(f"{where}: {side}_type 須為 {' / '.join(FETCH_MODES)}，使用 id")
+            mode = "id"
+        selector = _text(item.get(f"{side}_selector"))
+        if not selector:
+            errors.append(f"{where}: 未設定 {side}_selector")
+        fields += [mode, selector]
+    return fields
+
+
+def _compile_instruments(item, b_id, name, errors):
+    """主要商品 (券商層級選擇器，instrument 省略為 XAUUSD) + instruments 列表中的其他商品"""
+    where = f"券商 {b_id}"
+    symbol = _text(item.get("instrument")) or DEFAULT_INSTRUMENT
+    if not _RE_SYMBOL.match(symbol):
+        errors.append(f"{where}: 商品代號格式錯誤 {symbol!r}，使用 {DEFAULT_INSTRUMENT}")
+        symbol = DEFAULT_INSTRUMENT
+    single = not item.get("instruments")
+    # 只有 XAUUSD 一個商品時顯示名稱維持券商名稱
+    label = name if single and symbol == DEFAULT_INSTRUMENT else f"{name} {symbol}"
+    result = [InstrumentSpec(symbol, stream_key(b_id, symbol), label, *_selectors(item, where, errors))]
+    seen = {symbol}
+    extra = item.get("instruments") or []
+    if not isinstance(extra, list):
+        errors.append(f"{where}: instruments 須為列表，已略過")
+        extra = []
+    for j, inst in enumerate(extra):
+        symbol = _text(inst.get("symbol")) if isinstance(inst, dict) else ""
+        if not _RE_SYMBOL.match(symbol):
+            errors.append(f"{where} 商品第 {j + 1} 筆: 商品代號格式錯誤 {symbol!r}，已略過")
+            continue
+        if symbol in seen:
+            errors.append(f"{where} 商品 {symbol}: 重複，已略過")
+            continue
+        seen.add(symbol)
+        result.append(InstrumentSpec(symbol, stream_key(b_id, symbol), f"{name} {symbol}",
+                                     *_selectors(inst, f"{where} 商品 {symbol}", errors)))
+    return tuple(result)
+
+
+def compile_policy(val, errors, b_id):
+    where = f"警報 {b_id}"
+    if isinstance(val, list):
+        val = {"tiers": val}
+    if not isinstance(val, dict):
+        errors.append(f"{where}: 格式錯誤，已略過")
+        return None
+    tiers = []
+    for i, t in enumerate(val.get("tiers") or []):
+        if not isinstance(t, dict):
+            errors.append(f"{where} 層級 {i + 1}: 格式錯誤")
+            tiers.append(Tier(None, ""))
+            continue
+        diff = _number(t.get("diff"), None, errors, f"{where} 層級 {i + 1}")
+        tiers.append(Tier(diff if diff else None, _text(t.get("sound"))))   # 0 代表停用
+    return AlertPolicy(tuple(tiers), bool(val.get("sound_enabled", True)),
+                       _number(val.get("hysteresis"), DEFAULT_HYSTERESIS, errors, f"{where} 回差"),
+                       _number(val.get("dwell"), DEFAULT_DWELL, errors, f"{where} 停留秒數"),
+                       int(_number(val.get("max_alerts"), DEFAULT_MAX_ALERTS, errors, f"{where} 警報上限")),
+                       _number(val.get("rate_window"), DEFAULT_RATE_WINDOW, errors, f"{where} 頻率區間",
+                               minimum=1.0))
+
+
+def compile_feed(val, errors):
+    val = val if isinstance(val, dict) else {}
+    address = _text(val.get("address")) or None
+    if address:
+        try:
+            parse_address(address)
+        except ValueError as e:
+            errors.append(f"報價串流: {e}，已停用")
+            address = None
+    web = _text(val.get("web")) or None
+    if web:
+        try:
+            parse_host_port(web)
+        except ValueError:
+            errors.append(f"網頁看板: 無法解析位址 {web!r}，已停用")
+            web = None
+    return FeedSpec(address, _text(val.get("shm")) or None, web, _text(val.get("web_token")) or None)
+
+
+def compile_engine(val, errors):
+    val = val if isinstance(val, dict) else {}
+    layout = _text(val.get("layout")) or DEFAULT_ENGINE["layout"]
+    if layout not in ENGINE_LAYOUTS:
+        count = layout.split(":", 1)[1] if layout.startswith("workers:") else ""
+        if not count.isdigit() or int(count) < 1:
+            errors.append(f"引擎: 未知配置 {layout!r}，使用 {DEFAULT_ENGINE['layout']}")
+            layout = DEFAULT_ENGINE["layout"]
+    return EngineSpec(layout,
+                      _number(val.get("tab_interval"), DEFAULT_ENGINE["tab_interval"], errors, "引擎 分頁間隔"),
+                      _number(val.get("round_interval"), DEFAULT_ENGINE["round_interval"], errors,
+                              "引擎 每輪休息"),
+                      _number(val.get("wait_timeout"), DEFAULT_ENGINE["wait_timeout"], errors, "引擎 等待元素",
+                              minimum=0.1))
+
+
+def compile_config(doc, source=None):
+    """目前版本的設定內容 -> (Config, 錯誤訊息列表)"""
+    errors = []
+    version = doc.get("version", SCHEMA_VERSION)
+    if not isinstance(version, int) or version > SCHEMA_VERSION:
+        errors.append(f"設定檔版本 {version!r} 比程式新 ({SCHEMA_VERSION})，部分設定可能被忽略")
+
+    brokers = doc.get("brokers")
+    brokers = compile_brokers(DEFAULT_BROKERS if brokers is None else brokers, errors)
+
+    alerts = {}
+    raw_alerts = doc.get("alerts") or {}
+    if not isinstance(raw_alerts, dict):
+        errors.append("警報設定格式錯誤，已略過")
+        raw_alerts = {}
+    for b_id, val in raw_alerts.items():
+        policy = compile_policy(val, errors, b_id)
+        if policy is not None: alerts[b_id] = policy
+
+    lines = doc.get("rules") or []
+    if isinstance(lines, str): lines = lines.splitlines()
+    lines = tuple(str(line) for line in lines)
+    specs, rule_errors = parse_rules(lines)
+    errors.extend(f"規則第 {no} 行: {msg}" for no, msg in rule_errors)
+
+    notify = []
+    for i, item in enumerate(doc.get("notify") or []):
+        kind = item.get("type", "") if isinstance(item, dict) else None
+        if kind not in SINK_TYPES:
+            errors.append(f"通知設定第 {i + 1} 筆: 未知類型 {kind!r}，已略過")
+            continue
+        notify.append(MappingProxyType(dict(item)))
+
+    config = Config(SCHEMA_VERSION, brokers, MappingProxyType(alerts), tuple(specs), lines, tuple(notify),
+                    compile_feed(doc.get("feed"), errors), compile_engine(doc.get("engine"), errors), source)
+    return config, errors
+
+
+def load_config(path=DEFAULT_CONFIG):
+    """讀取 (必要時轉換舊版) 並編譯；檔案都不存在時使用預設券商。讀檔 / JSON 錯誤直接拋出"""
+    doc, source = read_document(path)
+    return compile_config(doc if doc is not None else {}, source)
+
+
+# ==========================================
+#    輸出
+# ==========================================
+
+def broker_document(spec):
+    primary = spec.primary
+    doc = {"id": spec.id, "name": spec.name, "url": spec.url,
+           "bid_type": primary.bid_type, "bid_selector": primary.bid_selector,
+           "ask_type": primary.ask_type, "ask_selector": primary.ask_selector}
+    if primary.symbol != DEFAULT_INSTRUMENT: doc["instrument"] = primary.symbol
+    if len(spec.instruments) > 1:
+        doc["instruments"] = [{"symbol": i.symbol, "bid_type": i.bid_type, "bid_selector": i.bid_selector,
+                               "ask_type": i.ask_type, "ask_selector": i.ask_selector}
+                              for i in spec.instruments[1:]]
+    if spec.note: doc["note"] = spec.note
+    return doc
+
+
+def to_document(config):
+    """Config -> 可寫入 JSON 的目前版本內容 (數值欄位已正規化)"""
+    return {
+        "version": SCHEMA_VERSION,
+        "brokers": [broker_document(b) for b in config.brokers],
+        "alerts": {b_id: {"tiers": [{"diff": t.diff, "sound": t.sound} for t in p.tiers],
+                          "sound_enabled": p.sound_enabled, "hysteresis": p.hysteresis, "dwell": p.dwell,
+                          "max_alerts": p.max_alerts, "rate_window": p.rate_window}
+                   for b_id, p in config.alerts.items()},
+        "rules": list(config.rule_lines),
+        "notify": [dict(item) for item in config.notify],
+        "feed": {k: v for k, v in config.feed._asdict().items() if v},
+        "engine": config.engine._asdict(),
+    }
+
+
+def format_number(value):
+    """設定值 -> 介面文字 (None 為空白，整數值不帶 .0)"""
+    if value is None or value == "": return ""
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    return str(value)
+
+
+def main(argv=None):
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description="檢查或轉換監控設定檔")
+    parser.add_argument("action", choices=["check", "migrate"])
+    parser.add_argument("path", nargs="?", default=DEFAULT_CONFIG, help="設定檔 (任何舊版格式皆可)")
+    parser.add_argument("-o", "--output", help="migrate 的輸出檔 (預設輸出到標準輸出)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"找不到 {args.path}", file=sys.stderr)
+        return 2
+    with open(args.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    kind = detect_format(data)
+    config, errors = compile_config(migrate(data), None if kind == "current" else kind)
+    for msg in errors:
+        print(f"! {msg}", file=sys.stderr)
+
+    if args.action == "check":
+        print(f"格式: {kind}，券商 {len(config.brokers)} 個，警報 {len(config.alerts)} 組，"
+              f"規則 {len(config.rules)} 條，通知通道 {len(config.notify)} 個，錯誤 {len(errors)} 項")
+        return 1 if errors else 0
+
+    text = json.dumps(to_document(config), ensure_ascii=False, indent=4)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"已轉換 ({kind}) -> {args.output}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+共識中價與異常報價偵測
+1. 以所有「仍在更新」的券商中價取中位數作為共識中價 (排序陣列 + bisect)
+2. 每個券商學習自己相對共識的慣常基差 (EWMA) 與穩健離散度 (EWMA 絕對殘差)
+3. 偏離超過 K 倍離散度、或共識已移動但自己報價凍結不動者判定為可疑
+4. 連續 RELEARN_SAMPLES 筆偏離且彼此一致 (基差真的改變，而非雜訊) 時重新學習基差，恢復正常
+共識不含券商自己的前一筆中價，避免自己拉動用來檢查自己的基準
+每筆 tick 的成本為 O(log n) 搜尋 + 小量記憶體搬移，券商數增加時仍遠低於 1 毫秒
+"""
+
+import time
+import bisect
+from collections import OrderedDict, namedtuple
+
+# 報價超過此秒數未更新即不納入共識
+DEFAULT_STALE_SECONDS = 15.0
+# 共識至少需要的券商數
+MIN_BROKERS = 3
+# 偏離門檻 (倍數) 與離散度下限 (價格單位)
+DEFAULT_K = 6.0
+MIN_SCALE = 0.05
+# 學習期：樣本數不足前不判定偏離
+WARMUP_SAMPLES = 20
+# EWMA 學習率
+ALPHA = 0.05
+# 基差重新學習：連續此筆數的偏離彼此相差不超過 K 倍離散度，視為基差改變
+RELEARN_SAMPLES = 10
+# 凍結判定：報價不變超過此秒數，且期間共識移動超過此幅度
+FROZEN_SECONDS = 20.0
+FROZEN_MOVE = 0.5
+
+REASON_OK = "正常"
+REASON_DEVIATION = "偏離共識"
+REASON_FROZEN = "報價凍結"
+
+QuoteCheck = namedtuple("QuoteCheck", ["suspect", "reason", "score", "consensus"])
+
+
+class BrokerDeviation:
+    """單一券商相對共識的基差與離散度"""
+    __slots__ = ("mid", "offset", "scale", "samples", "last_ts", "frozen_mid", "frozen_since",
+                 "frozen_consensus", "run_count", "run_sum")
+
+    def __init__(self):
+        self.mid = None
+        self.offset = 0.0
+        self.scale = 0.0
+        self.samples = 0
+        self.last_ts = 0.0
+        self.frozen_mid = None
+        self.frozen_since = 0.0
+        self.frozen_consensus = None
+        # 目前連續偏離的筆數與偏差總和 (判斷是否為一致的基差改變)
+        self.run_count = 0
+        self.run_sum = 0.0
+
+
+class ConsensusEstimator:
+    """
+    用法: check = estimator.update(b_id, bid, ask)
+    check.suspect 為 True 時應排除於警報之外
+    """
+
+    def __init__(self, k=DEFAULT_K, stale_seconds=DEFAULT_STALE_SECONDS, min_brokers=MIN_BROKERS,
+                 min_scale=MIN_SCALE, frozen_seconds=FROZEN_SECONDS, frozen_move=FROZEN_MOVE):
+        self.k = k
+        self.stale_seconds = stale_seconds
+        self.min_brokers = min_brokers
+        self.min_scale = min_scale
+        self.frozen_seconds = frozen_seconds
+        self.frozen_move = frozen_move
+
+        self.sorted_mids = []          # 參與共識的中價 (遞增)
+        self.live = OrderedDict()      # b_id -> mid，依最後更新時間排序 (最舊在前)
+        self.brokers = {}              # b_id -> BrokerDeviation
+
+    # ---------------------------
+    #    共識維護
+    # ---------------------------
+    def _remove_live(self, b_id):
+        mid = self.live.pop(b_id, None)
+        if mid is not None:
+            i = bisect.bisect_left(self.sorted_mids, mid)
+            del self.sorted_mids[i]
+
+    def expire(self, now=None):
+        """移除過久未更新的券商 (最舊的在 OrderedDict 前端，攤銷 O(1))"""
+        if now is None: now = time.time()
+        limit = now - self.stale_seconds
+        while self.live:
+            b_id = next(iter(self.live))
+            if self.brokers[b_id].last_ts > limit: break
+            self._remove_live(b_id)
+
+    def consensus(self):
+        n = len(self.sorted_mids)
+        if n < self.min_brokers: return None
+        half = n // 2
+        if n % 2:
+            return self.sorted_mids[half]
+        return (self.sorted_mids[half - 1] + self.sorted_mids[half]) / 2.0
+
+    def remove(self, b_id):
+        self._remove_live(b_id)
+        self.brokers.pop(b_id, None)
+
+    # ---------------------------
+    #    每筆 tick
+    # ---------------------------
+    def update(self, b_id, bid, ask, ts=None):
+        if ts is None: ts = time.time()
+        mid = (bid + ask) / 2.0
+
+        state = self.brokers.get(b_id)
+        if state is None:
+            state = BrokerDeviation()
+            self.brokers[b_id] = state
+        state.last_ts = ts
+        state.mid = mid
+
+        # 先移除自己的前一筆中價，再以其他券商的共識評分
+        self._remove_live(b_id)
+        self.expire(ts)
+        cons = self.consensus()
+        check = self._score(state, mid, cons, ts)
+
+        # 可疑報價不納入共識，避免單一故障拉動中位數
+        if not check.suspect:
+            self.live[b_id] = mid
+            bisect.insort(self.sorted_mids, mid)
+        return check
+
+    def _score(self, state, mid, cons, ts):
+        if cons is None:
+            state.frozen_mid = None
+            return QuoteCheck(False, REASON_OK, 0.0, None)
+
+        # 凍結偵測：中價未變但共識已明顯移動
+        if state.frozen_mid is None or mid != state.frozen_mid:
+            state.frozen_mid = mid
+            state.frozen_since = ts
+            state.frozen_consensus = cons
+        elif (ts - state.frozen_since >= self.frozen_seconds
+              and abs(cons - state.frozen_consensus) >= self.frozen_move):
+            return QuoteCheck(True, REASON_FROZEN, 0.0, cons)
+
+        dev = mid - cons
+        resid = dev - state.offset
+        scale = max(state.scale, self.min_scale)
+        score = abs(resid) / scale
+
+        if state.samples >= WARMUP_SAMPLES and score > self.k:
+            # 可疑樣本不更新基差，避免被故障值帶走；但持續且一致的偏離代表基差真的改變
+            if state.run_count and abs(dev - state.run_sum / state.run_count) > self.k * scale:
+                state.run_count, state.run_sum = 0, 0.0
+            state.run_count += 1
+            state.run_sum += dev
+            if state.run_count < RELEARN_SAMPLES:
+                return QuoteCheck(True, REASON_DEVIATION, score, cons)
+            # 以這段偏離的平均重新設定基差，離散度保留
+            state.offset = state.run_sum / state.run_count
+            resid = dev - state.offset
+            score = abs(resid) / scale
+
+        state.run_count, state.run_sum = 0, 0.0
+        if state.samples == 0:
+            state.offset = dev
+        else:
+            state.offset += ALPHA * resid
+            state.scale += ALPHA * (abs(resid) - state.scale)
+        state.samples += 1
+        return QuoteCheck(False, REASON_OK, score, cons)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+跨券商合併報價簿 (Consolidated BBO)
+1. 以索引堆積 (indexed heap) 維護全市場最佳 Bid (最大) 與最佳 Ask (最小)
+2. 每筆 tick 更新為 O(log n)，過期報價依時間自動移除
+3. 偵測交叉 (某券商 Bid > 另一券商 Ask) 與鎖價 (相等) 並追蹤持續時間
+"""
+
+import time
+
+# 報價超過此秒數未更新視為過期，自動從報價簿移除
+DEFAULT_STALE_SECONDS = 15.0
+
+# 交叉狀態
+STATE_NORMAL = "正常"
+STATE_LOCKED = "鎖價"
+STATE_CROSSED = "交叉"
+
+
+class IndexedHeap:
+    """
+    附位置索引的二元堆積，支援以 key 直接更新/刪除 (O(log n))
+    sign=1 為最小堆，sign=-1 為最大堆
+    """
+
+    def __init__(self, sign=1):
+        self.sign = sign
+        self.heap = []  # [(排序值, key)]
+        self.pos = {}   # key -> heap index
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, key):
+        return key in self.pos
+
+    def peek(self):
+        """回傳 (key, 原始值)，空堆回傳 (None, None)"""
+        if not self.heap: return None, None
+        v, key = self.heap[0]
+        return key, v * self.sign
+
+    def push(self, key, value):
+        """新增或更新 key 的值"""
+        v = value * self.sign
+        if key in self.pos:
+            i = self.pos[key]
+            old = self.heap[i][0]
+            self.heap[i] = (v, key)
+            if v < old:
+                self._sift_up(i)
+            else:
+                self._sift_down(i)
+        else:
+            self.heap.append((v, key))
+            i = len(self.heap) - 1
+            self.pos[key] = i
+            self._sift_up(i)
+
+    def remove(self, key):
+        i = self.pos.pop(key, None)
+        if i is None: return
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.pos[last[1]] = i
+            self._sift_up(i)
+            self._sift_down(self.pos[last[1]])
+
+    def _swap(self, i, j):
+        h = self.heap
+        h[i], h[j] = h[j], h[i]
+        self.pos[h[i][1]] = i
+        self.pos[h[j][1]] = j
+
+    def _sift_up(self, i):
+        h = self.heap
+        while i > 0:
+            parent = (i - 1) >> 1
+            if h[i][0] < h[parent][0]:
+                self._swap(i, parent)
+                i = parent
+            else:
+                break
+
+    def _sift_down(self, i):
+        h = self.heap
+        n = len(h)
+        while True:
+            left = 2 * i + 1
+            smallest = i
+            if left < n and h[left][0] < h[smallest][0]:
+                smallest = left
+            if left + 1 < n and h[left + 1][0] < h[smallest][0]:
+                smallest = left + 1
+            if smallest == i:
+                break
+            self._swap(i, smallest)
+            i = smallest
+
+
+class ConsolidatedBook:
+    """
+    全券商合併報價簿
+    用法: events = book.update(b_id, bid, ask)；book.best() 取得目前 BBO
+    update/expire 回傳交叉狀態變化事件 (dict)，無變化時回傳空列表
+    """
+
+    def __init__(self, stale_seconds=DEFAULT_STALE_SECONDS):
+        self.stale_seconds = stale_seconds
+        self.bids = IndexedHeap(sign=-1)
+        self.asks = IndexedHeap(sign=1)
+        self.ages = IndexedHeap(sign=1)  # 依最後更新時間排序，最舊者在頂端
+        self.quotes = {}  # b_id -> (bid, ask, ts)
+
+        self.state = STATE_NORMAL
+        self.state_since = None
+        self.cross_pair = (None, None)  # (Bid 最高券商, Ask 最低券商)
+
+    def update(self, b_id, bid, ask, ts=None):
+        if ts is None: ts = time.time()
+        if bid <= 0 or ask <= 0:
+            return self.remove(b_id, ts)
+        self.quotes[b_id] = (bid, ask, ts)
+        self.bids.push(b_id, bid)
+        self.asks.push(b_id, ask)
+        self.ages.push(b_id, ts)
+        events = self.expire(ts, evaluate=False)
+        return events + self._evaluate(ts)
+
+    def remove(self, b_id, ts=None):
+        if ts is None: ts = time.time()
+        if b_id not in self.quotes: return []
+        self._drop(b_id)
+        return self._evaluate(ts)
+
+    def _drop(self, b_id):
+        self.quotes.pop(b_id, None)
+        self.bids.remove(b_id)
+        self.asks.remove(b_id)
+        self.ages.remove(b_id)
+
+    def expire(self, now=None, evaluate=True):
+        """移除過期報價 (每個過期券商 O(log n))"""
+        if now is None: now = time.time()
+        limit = now - self.stale_seconds
+        dropped = False
+        while len(self.ages):
+            key, ts = self.ages.peek()
+            if ts > limit: break
+            self._drop(key)
+            dropped = True
+        if dropped and evaluate:
+            return self._evaluate(now)
+        return []
+
+    def best(self):
+        """回傳 (best_bid, bid_broker, best_ask, ask_broker)"""
+        bid_key, best_bid = self.bids.peek()
+        ask_key, best_ask = self.asks.peek()
+        return best_bid, bid_key, best_ask, ask_key
+
+    def state_duration(self, now=None):
+        if self.state_since is None: return 0.0
+        if now is None: now = time.time()
+        return now - self.state_since
+
+    def _evaluate(self, ts):
+        best_bid, bid_key, best_ask, ask_key = self.best()
+        new_state = STATE_NORMAL
+        # 同一券商自身 Bid/Ask 不構成跨券商交叉
+        if bid_key is not None and ask_key is not None and bid_key != ask_key:
+            if best_bid > best_ask:
+                new_state = STATE_CROSSED
+            elif best_bid == best_ask:
+                new_state = STATE_LOCKED
+
+        if new_state == self.state:
+            if new_state != STATE_NORMAL:
+                self.cross_pair = (bid_key, ask_key)
+            return []
+
+        events = []
+        if self.state != STATE_NORMAL:
+            events.append({
+                "type": "end", "state": self.state, "bid_broker": self.cross_pair[0],
+                "ask_broker": self.cross_pair[1], "duration": ts - self.state_since,
+            })
+        self.state = new_state
+        if new_state != STATE_NORMAL:
+            self.state_since = ts
+            self.cross_pair = (bid_key, ask_key)
+            events.append({
+                "type": "start", "state": new_state, "bid_broker": bid_key, "ask_broker": ask_key,
+                "bid": best_bid, "ask": best_ask, "duration": 0.0,
+            })
+        else:
+            self.state_since = None
+            self.cross_pair = (None, None)
+        return events
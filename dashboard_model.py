@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+監控表格 Model (Model/View)
+1. 券商狀態存放在緊湊的欄位陣列 (array('d') 數值 + 字串列表)，tick 進來只改陣列
+2. 變更以「髒區塊」(最小外接矩形) 記錄，由計時器每幀送出一次 dataChanged (預設 20 Hz)
+3. 文字格式化只在 view 實際繪製可見儲存格時 (data()) 才做
+4. SORT_ROLE 提供原始數值給 QSortFilterProxyModel 做即時排序 (dynamicSortFilter 只重新排序有變動的列)
+每秒數千筆 tick 也只會觸發每秒 10~30 次重繪
+"""
+
+import math
+from array import array
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer, pyqtSignal
+from PyQt6.QtGui import QColor, QFont
+
+from config_schema import split_key
+from spread_stats import instrument_decimals
+
+# 欄位
+COL_NAME, COL_BID, COL_ASK, COL_SPREAD, COL_VS_MEDIAN, COL_RANK, COL_TIME, COL_STATUS, COL_SOUND = range(9)
+HEADERS = ["券商 (Broker)", "Bid (賣出)", "Ask (買入)", "點差 (Spread)", "對1h中位數", "百分位(1h)",
+           "最後更新", "狀態", "音效"]
+
+DEFAULT_FPS = 20
+MIN_FPS = 10
+MAX_FPS = 30
+
+COLOR_OK = "#4ec9b0"
+COLOR_ERROR = "#f44747"
+COLOR_SUSPECT = "#ff9800"
+
+NAN = float("nan")
+
+# 排序用的原始數值 (數值欄位為 float，名稱欄位為原始順序，更新時間欄位為時間戳)
+SORT_ROLE = Qt.ItemDataRole.UserRole
+
+# 排序模式: (顯示名稱, 欄位, 排序方向)
+SORT_MODES = [
+    ("券商順序", COL_NAME, Qt.SortOrder.AscendingOrder),
+    ("點差 (大→小)", COL_SPREAD, Qt.SortOrder.DescendingOrder),
+    ("偏離中位數 (大→小)", COL_VS_MEDIAN, Qt.SortOrder.DescendingOrder),
+    ("報價延遲 (久→新)", COL_TIME, Qt.SortOrder.AscendingOrder),
+]
+
+
+class BrokerDashboardModel(QAbstractTableModel):
+    sound_toggled = pyqtSignal(str, bool)  # (b_id, 是否開啟)
+
+    def __init__(self, parent=None, fps=DEFAULT_FPS):
+        super().__init__(parent)
+        self.ids = []
+        self.names = []
+        self.formats = []  # 各列報價的顯示格式 (依商品小數位數)
+        self.bid = array("d")
+        self.ask = array("d")
+        self.spread = array("d")
+        self.vs_median = array("d")
+        self.rank = array("d")
+        self.times = []
+        self.updated = array("d")  # 最後更新時間戳 (報價延遲排序)
+        self.status = []
+        self.status_color = []
+        self.alert = bytearray()
+        self.sound = bytearray()
+        self.dirty = None  # (r0, r1, c0, c1)
+
+        self.font_name = QFont("Microsoft JhengHei", 11, QFont.Weight.Bold)
+        self.font_price = QFont("Arial", 14)
+        self.font_spread = QFont("Arial", 16, QFont.Weight.Bold)
+        self.colors = {c: QColor(c) for c in (COLOR_OK, COLOR_ERROR, COLOR_SUSPECT, "#dcdcaa")}
+        self.bg_alert = QColor("#660000")
+        self.bg_normal = QColor("#252526")
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        fps = min(max(int(fps), MIN_FPS), MAX_FPS)
+        self.timer.start(int(1000 / fps))
+
+    # ==========================================
+    #  資料寫入 (只改陣列，標記髒區塊)
+    # ==========================================
+
+    def set_brokers(self, brokers, sound_enabled=None):
+        """brokers: [(b_id, name)]；sound_enabled: {b_id: bool}；保留的券商沿用目前的報價與狀態"""
+        sound_enabled = sound_enabled or {}
+        old = {b_id: i for i, b_id in enumerate(self.ids)}
+        keep = [old.get(b) for b, _ in brokers]
+
+        def carry(values, blank):
+            return [values[i] if i is not None else blank for i in keep]
+
+        self.beginResetModel()
+        self.ids = [b for b, _ in brokers]
+        self.names = [name for _, name in brokers]
+        self.formats = ["{:.%df}" % instrument_decimals(split_key(b)[1]) for b in self.ids]
+        self.bid = array("d", carry(self.bid, NAN))
+        self.ask = array("d", carry(self.ask, NAN))
+        self.spread = array("d", carry(self.spread, NAN))
+        self.vs_median = array("d", carry(self.vs_median, NAN))
+        self.rank = array("d", carry(self.rank, NAN))
+        self.times = carry(self.times, "--")
+        self.updated = array("d", carry(self.updated, 0.0))
+        self.status = carry(self.status, "--")
+        self.status_color = carry(self.status_color, None)
+        self.alert = bytearray(carry(self.alert, 0))
+        self.sound = bytearray(1 if sound_enabled.get(b, True) else 0 for b in self.ids)
+        self.dirty = None
+        self.endResetModel()
+
+    def _mark(self, row, c0, c1):
+        d = self.dirty
+        if d is None:
+            self.dirty = (row, row, c0, c1)
+        else:
+            self.dirty = (min(d[0], row), max(d[1], row), min(d[2], c0), max(d[3], c1))
+
+    def update_quote(self, row, bid, ask, time_str, ts=0.0):
+        self.bid[row] = bid
+        self.ask[row] = ask
+        self.spread[row] = abs(ask - bid)
+        self.times[row] = time_str
+        self.updated[row] = ts
+        self._mark(row, COL_BID, COL_TIME)
+
+    def update_stats(self, row, vs_median, rank):
+        self.vs_median[row] = vs_median
+        self.rank[row] = rank
+        self._mark(row, COL_VS_MEDIAN, COL_RANK)
+
+    def set_status(self, row, text, color=COLOR_OK):
+        if self.status[row] == text and self.status_color[row] == color: return
+        self.status[row] = text
+        self.status_color[row] = color
+        self._mark(row, COL_STATUS, COL_STATUS)
+
+    def set_alert(self, row, active):
+        active = 1 if active else 0
+        if self.alert[row] == active: return
+        self.alert[row] = active
+        self._mark(row, COL_SPREAD, COL_SPREAD)
+
+    def flush(self):
+        """每幀一次：送出髒區塊的 dataChanged"""
+        d = self.dirty
+        if d is None: return
+        self.dirty = None
+        self.dataChanged.emit(self.index(d[0], d[2]), self.index(d[1], d[3]))
+
+    # ==========================================
+    #  Qt Model 介面
+    # ==========================================
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def flags(self, index):
+        base = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() == COL_SOUND:
+            return base | Qt.ItemFlag.ItemIsUserCheckable
+        return base
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        row, col = index.row(), index.column()
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == COL_NAME: return self.names[row]
+            if col == COL_BID: return _fmt(self.bid[row], self.formats[row])
+            if col == COL_ASK: return _fmt(self.ask[row], self.formats[row])
+            if col == COL_SPREAD: return _fmt(self.spread[row], self.formats[row])
+            if col == COL_VS_MEDIAN: return _fmt(self.vs_median[row], "{:.2f}x")
+            if col == COL_RANK: return _fmt(self.rank[row], "{:.0f}%")
+            if col == COL_TIME: return self.times[row]
+            if col == COL_STATUS: return self.status[row]
+            return None
+        if role == SORT_ROLE:
+            if col == COL_NAME: return row
+            if col == COL_BID: return _key(self.bid[row])
+            if col == COL_ASK: return _key(self.ask[row])
+            if col == COL_SPREAD: return _key(self.spread[row])
+            if col == COL_VS_MEDIAN: return _key(self.vs_median[row])
+            if col == COL_RANK: return _key(self.rank[row])
+            if col == COL_TIME: return self.updated[row]
+            if col == COL_STATUS: return self.status[row]
+            return self.sound[row]
+        if role == Qt.ItemDataRole.CheckStateRole and col == COL_SOUND:
+            return Qt.CheckState.Checked if self.sound[row] else Qt.CheckState.Unchecked
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return Qt.AlignmentFlag.AlignCenter
+        if role == Qt.ItemDataRole.ForegroundRole:
+            if col == COL_BID: return self.colors[COLOR_OK]
+            if col == COL_ASK: return self.colors[COLOR_ERROR]
+            if col == COL_SPREAD: return self.colors["#dcdcaa"]
+            if col == COL_STATUS and self.status_color[row]:
+                return self.colors.get(self.status_color[row]) or QColor(self.status_color[row])
+            return None
+        if role == Qt.ItemDataRole.BackgroundRole and col == COL_SPREAD:
+            return self.bg_alert if self.alert[row] else self.bg_normal
+        if role == Qt.ItemDataRole.FontRole:
+            if col == COL_NAME: return self.font_name
+            if col in (COL_BID, COL_ASK): return self.font_price
+            if col == COL_SPREAD: return self.font_spread
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role != Qt.ItemDataRole.CheckStateRole or index.column() != COL_SOUND: return False
+        row = index.row()
+        checked = Qt.CheckState(value) == Qt.CheckState.Checked
+        self.sound[row] = 1 if checked else 0
+        self.dataChanged.emit(index, index)
+        self.sound_toggled.emit(self.ids[row], checked)
+        return True
+
+
+def _fmt(value, pattern):
+    return "--" if math.isnan(value) else pattern.format(value)
+
+
+def _key(value):
+    # 尚無資料的列排在最後 (由大到小排序時)
+    return -math.inf if math.isnan(value) else value
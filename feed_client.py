@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+本機報價 / 警報串流的客戶端 (只依賴標準函式庫，其他工具可直接複製使用)
+伺服端見 tick_feed.py；由 S.py 或 monitor_daemon.py (--feed) 發布
+
+位址格式:
+    tcp:127.0.0.1:7410          (預設)
+    unix:/tmp/spread_feed.sock  (Linux / macOS)
+
+訊框 (little-endian): [類型 1 byte][長度 2 bytes][內容]
+    TICK    <dddB> ts, bid, ask, flags(1=可疑)  + 券商 + 商品
+    ALERT   <dbbddB> ts, 層級, 前一層級, 點差, 門檻, flags(1=觸發, 2=被頻率上限過濾) + 券商 + 商品
+    RULE    <dBd> ts, 是否成立, 數值 + 券商 + 規則文字 + 商品
+    STATUS  <d> ts + 券商 + 狀態文字 + 商品
+    HELLO / SUBSCRIBE  JSON (UTF-8)
+    字串: 券商 / 商品為 [1 byte 長度][UTF-8]，規則 / 狀態文字為 [2 bytes 長度][UTF-8]
+    RULE / STATUS 尾端的商品為後來加入的欄位，舊版伺服器沒有時視為 XAUUSD
+
+用法:
+    from feed_client import FeedClient
+    with FeedClient(brokers=["WF", "IG"], kinds=["tick", "alert"]) as feed:
+        for msg in feed:
+            print(msg)
+"""
+
+import json
+import socket
+import struct
+from collections import namedtuple
+
+DEFAULT_ADDRESS = "tcp:127.0.0.1:7410"
+DEFAULT_INSTRUMENT = "XAUUSD"
+PROTOCOL_VERSION = 1
+
+MSG_TICK, MSG_ALERT, MSG_RULE, MSG_STATUS = 1, 2, 3, 4
+MSG_HELLO, MSG_SUBSCRIBE = 16, 17
+
+KINDS = {"tick": MSG_TICK, "alert": MSG_ALERT, "rule": MSG_RULE, "status": MSG_STATUS}
+
+FLAG_SUSPECT = 1
+FLAG_FIRED, FLAG_SUPPRESSED = 1, 2
+
+HEADER = struct.Struct("<BH")
+TICK = struct.Struct("<dddB")
+ALERT = struct.Struct("<dbbddB")
+RULE = struct.Struct("<dBd")
+STATUS = struct.Struct("<d")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+
+MAX_PAYLOAD = 0xFFFF
+
+Tick = namedtuple("Tick", ["ts", "broker", "instrument", "bid", "ask", "suspect"])
+Alert = namedtuple("Alert", ["ts", "broker", "instrument", "level", "prev_level", "spread", "threshold",
+                             "fired", "suppressed"])
+Rule = namedtuple("Rule", ["ts", "broker", "rule", "active", "value", "instrument"])
+Status = namedtuple("Status", ["ts", "broker", "message", "instrument"])
+Hello = namedtuple("Hello", ["info"])
+
+
+def parse_address(address):
+    """回傳 (family, 位址)；family 為 unix 或 tcp"""
+    kind, _, rest = address.partition(":")
+    if kind == "unix":
+        return "unix", rest
+    if kind == "tcp":
+        host, _, port = rest.rpartition(":")
+        return "tcp", (host or "127.0.0.1", int(port))
+    raise ValueError(f"無法解析位址: {address}")
+
+
+# ==========================================
+#  編碼
+# ==========================================
+
+def _short(text):
+    raw = str(text).encode("utf-8")[:255]
+    return _U8.pack(len(raw)) + raw
+
+
+def _long(text):
+    raw = str(text).encode("utf-8")[:MAX_PAYLOAD - 64]
+    return _U16.pack(len(raw)) + raw
+
+
+def frame(msg_type, payload):
+    return HEADER.pack(msg_type, len(payload)) + payload
+
+
+def encode_tick(ts, broker, bid, ask, instrument=DEFAULT_INSTRUMENT, suspect=False):
+    return frame(MSG_TICK, TICK.pack(ts, bid, ask, FLAG_SUSPECT if suspect else 0)
+                 + _short(broker) + _short(instrument))
+
+
+def encode_alert(ts, broker, level, prev_level, spread, threshold, fired, suppressed=False,
+                 instrument=DEFAULT_INSTRUMENT):
+    flags = (FLAG_FIRED if fired else 0) | (FLAG_SUPPRESSED if suppressed else 0)
+    return frame(MSG_ALERT, ALERT.pack(ts, level, prev_level, spread, threshold, flags)
+                 + _short(broker) + _short(instrument))
+
+
+def encode_rule(ts, broker, rule, active, value, instrument=DEFAULT_INSTRUMENT):
+    return frame(MSG_RULE, RULE.pack(ts, 1 if active else 0, value) + _short(broker) + _long(rule)
+                 + _short(instrument))
+
+
+def encode_status(ts, broker, message, instrument=DEFAULT_INSTRUMENT):
+    return frame(MSG_STATUS, STATUS.pack(ts) + _short(broker) + _long(message) + _short(instrument))
+
+
+def encode_json(msg_type, data):
+    return frame(msg_type, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+# ==========================================
+#  解碼
+# ==========================================
+
+def _read_short(buf, pos):
+    n = buf[pos]
+    return buf[pos + 1:pos + 1 + n].decode("utf-8", "replace"), pos + 1 + n
+
+
+def _read_long(buf, pos):
+    n = _U16.unpack_from(buf, pos)[0]
+    return buf[pos + 2:pos + 2 + n].decode("utf-8", "replace"), pos + 2 + n
+
+
+def _read_instrument(buf, pos):
+    return _read_short(buf, pos)[0] if pos < len(buf) else DEFAULT_INSTRUMENT
+
+
+def decode(msg_type, payload):
+    """解碼單一訊框內容；未知類型回傳 None (新版伺服器的新訊息可忽略)"""
+    if msg_type == MSG_TICK:
+        ts, bid, ask, flags = TICK.unpack_from(payload, 0)
+        broker, pos = _read_short(payload, TICK.size)
+        instrument, _ = _read_short(payload, pos)
+        return Tick(ts, broker, instrument, bid, ask, bool(flags & FLAG_SUSPECT))
+    if msg_type == MSG_ALERT:
+        ts, level, prev, spread, threshold, flags = ALERT.unpack_from(payload, 0)
+        broker, pos = _read_short(payload, ALERT.size)
+        instrument, _ = _read_short(payload, pos)
+        return Alert(ts, broker, instrument, level, prev, spread, threshold,
+                     bool(flags & FLAG_FIRED), bool(flags & FLAG_SUPPRESSED))
+    if msg_type == MSG_RULE:
+        ts, active, value = RULE.unpack_from(payload, 0)
+        broker, pos = _read_short(payload, RULE.size)
+        rule, pos = _read_long(payload, pos)
+        return Rule(ts, broker, rule, bool(active), value, _read_instrument(payload, pos))
+    if msg_type == MSG_STATUS:
+        ts, = STATUS.unpack_from(payload, 0)
+        broker, pos = _read_short(payload, STATUS.size)
+        message, pos = _read_long(payload, pos)
+        return Status(ts, broker, message, _read_instrument(payload, pos))
+    if msg_type in (MSG_HELLO, MSG_SUBSCRIBE):
+        return Hello(json.loads(payload.decode("utf-8")))
+    return None
+
+
+class FrameReader:
+    """累積收到的位元組並切出完整訊框"""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        self.buf += data
+
+    def frames(self):
+        buf = self.buf
+        pos = 0
+        while len(buf) - pos >= HEADER.size:
+            msg_type, length = HEADER.unpack_from(buf, pos)
+            end = pos + HEADER.size + length
+            if end > len(buf): break
+            yield msg_type, bytes(buf[pos + HEADER.size:end])
+            pos = end
+        if pos: del buf[:pos]
+
+
+# ==========================================
+#  客戶端
+# ==========================================
+
+class FeedClient:
+    """
+    阻塞式客戶端；brokers / instruments / kinds 為 None 代表全部
+    伺服端送不出去 (客戶端處理太慢) 時會直接斷線，迭代隨之結束，需自行重連
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, brokers=None, instruments=None, kinds=None, timeout=None):
+        self.address = address
+        self.filters = {"brokers": brokers, "instruments": instruments, "kinds": kinds}
+        self.timeout = timeout
+        self.sock = None
+        self.reader = FrameReader()
+        self.pending = []
+        self.info = {}
+
+    def connect(self):
+        family, addr = parse_address(self.address)
+        sock = socket.socket(socket.AF_UNIX if family == "unix" else socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(addr)
+        if family == "tcp":
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.subscribe(**self.filters)
+        return self
+
+    def subscribe(self, brokers=None, instruments=None, kinds=None):
+        """更新篩選條件 (連線中也可呼叫)"""
+        self.filters = {"brokers": brokers, "instruments": instruments, "kinds": kinds}
+        data = {k: list(v) for k, v in self.filters.items() if v is not None}
+        self.sock.sendall(encode_json(MSG_SUBSCRIBE, data))
+
+    def recv(self):
+        """下一則訊息；連線關閉時回傳 None (逾時拋出 socket.timeout)"""
+        while not self.pending:
+            chunk = self.sock.recv(65536)
+            if not chunk: return None
+            self.reader.feed(chunk)
+            for msg_type, payload in self.reader.frames():
+                msg = decode(msg_type, payload)
+                if isinstance(msg, Hello):
+                    self.info = msg.info
+                elif msg is not None:
+                    self.pending.append(msg)
+            self.pending.reverse()
+        return self.pending.pop()
+
+    def __iter__(self):
+        while True:
+            msg = self.recv()
+            if msg is None: return
+            yield msg
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="訂閱本機報價串流並印出")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS)
+    parser.add_argument("--broker", action="append", help="只接收指定券商 (可重複)")
+    parser.add_argument("--instrument", action="append", help="只接收指定商品 (可重複)")
+    parser.add_argument("--kind", action="append", choices=list(KINDS), help="只接收指定類型 (可重複)")
+    args = parser.parse_args(argv)
+    with FeedClient(args.address, args.broker, args.instrument, args.kind) as feed:
+        for msg in feed:
+            print(msg, flush=True)
+    print("連線已關閉")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+跨券商領先/落後 (Lead/Lag) 與報價延遲分析
+讀取 TickRecorder 的 CSV 紀錄，全部以 NumPy 向量化運算：
+1. 將各券商中價重採樣到共同時間網格 (前值填補，過久未更新視為缺值)
+2. 以「排除自身」的其他券商中位數作為共識中價
+3. 計算各券商中價變動與共識變動的滯後互相關，取峰值作為典型延遲
+紀錄以報價代號區分商品 (見 config_schema.stream_key)，不同商品價格尺度不同，每個商品各算一張表
+
+用法:
+    python lead_lag.py ticks/ticks_20260101.csv ticks/ticks_20260102.csv --step 0.5 --max-lag 30
+"""
+
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config_schema import split_key
+
+# 預設重採樣間隔 (秒) 與最大搜尋延遲 (秒)
+DEFAULT_STEP = 0.5
+DEFAULT_MAX_LAG = 30.0
+
+# 報價超過此秒數未更新，在網格上視為缺值
+DEFAULT_MAX_GAP = 30.0
+
+
+def load_ticks(paths):
+    """讀取一或多個 tick CSV，回傳 {券商: (ts 陣列, mid 陣列)} (依時間排序)"""
+    frames = [pd.read_csv(p, usecols=["ts", "source", "bid", "ask"]) for p in paths]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    df = df[(df["bid"] > 0) & (df["ask"] > 0)]
+    df = df.sort_values("ts", kind="mergesort")
+
+    result = {}
+    for source, g in df.groupby("source", sort=True):
+        ts = g["ts"].to_numpy(dtype=np.float64)
+        mid = ((g["bid"] + g["ask"]) / 2.0).to_numpy(dtype=np.float64)
+        result[str(source)] = (ts, mid)
+    return result
+
+
+def group_by_instrument(ticks):
+    """{報價代號: 資料} -> {商品: {報價代號: 資料}} (商品依名稱排序)"""
+    groups = {}
+    for key in sorted(ticks):
+        groups.setdefault(split_key(key)[1], {})[key] = ticks[key]
+    return dict(sorted(groups.items()))
+
+
+def resample(ts, values, grid, max_gap=DEFAULT_MAX_GAP):
+    """前值填補重採樣；網格點前沒有報價或報價太舊時為 NaN"""
+    idx = np.searchsorted(ts, grid, side="right") - 1
+    out = values[np.clip(idx, 0, None)].astype(np.float64)
+    invalid = idx < 0
+    invalid |= (grid - ts[np.clip(idx, 0, None)]) > max_gap
+    out[invalid] = np.nan
+    return out
+
+
+def build_grid(ticks, step=DEFAULT_STEP):
+    """建立共同時間網格，回傳 (券商列表, 網格, 中價矩陣[券商 x 時間])；ticks 須為同一商品"""
+    brokers = sorted(ticks.keys())
+    t0 = min(ticks[b][0][0] for b in brokers)
+    t1 = max(ticks[b][0][-1] for b in brokers)
+    grid = np.arange(t0, t1 + step, step)
+    matrix = np.vstack([resample(ticks[b][0], ticks[b][1], grid) for b in brokers])
+    return brokers, grid, matrix
+
+
+def consensus_excluding(matrix):
+    """
+    每個券商「排除自身」後的中位數共識 (避免自己和自己相關)，回傳與 matrix 同形狀的矩陣
+    每個時間點只排序一次：移除第 r 名後，剩下 m 個值的第 j 名即排序後的第 j 名 (j < r) 或第 j + 1 名，
+    中位數直接由相鄰的順序統計量取得，成本 O(B log B) / 時間點，不必對每個券商重算 nanmedian
+    """
+    n_rows = matrix.shape[0]
+    order = np.argsort(matrix, axis=0, kind="stable")      # NaN 排在最後
+    ordered = np.take_along_axis(matrix, order, axis=0)
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(n_rows)[:, None], axis=0)
+
+    valid = np.isfinite(matrix)
+    counts = valid.sum(axis=0)
+    m = counts - valid                                      # 排除自身後的有效報價數
+    ranks = np.where(valid, ranks, n_rows)                  # 自身為缺值時不需要跳過任何名次
+    lo, hi = (m - 1) // 2, m // 2
+    lo = lo + (lo >= ranks)
+    hi = hi + (hi >= ranks)
+
+    cols = np.arange(matrix.shape[1])
+    empty = m <= 0
+    lo[empty] = hi[empty] = 0
+    result = (ordered[lo, cols] + ordered[hi, cols]) * 0.5
+    result[empty] = np.nan
+    return result
+
+
+def lagged_xcorr(x, y, max_shift):
+    """
+    x[t] 與 y[t - k] 的相關係數，k = -max_shift..max_shift
+    k > 0 代表 x 落後 y (y 先動、x 後動)
+    以 FFT 一次算出所有延遲，成本 O(N log N) 與 max_shift 無關
+    """
+    n = x.size
+    shifts = np.arange(-max_shift, max_shift + 1)
+    x = x - x.mean()
+    y = y - y.mean()
+    denom = np.sqrt(np.dot(x, x) * np.dot(y, y))
+    if n < 3 or denom == 0:
+        return shifts, np.full(shifts.size, np.nan)
+
+    nfft = 1 << int(2 * n - 1).bit_length()
+    cc = np.fft.irfft(np.fft.rfft(x, nfft) * np.conj(np.fft.rfft(y, nfft)), nfft)
+    # cc[k] = sum x[t] * y[t - k]；負延遲位於陣列尾端
+    corr = cc[shifts % nfft] / denom
+    return shifts, corr
+
+
+def refine_peak(shifts, corr, i):
+    """三點拋物線內插，取得小於一個網格的峰值位置"""
+    if 0 < i < corr.size - 1 and np.isfinite(corr[i - 1]) and np.isfinite(corr[i + 1]):
+        y0, y1, y2 = corr[i - 1], corr[i], corr[i + 1]
+        denom = y0 - 2 * y1 + y2
+        if denom != 0:
+            return shifts[i] + 0.5 * (y0 - y2) / denom
+    return float(shifts[i])
+
+
+def lag_table(ticks, step=DEFAULT_STEP, max_lag=DEFAULT_MAX_LAG):
+    """
+    計算每個券商相對共識中價的延遲 (ticks 須為同一商品，見 group_by_instrument)
+    回傳 list[dict]: broker, lag_seconds (>0 代表落後), peak_corr, corr_at_zero, changes, coverage
+    """
+    brokers, grid, matrix = build_grid(ticks, step)
+    max_shift = int(round(max_lag / step))
+    consensus = consensus_excluding(matrix)
+    rows = []
+
+    for i, broker in enumerate(brokers):
+        own = matrix[i]
+        cons = consensus[i]
+
+        # 中價變動序列；缺值視為「沒有變動」
+        d_own = np.nan_to_num(np.diff(own), nan=0.0)
+        d_cons = np.nan_to_num(np.diff(cons), nan=0.0)
+
+        shifts, corr = lagged_xcorr(d_own, d_cons, max_shift)
+        if np.all(np.isnan(corr)):
+            peak_i = max_shift
+        else:
+            peak_i = int(np.nanargmax(corr))
+
+        rows.append({
+            "broker": broker,
+            "lag_seconds": refine_peak(shifts, corr, peak_i) * step,
+            "peak_corr": float(corr[peak_i]) if np.isfinite(corr[peak_i]) else 0.0,
+            "corr_at_zero": float(corr[max_shift]) if np.isfinite(corr[max_shift]) else 0.0,
+            "changes": int(np.count_nonzero(d_own)),
+            "coverage": float(np.mean(np.isfinite(own))),
+        })
+
+    rows.sort(key=lambda r: r["lag_seconds"])
+    return rows
+
+
+def format_table(rows):
+    lines = [f"{'券商':<12}{'延遲(秒)':>10}{'峰值相關':>10}{'零延遲相關':>12}{'變動次數':>10}{'覆蓋率':>8}"]
+    for r in rows:
+        lines.append(f"{r['broker']:<12}{r['lag_seconds']:>10.2f}{r['peak_corr']:>10.3f}"
+                     f"{r['corr_at_zero']:>12.3f}{r['changes']:>10d}{r['coverage']:>8.1%}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="跨券商報價延遲分析")
+    parser.add_argument("files", nargs="+", help="tick CSV 檔 (ticks/ticks_<日期>.csv)")
+    parser.add_argument("--step", type=float, default=DEFAULT_STEP, help="重採樣間隔 (秒)")
+    parser.add_argument("--max-lag", type=float, default=DEFAULT_MAX_LAG, help="最大搜尋延遲 (秒)")
+    args = parser.parse_args(argv)
+
+    groups = group_by_instrument(load_ticks(args.files))
+    tables = 0
+    for instrument, ticks in groups.items():
+        if len(groups) > 1: print(f"== {instrument} ==")
+        if len(ticks) < 3:
+            print(f"{instrument} 只有 {len(ticks)} 個券商的紀錄，至少需要 3 個才能計算共識中價")
+            continue
+        print(format_table(lag_table(ticks, args.step, args.max_lag)))
+        tables += 1
+    return 0 if tables else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+日誌紀錄 (不依賴 Qt)
+1. LogStore: 固定筆數的環形緩衝區 (預設 5000 筆)，長時間執行記憶體不再增長；
+   每筆紀錄附上層級與券商 (由訊息開頭的 [券商] 標籤推斷)，供介面篩選
+2. LogFileWriter: 背景執行緒 + 佇列，批次寫入檔案，依日期與檔案大小輪替，
+   GUI 執行緒只做一次 put，不再碰檔案
+"""
+
+import os
+import re
+import time
+import queue
+import datetime
+import threading
+from collections import deque, namedtuple
+
+DEFAULT_CAPACITY = 5000
+
+LEVEL_INFO, LEVEL_WARN, LEVEL_ALERT, LEVEL_ERROR = range(4)
+LEVEL_NAMES = ["資訊", "警告", "警報", "錯誤"]
+
+LogRecord = namedtuple("LogRecord", ["seq", "ts", "time_str", "level", "broker", "text"])
+
+_RE_TAG = re.compile(r"^\[([^\]]+)\]")
+# 依序比對，先符合者為準
+_LEVEL_KEYWORDS = [
+    (LEVEL_ERROR, ("錯誤", "失敗", "Error", "error", "崩潰", "Exception")),
+    (LEVEL_ALERT, ("警報", "規則成立", "跨券商")),
+    (LEVEL_WARN, ("異常", "疑似", "過時", "警告", "重試", "逾時")),
+]
+
+
+def classify(text):
+    """由訊息推斷 (層級, 券商)；沒有 [券商] 標籤時券商為 None"""
+    level = LEVEL_INFO
+    for lv, words in _LEVEL_KEYWORDS:
+        if any(w in text for w in words):
+            level = lv
+            break
+    m = _RE_TAG.match(text)
+    return level, (m.group(1) if m else None)
+
+
+class LogStore:
+    """環形緩衝區；seq 為累計序號，oldest_seq 之前的紀錄已被擠出"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.records = deque(maxlen=capacity)
+        self.seq = 0
+        self.brokers = set()
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def oldest_seq(self):
+        return self.records[0].seq if self.records else self.seq
+
+    def add(self, text, level=None, broker=None, ts=None):
+        lv, tag = classify(text)
+        if level is None: level = lv
+        if broker is None: broker = tag
+        ts = time.time() if ts is None else ts
+        rec = LogRecord(self.seq, ts, time.strftime("%H:%M:%S", time.localtime(ts)), level, broker, text)
+        self.seq += 1
+        self.records.append(rec)
+        if broker: self.brokers.add(broker)
+        return rec
+
+    def clear(self):
+        self.records.clear()
+
+    def select(self, level=LEVEL_INFO, broker=None):
+        """回傳符合篩選條件的紀錄 (層級 >= level；broker 為 None 代表全部)"""
+        return [r for r in self.records if match(r, level, broker)]
+
+
+def match(rec, level=LEVEL_INFO, broker=None):
+    return rec.level >= level and (broker is None or rec.broker == broker)
+
+
+# ==========================================
+#  背景檔案寫入
+# ==========================================
+
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+DEFAULT_FLUSH_INTERVAL = 1.0
+MAX_BATCH = 2000
+
+_STOP = object()
+
+
+class LogFileWriter(threading.Thread):
+    """
+    用法:
+        writer = LogFileWriter("monitor_log"); writer.start()
+        writer.write("[12:00:00] ...")   # 任何執行緒皆可呼叫，不會阻塞
+        writer.stop()                     # 關閉前寫完佇列中的紀錄
+    檔名為 <prefix>_<YYYY-MM-DD>.txt；超過 max_bytes 時輪替為 .1.txt, .2.txt ... (保留 backups 份)
+    """
+
+    def __init__(self, prefix="monitor_log", folder=".", max_bytes=DEFAULT_MAX_BYTES,
+                 backups=DEFAULT_BACKUPS, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        super().__init__(daemon=True)
+        self.prefix = prefix
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        self.file_date = None
+        self.written = 0
+        self.rotations = 0
+
+    def write(self, line):
+        self.queue.put(line)
+
+    def stop(self, timeout=3.0):
+        self.queue.put(_STOP)
+        if self.is_alive(): self.join(timeout)
+
+    def path_for(self, date, n=0):
+        name = f"{self.prefix}_{date}.txt" if n == 0 else f"{self.prefix}_{date}.{n}.txt"
+        return os.path.join(self.folder, name)
+
+    def run(self):
+        running = True
+        while running:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while True:
+                if item is _STOP:
+                    running = False
+                    break
+                batch.append(item)
+                if len(batch) >= MAX_BATCH: break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch: self._write_batch(batch)
+        self._close()
+
+    def _write_batch(self, batch):
+        data = "\n".join(batch) + "\n"
+        try:
+            self._ensure_file()
+            self.file.write(data)
+            self.file.flush()
+            self.written += len(batch)
+            if self.max_bytes and self.file.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            # 寫入檔案失敗時至少在控制台印出
+            print(f"寫入日誌檔案失敗: {e}")
+            self._close()
+
+    def _ensure_file(self):
+        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        if self.file is not None and today == self.file_date: return
+        self._close()
+        if self.folder: os.makedirs(self.folder, exist_ok=True)
+        self.file = open(self.path_for(today), "a", encoding="utf-8")
+        self.file_date = today
+
+    def _rotate(self):
+        date = self.file_date
+        self._close()
+        for n in range(self.backups - 1, 0, -1):
+            src = self.path_for(date, n)
+            if os.path.exists(src): os.replace(src, self.path_for(date, n + 1))
+        if self.backups > 0:
+            os.replace(self.path_for(date), self.path_for(date, 1))
+        else:
+            os.remove(self.path_for(date))
+        self.rotations += 1
+
+    def _close(self):
+        if self.file:
+            try:
+                self.file.close()
+            except Exception:
+                pass
+        self.file = None
+        self.file_date = None
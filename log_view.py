@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+虛擬化日誌檢視 (Model/View)
+1. QListView 只繪製可見列 (uniformItemSizes)，紀錄數量不影響繪製成本
+2. 新紀錄先暫存，由計時器每幀批次插入一次；超出環形緩衝區的舊紀錄同時從頭部移除
+3. 依層級 / 券商篩選；只有原本就在底部時才自動捲動 (往上翻閱時不會被拉回)
+"""
+
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from PyQt6.QtGui import QColor, QFont
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QListView, QComboBox, QLabel,
+                             QPushButton, QAbstractItemView)
+
+from log_store import (LogStore, match, DEFAULT_CAPACITY, LEVEL_INFO, LEVEL_WARN, LEVEL_ALERT,
+                       LEVEL_ERROR, LEVEL_NAMES)
+
+DEFAULT_FPS = 10
+
+LEVEL_COLORS = {
+    LEVEL_INFO: "#cccccc",
+    LEVEL_WARN: "#ff9800",
+    LEVEL_ALERT: "#dcdcaa",
+    LEVEL_ERROR: "#f44747",
+}
+
+ALL_BROKERS = "全部券商"
+
+
+class LogModel(QAbstractListModel):
+    def __init__(self, store, parent=None, fps=DEFAULT_FPS):
+        super().__init__(parent)
+        self.store = store
+        self.rows = []      # 目前篩選下可見的紀錄 (依 seq 遞增)
+        self.pending = []
+        self.level = LEVEL_INFO
+        self.broker = None
+        self.colors = {lv: QColor(c) for lv, c in LEVEL_COLORS.items()}
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(int(1000 / fps))
+
+    def add(self, text, level=None, broker=None):
+        rec = self.store.add(text, level, broker)
+        self.pending.append(rec)
+        return rec
+
+    def set_filter(self, level=LEVEL_INFO, broker=None):
+        self.flush()
+        self.level = level
+        self.broker = broker
+        self.beginResetModel()
+        self.rows = self.store.select(level, broker)
+        self.endResetModel()
+
+    def clear(self):
+        self.pending = []
+        self.store.clear()
+        self.beginResetModel()
+        self.rows = []
+        self.endResetModel()
+
+    def flush(self):
+        """每幀一次：移除被擠出的舊紀錄，批次插入新紀錄"""
+        if not self.pending: return
+        pending, self.pending = self.pending, []
+        oldest = self.store.oldest_seq
+        drop = 0
+        while drop < len(self.rows) and self.rows[drop].seq < oldest:
+            drop += 1
+        if drop:
+            self.beginRemoveRows(QModelIndex(), 0, drop - 1)
+            del self.rows[:drop]
+            self.endRemoveRows()
+        new = [r for r in pending if r.seq >= oldest and match(r, self.level, self.broker)]
+        if new:
+            n = len(self.rows)
+            self.beginInsertRows(QModelIndex(), n, n + len(new) - 1)
+            self.rows.extend(new)
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        rec = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"[{rec.time_str}] {rec.text}"
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return self.colors[rec.level]
+        return None
+
+
+class LogView(QWidget):
+    """
+    篩選列 + 虛擬化清單 + 清除按鈕
+    用法: view = LogView(); view.add(msg) -> LogRecord
+    """
+
+    def __init__(self, parent=None, capacity=DEFAULT_CAPACITY, clear_text="清除日誌"):
+        super().__init__(parent)
+        self.store = LogStore(capacity)
+        self.model = LogModel(self.store, self)
+        self.at_bottom = True
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        bar = QHBoxLayout()
+        bar.addWidget(QLabel("層級:"))
+        self.cmb_level = QComboBox()
+        self.cmb_level.addItems([f"{name} 以上" for name in LEVEL_NAMES])
+        self.cmb_level.currentIndexChanged.connect(self.apply_filter)
+        bar.addWidget(self.cmb_level)
+        bar.addWidget(QLabel("券商:"))
+        self.cmb_broker = QComboBox()
+        self.cmb_broker.addItem(ALL_BROKERS)
+        self.cmb_broker.currentIndexChanged.connect(self.apply_filter)
+        bar.addWidget(self.cmb_broker)
+        bar.addStretch()
+        self.lbl_count = QLabel("")
+        bar.addWidget(self.lbl_count)
+        layout.addLayout(bar)
+
+        self.list = QListView()
+        self.list.setModel(self.model)
+        self.list.setUniformItemSizes(True)
+        self.list.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.list.setFont(QFont("Consolas", 10))
+        self.list.setStyleSheet("background-color: #1e1e1e; color: #ccc;")
+        layout.addWidget(self.list)
+
+        btn_clear = QPushButton(clear_text)
+        btn_clear.clicked.connect(self.model.clear)
+        layout.addWidget(btn_clear)
+
+        self.model.rowsAboutToBeInserted.connect(self._remember_scroll)
+        self.model.rowsInserted.connect(self._follow_tail)
+
+    def add(self, text, level=None, broker=None):
+        return self.model.add(text, level, broker)
+
+    def set_brokers(self, names):
+        """更新券商篩選選單 (保留目前選擇)"""
+        current = self.cmb_broker.currentText()
+        names = sorted(set(names))
+        self.cmb_broker.blockSignals(True)
+        self.cmb_broker.clear()
+        self.cmb_broker.addItem(ALL_BROKERS)
+        self.cmb_broker.addItems(names)
+        i = self.cmb_broker.findText(current)
+        self.cmb_broker.setCurrentIndex(max(i, 0))
+        self.cmb_broker.blockSignals(False)
+
+    def apply_filter(self):
+        broker = self.cmb_broker.currentText()
+        self.model.set_filter(self.cmb_level.currentIndex(), None if broker == ALL_BROKERS else broker)
+        self.list.scrollToBottom()
+
+    def _remember_scroll(self):
+        sb = self.list.verticalScrollBar()
+        self.at_bottom = sb.value() >= sb.maximum() - 2
+
+    def _follow_tail(self):
+        if self.at_bottom: self.list.scrollToBottom()
+        self.lbl_count.setText(f"{self.model.rowCount()} / {len(self.store)} 筆")
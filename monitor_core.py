@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""
+監控核心 (不依賴 Qt)
+1. UnifiedMonitor: 單一 Chrome、每個券商一個分頁的通用爬蟲，以回呼送出報價 / 狀態 / 日誌
+   (一個頁面可列多個商品，一次抓完；報價以報價代號 (券商[:商品]，見 config_schema.stream_key) 識別)
+2. MonitorPipeline: 報價處理流程 (tick 紀錄 → 共識 / 可疑報價 → 點差統計 → K 棒 → 跨券商報價簿 → 警報評估)
+S.py 的 GUI 與 monitor_daemon.py 的無介面常駐程式共用這兩個類別；
+GUI 只是把回呼轉成 Qt 訊號並把結果畫到表格上
+"""
+
+import re
+import json
+import time
+import threading
+from collections import namedtuple
+
+try:
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.chrome.options import Options
+except ImportError:
+    webdriver = None
+
+from spread_stats import SpreadStatsEngine, instrument_step
+from consolidated_book import ConsolidatedBook
+from bar_builder import BarBuilder, BarWriter
+from tick_recorder import TickRecorder
+from consensus import ConsensusEstimator
+from broker_registry import BrokerDiff
+from config_schema import DEFAULT_ENGINE, EngineSpec, compile_brokers, split_key
+from quote_shm import STATUS_OK, STATUS_SUSPECT, status_code
+from feed_client import DEFAULT_INSTRUMENT
+
+# ==========================================
+#    輔助與邏輯
+# ==========================================
+
+def parse_price(text_content):
+    """
+    強大的價格解析函數：從混亂的字串中提取出第一個合理的浮點數
+    """
+    try:
+        if not text_content: return 0.0
+        # 1. 替換掉常見的非數字干擾 (保留小數點)
+        # 先把換行轉成空格，方便正則處理
+        clean_text = str(text_content).replace('\n', ' ').strip()
+
+        # 2. 使用正則表達式尋找數字 (支援 2,000.50 這種格式)
+        # 邏輯: 尋找一段包含數字和小數點的字串
+        match = re.search(r'[\d,]+\.?\d*', clean_text)
+        if match:
+            num_str = match.group(0)
+            # 移除千分位逗號
+            num_str = num_str.replace(',', '')
+            # 處理多個小數點的情況 (防呆)
+            if num_str.count('.') > 1:
+                parts = num_str.split('.')
+                num_str = f"{parts[0]}.{parts[1]}"
+            return float(num_str)
+        return 0.0
+    except:
+        return 0.0
+
+
+def _noop(*args):
+    pass
+
+
+def parse_quote(inst, bid_text, ask_text):
+    """
+    單一商品的 Bid / Ask 文字 -> (bid, ask)
+    Bid 和 Ask 是同一個元素時 (例如永豐的換行分隔) 取最後兩行；只有一行則 Bid = Ask
+    """
+    if inst.combined:
+        lines = (bid_text or "").strip().split('\n')
+        if len(lines) >= 2:
+            return parse_price(lines[-2]), parse_price(lines[-1])
+        price = parse_price(bid_text)
+        return price, price
+    return parse_price(bid_text), parse_price(ask_text)
+
+
+# 在頁面中一次找出所有商品的 Bid / Ask 元素並回傳文字 (找不到為 null)
+# 參數: [[bid_type, bid_selector, ask_type, ask_selector, combined], ...]
+EXTRACT_SCRIPT = r"""
+const find = (mode, sel) => {
+    if (!sel) return null;
+    try {
+        if (mode === "css") return document.querySelector(sel);
+        if (mode === "xpath") {
+            return document.evaluate(sel, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null)
+                .singleNodeValue;
+        }
+        return document.getElementById(sel);
+    } catch (e) {
+        return null;
+    }
+};
+const text = (el) => el ? (el.innerText !== undefined ? el.innerText : el.textContent) : null;
+return arguments[0].map(q => [text(find(q[0], q[1])), q[4] ? null : text(find(q[2], q[3]))]);
+"""
+
+
+# ==========================================
+#    通用爬蟲
+# ==========================================
+
+class UnifiedMonitor:
+    """
+    單一瀏覽器輪詢所有券商分頁 (阻塞式 run()，由呼叫端放進執行緒)
+    回呼:
+        on_log(msg)
+        on_price(key, bid, ask, time_str)   # key 為報價代號
+        on_status(key, msg)
+    執行中可呼叫 reconfigure(brokers) (任何執行緒)：下一輪開始前在爬蟲執行緒比對差異，
+    只開啟新增、關閉移除、重新載入網址變更的分頁，其他分頁不受影響
+    brokers 可為設定 dict 或 config_schema.BrokerSpec，一律先編譯成不可變的 BrokerSpec；
+    tuning 為 config_schema.EngineSpec (分頁間隔 / 每輪休息 / 等待元素秒數)
+    """
+
+    def __init__(self, brokers_config, on_log=None, on_price=None, on_status=None, headless=True, tuning=None):
+        self.running = True
+        self.driver = None
+        self.on_log = on_log or _noop
+        self.on_price = on_price or _noop
+        self.on_status = on_status or _noop
+        self.brokers = self.compile(brokers_config)  # 不可變副本，介面編輯不會影響執行中的迴圈
+        self.tuning = tuning or EngineSpec(**DEFAULT_ENGINE)
+        self.site_handles = {}  # 儲存視窗 Handle
+        self.spare_handle = None  # 沒有券商時保留的空白分頁 (關閉最後一個視窗會結束瀏覽器)
+        self.pending_brokers = None
+        self.pending_lock = threading.Lock()
+        self.headless = headless
+
+    def setup_driver(self):
+        if webdriver is None:
+            raise RuntimeError("未安裝 selenium，無法啟動瀏覽器")
+        chrome_options = Options()
+        if self.headless:
+            chrome_options.add_argument("--headless=new")  # 隱藏瀏覽器模式
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--window-size=1920,1080")
+        chrome_options.add_argument("--log-level=3")
+        chrome_options.add_argument("--mute-audio")
+        # 無顯示環境的 Linux 伺服器 (容器 / 無桌面) 需要
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument(
+            "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+        self.driver = webdriver.Chrome(options=chrome_options)
+
+    def run(self):
+        try:
+            if not self.brokers:
+                self.on_log("錯誤: 沒有設定任何券商，無法啟動。")
+                return
+
+            self.on_log("系統核心啟動中 (Chrome Driver)...")
+            self.setup_driver()
+            wait = WebDriverWait(self.driver, self.tuning.wait_timeout)
+
+            # --- 初始化分頁 --- (第一個券商沿用瀏覽器的初始視窗)
+            self.spare_handle = self.driver.current_window_handle
+            brokers, self.brokers = self.brokers, ()
+            self.sync_tabs(brokers)
+
+            self.on_log("所有連線建立完成，開始即時監控。")
+
+            # --- 監控迴圈 ---
+            while self.running:
+                self.apply_pending()
+                for broker in self.brokers:
+                    if not self.running: break
+                    b_id = broker.id
+
+                    try:
+                        # 切換視窗
+                        if b_id in self.site_handles:
+                            self.driver.switch_to.window(self.site_handles[b_id])
+                            self.scrape_generic(broker, wait)
+                        else:
+                            self.status_all(broker, "視窗遺失")
+                    except Exception:
+                        self.status_all(broker, "連線異常")
+
+                    time.sleep(self.tuning.tab_interval)  # 每個分頁間隔
+
+                # 每一大輪休息 (分段睡眠，停止時不用等滿)
+                rest = time.monotonic() + self.tuning.round_interval
+                while self.running and time.monotonic() < rest:
+                    time.sleep(min(0.1, max(0.0, rest - time.monotonic())))
+
+        except Exception as e:
+            self.on_log(f"核心錯誤: {str(e)}")
+        finally:
+            self.stop_driver()
+
+    # ---------------------------
+    #    執行中變更券商
+    # ---------------------------
+    def compile(self, brokers):
+        errors = []
+        specs = compile_brokers(brokers, errors)
+        for msg in errors:
+            self.on_log(f"設定錯誤: {msg}")
+        return specs
+
+    def reconfigure(self, brokers):
+        """任何執行緒呼叫；實際開關分頁在爬蟲執行緒的下一輪開始前進行"""
+        specs = self.compile(brokers)
+        with self.pending_lock:
+            self.pending_brokers = specs
+
+    def apply_pending(self):
+        with self.pending_lock:
+            brokers, self.pending_brokers = self.pending_brokers, None
+        if brokers is None: return
+        names = {b.id: b.name for b in self.brokers + brokers}
+        diff = self.sync_tabs(brokers)
+        if diff: self.on_log(f"券商設定已套用: {diff.summary(lambda b_id: names.get(b_id, b_id))}")
+
+    def sync_tabs(self, brokers):
+        """比對目前與新的券商列表，只動受影響的分頁 (先開新分頁再關舊分頁，瀏覽器至少保留一個視窗)"""
+        diff = BrokerDiff(self.brokers, brokers)
+        new_map = {b.id: b for b in brokers}
+        for b_id in diff.added:
+            if not self.running: break
+            self.open_tab(new_map[b_id])
+        for b_id in diff.removed:
+            self.close_tab(b_id)
+        for b_id in diff.reloaded:
+            handle = self.site_handles.get(b_id)
+            if handle is None: continue
+            try:
+                self.driver.switch_to.window(handle)
+                self.on_log(f"重新載入分頁: {new_map[b_id].name} ...")
+                self.driver.get(new_map[b_id].url)
+            except Exception:
+                self.on_status(b_id, "連線異常")
+        self.brokers = brokers
+        return diff
+
+    def open_tab(self, broker):
+        if self.spare_handle is not None:
+            self.on_log(f"初始化主分頁: {broker.name} ...")
+            self.driver.switch_to.window(self.spare_handle)
+            self.driver.get(broker.url)
+            self.site_handles[broker.id] = self.spare_handle
+            self.spare_handle = None
+            return
+        self.on_log(f"開啟背景分頁: {broker.name} ...")
+        self.driver.execute_script(f"window.open({json.dumps(broker.url)}, '_blank');")
+        self.driver.switch_to.window(self.driver.window_handles[-1])
+        self.site_handles[broker.id] = self.driver.current_window_handle
+        time.sleep(1)
+
+    def close_tab(self, b_id):
+        handle = self.site_handles.pop(b_id, None)
+        if handle is None: return
+        try:
+            self.driver.switch_to.window(handle)
+            if len(self.driver.window_handles) > 1:
+                self.driver.close()
+            else:
+                self.driver.get("about:blank")
+                self.spare_handle = handle
+        except Exception:
+            pass
+
+    def scrape_generic(self, broker, wait):
+        """
+        通用的爬蟲邏輯：根據設定檔中的 Type 和 Selector 抓取頁面上的所有商品 (broker 為已驗證的 BrokerSpec)
+        所有商品的文字由一次 execute_script 取回，同一頁多抓幾個商品不增加 WebDriver 往返次數
+        """
+        now_str = time.strftime("%H:%M:%S")
+        try:
+            texts = self.extract_texts(broker)
+            if all(bid is None for bid, _ in texts):
+                # 一個元素都沒有：頁面可能仍在載入，等主要商品出現後再取一次
+                primary = broker.primary
+                if self.find_element_dynamic(wait, primary.bid_type, primary.bid_selector) is not None:
+                    texts = self.extract_texts(broker)
+        except Exception:
+            self.status_all(broker, "等待數據")
+            return
+
+        for inst, (bid_text, ask_text) in zip(broker.instruments, texts):
+            bid, ask = parse_quote(inst, bid_text, ask_text)
+            if bid > 0 and ask > 0:
+                self.on_price(inst.key, bid, ask, now_str)
+                self.on_status(inst.key, "監控中")
+            else:
+                self.on_status(inst.key, "解析失敗")
+
+    def extract_texts(self, broker):
+        """[(Bid 文字, Ask 文字), ...]，順序同 broker.instruments；找不到的元素為 None"""
+        queries = [[i.bid_type, i.bid_selector, i.ask_type, i.ask_selector, i.combined] for i in broker.instruments]
+        return [tuple(pair) for pair in self.driver.execute_script(EXTRACT_SCRIPT, queries)]
+
+    def status_all(self, broker, msg):
+        for inst in broker.instruments:
+            self.on_status(inst.key, msg)
+
+    def find_element_dynamic(self, wait, method, selector):
+        """根據方法 (ID/CSS/XPATH) 尋找元素"""
+        if not selector: return None
+        by_method = By.ID
+        if method == "css":
+            by_method = By.CSS_SELECTOR
+        elif method == "xpath":
+            by_method = By.XPATH
+
+        try:
+            return wait.until(EC.presence_of_element_located((by_method, selector)))
+        except:
+            return None
+
+    def stop(self):
+        self.running = False
+
+    def stop_driver(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except:
+                pass
+            self.driver = None
+
+
+# ==========================================
+#    報價處理流程
+# ==========================================
+
+# suspect: 可疑原因 (正常為 None)；stats: 點差統計 (可疑時為 None)
+TickResult = namedtuple("TickResult", ["suspect", "stats"])
+
+
+class MonitorPipeline:
+    """
+    報價處理流程；只在單一執行緒呼叫 (GUI 執行緒或 daemon 主迴圈)
+    b_id 為報價代號 (券商[:商品])；共識與跨券商報價簿依商品分開，統計 / K 棒 / 警報依報價代號
+        pipeline.on_tick(b_id, bid, ask, ts) -> TickResult
+        pipeline.on_status(b_id, msg)
+        pipeline.housekeeping(now)   # 每秒一次：過期報價、K 棒收棒、tick 紀錄落地
+        pipeline.on_transition(tr) / pipeline.on_rule_event(ev)   # 警報事件轉發到串流
+    警報評估交給 alert_evaluator 執行緒，可疑報價不進入統計、報價簿與警報
+    feed (tick_feed.FeedServer，選填) 收到所有 tick (含可疑標記)、狀態與警報事件
+    quotes (quote_shm.QuoteTable，選填) 每筆 tick 覆寫共享記憶體中的最新報價
+    web (web_dashboard.WebDashboard，選填) 與 feed 相同的事件，由看板每幀合併後推送
+    """
+
+    def __init__(self, alert_evaluator, log=None, name_of=None, record=True, bars=True, feed=None, quotes=None,
+                 web=None):
+        self.alert_evaluator = alert_evaluator
+        self.log = log or _noop
+        self.name_of = name_of or (lambda b_id: b_id)
+        self.bars = bars
+        self.feed = feed
+        self.quotes = quotes
+        self.web = web
+        # 各報價代號點差滾動統計 (直方圖解析度依商品的最小跳動)
+        self.spread_stats = SpreadStatsEngine(step_for=lambda key: instrument_step(split_key(key)[1]))
+        self.tick_recorder = TickRecorder() if record else None  # 原始 tick 紀錄 (供延遲分析)
+        self.replaying = False
+        self.reset()
+
+    def reset(self, replay=False):
+        """重置統計/報價簿/K 棒；回放時 K 棒與 tick 不落地，避免和實盤紀錄混在一起"""
+        self.spread_stats.reset_session()
+        self.books = {}  # 商品 -> 跨券商最佳買賣價 (ConsolidatedBook)
+        self.consensuses = {}  # 商品 -> 共識中價與異常報價偵測 (ConsensusEstimator)
+        self.streams = {}  # 報價代號 -> (券商, 商品, 報價簿, 共識)
+        self.suspect_brokers = {}  # b_id -> 可疑原因
+        self.alert_evaluator.reset()
+        self.bar_builder = BarBuilder(writer=BarWriter() if self.bars and not replay else None)  # 1s/1m/5m K 棒
+        self.replaying = replay
+
+    @property
+    def book(self):
+        """XAUUSD 的跨券商報價簿 (介面的最佳買賣價標籤)"""
+        return self.market(DEFAULT_INSTRUMENT)[0]
+
+    def market(self, instrument):
+        book = self.books.get(instrument)
+        if book is None:
+            book = self.books[instrument] = ConsolidatedBook()
+            self.consensuses[instrument] = ConsensusEstimator()
+        return book, self.consensuses[instrument]
+
+    def stream(self, key):
+        s = self.streams.get(key)
+        if s is None:
+            broker, instrument = split_key(key)
+            s = self.streams[key] = (broker, instrument) + self.market(instrument)
+        return s
+
+    def on_tick(self, b_id, bid, ask, ts):
+        if self.tick_recorder and not self.replaying:
+            self.tick_recorder.record(b_id, bid, ask, ts)
+
+        broker, instrument, book, consensus = self.stream(b_id)
+        check = consensus.update(b_id, bid, ask, ts)
+        if self.feed: self.feed.publish_tick(broker, bid, ask, ts, instrument, suspect=bool(check.suspect))
+        if self.quotes: self.quotes.update(b_id, bid, ask, ts, STATUS_SUSPECT if check.suspect else STATUS_OK)
+        if self.web: self.web.publish_tick(b_id, bid, ask, ts, suspect=bool(check.suspect))
+        if check.suspect:
+            if b_id not in self.suspect_brokers:
+                self.log(f"[{self.name_of(b_id)}] 疑似異常報價 ({check.reason})，"
+                         f"中價 {(bid + ask) / 2:.2f} / 共識 {check.consensus:.2f}，暫停警報")
+                self.alert_evaluator.set_suspect(b_id, True)
+            self.suspect_brokers[b_id] = check.reason
+            self.handle_book_events(book.remove(b_id, ts))
+            return TickResult(check.reason, None)
+        if self.suspect_brokers.pop(b_id, None):
+            self.log(f"[{self.name_of(b_id)}] 報價恢復正常")
+            self.alert_evaluator.set_suspect(b_id, False)
+
+        stats = self.spread_stats.update(b_id, abs(ask - bid), ts)
+        self.bar_builder.on_tick(b_id, bid, ask, ts)
+        self.handle_book_events(book.update(b_id, bid, ask, ts))
+        # 交給警報執行緒評估，只有狀態轉換會回呼
+        self.alert_evaluator.submit(b_id, bid, ask, ts)
+        return TickResult(None, stats)
+
+    def on_status(self, b_id, msg):
+        if self.tick_recorder and not self.replaying:
+            self.tick_recorder.record_status(b_id, msg)
+        if self.feed:
+            broker, instrument = self.stream(b_id)[:2]
+            self.feed.publish_status(broker, msg, instrument=instrument)
+        if self.web: self.web.publish_status(b_id, msg)
+        # 可疑期間的「監控中」不覆蓋可疑狀態
+        if self.quotes and not (b_id in self.suspect_brokers and msg == "監控中"):
+            self.quotes.set_status(b_id, status_code(msg))
+
+    def on_transition(self, tr):
+        if self.feed:
+            broker, instrument = self.stream(tr.b_id)[:2]
+            self.feed.publish_transition(tr._replace(b_id=broker), instrument)
+        if self.web: self.web.publish_transition(tr)
+
+    def on_rule_event(self, ev):
+        if self.feed:
+            broker, instrument = self.stream(ev.b_id)[:2]
+            self.feed.publish_rule(ev._replace(b_id=broker), instrument)
+        if self.web: self.web.publish_rule(ev)
+
+    def housekeeping(self, now):
+        # 清除過期報價 (沒有新 tick 也要能結束交叉狀態)
+        for book in self.books.values():
+            self.handle_book_events(book.expire(now))
+        # 到期的 K 棒即使沒有新 tick 也要收棒落地
+        self.bar_builder.flush(now)
+        if self.tick_recorder: self.tick_recorder.flush()
+
+    def forget(self, b_id, now):
+        """
+        券商被移除：清掉其報價簿 / 共識 / 可疑狀態 / 點差統計 / K 棒 / 警報狀態 / 共享記憶體列 / 看板列，
+        避免殘留報價影響最佳價與異常判斷
+        """
+        s = self.streams.pop(b_id, None)
+        if s is not None:
+            _, _, book, consensus = s
+            self.handle_book_events(book.remove(b_id, now))
+            consensus.remove(b_id)
+        self.suspect_brokers.pop(b_id, None)
+        self.spread_stats.remove(b_id)
+        self.bar_builder.remove(b_id)
+        self.alert_evaluator.forget(b_id)
+        if self.quotes: self.quotes.remove(b_id)
+        if self.web: self.web.remove(b_id)
+
+    def handle_book_events(self, events):
+        for ev in events:
+            bid_name = self.name_of(ev['bid_broker'])
+            ask_name = self.name_of(ev['ask_broker'])
+            if ev['type'] == "start":
+                self.log(f"[跨券商{ev['state']}] {bid_name} Bid {ev['bid']:.2f} >= "
+                         f"{ask_name} Ask {ev['ask']:.2f}")
+            else:
+                self.log(f"[跨券商{ev['state']}結束] {bid_name} / {ask_name} 持續 {ev['duration']:.1f} 秒")
+
+    def close(self):
+        self.bar_builder.close_all()
+        if self.tick_recorder: self.tick_recorder.close()
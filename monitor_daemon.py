@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+無介面常駐監控 (伺服器部署，不需要 Qt 與顯示環境)
+使用與 S.py 相同的設定檔、爬蟲與處理流程 (monitor_core.py)，警報照常評估並送出通知；
+日誌輸出到標準輸出與背景輪替的日誌檔
+
+引擎:
+    single        單一瀏覽器輪詢所有券商分頁 (同 S.py)
+    per-site      每個券商一個瀏覽器
+    workers:N     券商平均分給 N 個瀏覽器
+    replay        回放 tick 紀錄 (需搭配 --replay，不啟動瀏覽器)
+
+訊號:
+    SIGINT / SIGTERM   停止引擎、寫完 K 棒 / tick 紀錄 / 日誌後結束 (再收到一次則立即結束)
+    SIGHUP             重新讀取設定檔中的警報門檻與進階規則
+
+用法:
+    python monitor_daemon.py --config monitor_config_v11_dynamic.json --engine workers:2
+    (--engine 省略時使用設定檔 engine.layout；設定檔不存在時自動轉換同目錄的舊版設定檔，見 config_schema.py)
+    python monitor_daemon.py --webhook https://example.com/hook --syslog 127.0.0.1:514
+    python monitor_daemon.py --engine replay --replay ticks/ticks_2024-01-02.csv --speed 100
+    python monitor_daemon.py --feed tcp:127.0.0.1:7410    # 發布報價串流 (客戶端見 feed_client.py)
+    python monitor_daemon.py --shm spread_quotes          # 共享記憶體最新報價表 (讀取端見 quote_shm.py)
+    python monitor_daemon.py --web 0.0.0.0:8080 --web-token secret   # 網頁看板 (web_dashboard.py)
+"""
+
+import os
+import sys
+import math
+import time
+import queue
+import signal
+import argparse
+import threading
+
+from monitor_core import UnifiedMonitor, MonitorPipeline
+from alert_engine import AlertEvaluator
+from alert_rules import RuleEngine
+from notify import NotificationHub, build_sinks
+from log_store import LogFileWriter
+from tick_feed import FeedServer
+from quote_shm import QuoteTable, DEFAULT_CAPACITY as SHM_CAPACITY
+from web_dashboard import WebDashboard
+from broker_registry import BrokerRegistry
+from tick_replay import load_session, replay_session, SPEED_MAX
+from config_schema import load_config, DEFAULT_CONFIG
+
+DEFAULT_LOG_PREFIX = "monitor_log_daemon"
+HOUSEKEEPING_INTERVAL = 1.0
+DEFAULT_STATUS_INTERVAL = 60.0
+ENGINE_JOIN_TIMEOUT = 30.0
+
+
+def cli_sinks(args):
+    """命令列指定的通知通道 (附加在設定檔的 notify 之後)"""
+    extra = []
+    for url in args.webhook or ():
+        extra.append({"type": "webhook", "url": url})
+    for item in args.telegram or ():
+        token, _, chat_id = item.rpartition(",")
+        extra.append({"type": "telegram", "token": token, "chat_id": chat_id})
+    for item in args.syslog or ():
+        host, _, port = item.partition(":")
+        extra.append({"type": "syslog", "host": host, "port": int(port or 514)})
+    return extra
+
+
+def split_brokers(brokers, spec):
+    """依引擎規格分組，每組一個瀏覽器"""
+    if spec == "single":
+        return [list(brokers)]
+    if spec == "per-site":
+        return [[b] for b in brokers]
+    if spec.startswith("workers:"):
+        count = max(1, int(spec.split(":", 1)[1]))
+        chunk = math.ceil(len(brokers) / count)
+        return [brokers[i:i + chunk] for i in range(0, len(brokers), chunk)]
+    raise ValueError(f"未知引擎: {spec}")
+
+
+class EngineThread(threading.Thread):
+    """在背景執行 UnifiedMonitor 或回放，結束時通知主迴圈"""
+
+    def __init__(self, name, target, stop, on_finished):
+        super().__init__(name=name, daemon=True)
+        self.target = target
+        self.stop_fn = stop
+        self.on_finished = on_finished
+
+    def run(self):
+        try:
+            self.target()
+        finally:
+            self.on_finished(self.name)
+
+    def stop(self):
+        self.stop_fn()
+
+
+class MonitorDaemon:
+    """
+    引擎執行緒只把事件放進佇列；主執行緒單獨消化佇列並驅動處理流程 (等同 GUI 的事件迴圈)，
+    MonitorPipeline 因此不需要加鎖
+    """
+
+    def __init__(self, config_path, engine=None, notify_extra=(), notify=True, record=True, bars=True,
+                 log_prefix=DEFAULT_LOG_PREFIX, quiet=False, replay_paths=(), speed=1.0,
+                 status_interval=DEFAULT_STATUS_INTERVAL, headless=True, feed_address=None, shm_name=None,
+                 web_address=None, web_token=None):
+        self.config_path = config_path
+        self.config, config_errors = load_config(config_path)
+        self.engine_spec = engine or self.config.engine.layout
+        self.replay_paths = list(replay_paths)
+        self.speed = speed
+        self.quiet = quiet
+        self.headless = headless
+        self.status_interval = status_interval
+        self.events = queue.SimpleQueue()
+        self.engines = []
+        self.finished = set()
+        self.stopping = False
+        self.ticks = 0
+        self.alerts = 0
+        self.last_ts = None
+
+        self.log_writer = LogFileWriter(log_prefix)
+        self.log_writer.start()
+        self.log_config(config_errors)
+
+        self.registry = BrokerRegistry(self.config.brokers)
+        # 報價串流：命令列優先，其次為設定檔的 feed.address
+        feed_address = feed_address or self.config.feed.address
+        self.feed = None
+        if feed_address:
+            self.feed = FeedServer(feed_address, log=self.log_threadsafe)
+            self.feed.names = self.config.names()   # 串流訊息以 (券商, 商品) 分開傳送
+            self.feed.instruments = self.config.instruments()
+        shm_name = shm_name or self.config.feed.shm
+        self.quotes = None
+        if shm_name:
+            self.quotes = QuoteTable(shm_name, capacity=max(SHM_CAPACITY, len(self.registry)),
+                                     log=self.log).open()
+        web_address = web_address or self.config.feed.web
+        self.web = None
+        if web_address:
+            self.web = WebDashboard(web_address, token=web_token or self.config.feed.web_token,
+                                    log=self.log_threadsafe)
+            self.web.names = {b_id: name for b_id, name in self.registry.items()}
+        self.alert_evaluator = AlertEvaluator(lambda tr: self.events.put(("transition", tr)),
+                                              on_rule=lambda ev: self.events.put(("rule", ev)),
+                                              log=self.log_threadsafe)
+        self.pipeline = MonitorPipeline(self.alert_evaluator, log=self.log, name_of=self.registry.name,
+                                        record=record and self.engine_spec != "replay", bars=bars, feed=self.feed,
+                                        quotes=self.quotes, web=self.web)
+        if self.engine_spec == "replay": self.pipeline.reset(replay=True)
+        self.engines = self.build_engines()  # 引擎規格錯誤時在這裡就失敗
+
+        sinks, errors = build_sinks(list(self.config.notify) + list(notify_extra) if notify else [])
+        for msg in errors:
+            self.log(msg)
+        self.notifier = NotificationHub(sinks, log=self.log_threadsafe).start()
+        self.notifier.names = {b_id: name for b_id, name in self.registry.items()}
+        self.alert_evaluator.notify = self.notifier.publish_alert
+        if sinks:
+            self.log(f"通知通道: {', '.join(s.name for s in sinks)}")
+
+    # ==========================================
+    #  日誌
+    # ==========================================
+
+    def log(self, msg):
+        line = f"[{time.strftime('%H:%M:%S')}] {msg}"
+        self.log_writer.write(line)
+        if not self.quiet:
+            print(line, flush=True)
+
+    def log_threadsafe(self, msg):
+        # 其他執行緒的日誌也經過主迴圈，輸出順序與事件一致
+        self.events.put(("log", msg))
+
+    # ==========================================
+    #  設定
+    # ==========================================
+
+    def log_config(self, errors):
+        if self.config.source:
+            self.log(f"設定已由舊版格式轉換: {self.config.source} (python config_schema.py migrate 可寫成新格式)")
+        for msg in errors:
+            self.log(f"設定錯誤: {msg}")
+
+    def apply_alerts(self):
+        # 設定在載入時已驗證並編譯，這裡只建立執行期物件
+        rules = self.config.compile_alerts()
+        self.alert_evaluator.set_rules(rules)
+        engine = RuleEngine(self.config.rules)
+        self.alert_evaluator.set_rule_engine(engine if len(engine) else None)
+        self.log(f"已套用 {len(rules)} 組券商警報、{len(engine)} 條進階規則")
+
+    def reload(self):
+        """SIGHUP：重新讀取警報門檻與規則 (券商與引擎不變)"""
+        try:
+            config, errors = load_config(self.config_path)
+        except Exception as e:
+            self.log(f"重新讀取設定失敗: {e}")
+            return
+        for msg in errors:
+            self.log(f"設定錯誤: {msg}")
+        self.config = self.config._replace(alerts=config.alerts, rules=config.rules, rule_lines=config.rule_lines)
+        self.log(f"重新讀取設定: {self.config_path}")
+        self.apply_alerts()
+
+    # ==========================================
+    #  引擎
+    # ==========================================
+
+    def build_engines(self):
+        put = self.events.put
+        finished = lambda name: put(("finished", name))
+        if self.engine_spec == "replay":
+            if not self.replay_paths:
+                raise ValueError("replay 引擎需要 --replay 指定 tick 紀錄檔")
+            state = {"running": True}
+
+            def run_replay():
+                events = load_session(self.replay_paths)
+                put(("log", f"開始回放 {len(events)} 筆"))
+                count = replay_session(events,
+                                       lambda s, bid, ask, t_str, ts: put(("price", s, bid, ask, t_str, ts)),
+                                       lambda s, msg, ts: put(("status", s, msg)),
+                                       self.speed, should_stop=lambda: not state["running"])
+                put(("log", f"回放結束: {count} 筆"))
+            return [EngineThread("replay", run_replay, lambda: state.update(running=False), finished)]
+
+        engines = []
+        for i, group in enumerate(split_brokers(self.config.brokers, self.engine_spec)):
+            core = UnifiedMonitor(group,
+                                  on_log=lambda msg, n=i + 1: put(("log", f"[Engine-{n}] {msg}")),
+                                  on_price=lambda b_id, bid, ask, t_str: put(("price", b_id, bid, ask, t_str,
+                                                                               time.time())),
+                                  on_status=lambda b_id, msg: put(("status", b_id, msg)),
+                                  headless=self.headless, tuning=self.config.engine)
+            engines.append(EngineThread(f"engine-{i + 1}", core.run, core.stop, finished))
+        return engines
+
+    def request_stop(self, signum=None, frame=None):
+        if self.stopping:
+            # 第二次中斷：不等引擎收尾，直接結束
+            os._exit(1)
+        self.stopping = True
+        self.events.put(("stop",))
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.events.put(("reload",)))
+
+    # ==========================================
+    #  主迴圈
+    # ==========================================
+
+    def run(self):
+        self.log(f">>> 無介面監控啟動: {len(self.config.brokers)} 個券商 / {len(self.registry)} 個報價，"
+                 f"引擎 {self.engine_spec}")
+        if self.feed: self.feed.start()
+        if self.web: self.web.start()
+        self.alert_evaluator.start()
+        self.apply_alerts()
+        for e in self.engines:
+            e.start()
+
+        next_housekeeping = time.monotonic() + HOUSEKEEPING_INTERVAL
+        next_status = time.monotonic() + self.status_interval
+        while True:
+            try:
+                item = self.events.get(timeout=max(0.0, next_housekeeping - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is not None:
+                kind = item[0]
+                if kind == "finished":
+                    self.finished.add(item[1])
+                    if len(self.finished) == len(self.engines): break
+                elif kind == "stop":
+                    self.log("收到停止訊號，正在停止引擎...")
+                    break
+                else:
+                    self.handle(item)
+
+            now = time.monotonic()
+            if now >= next_housekeeping:
+                # 回放時以紀錄中的時間為準
+                replay_now = self.engine_spec == "replay" and self.last_ts
+                self.pipeline.housekeeping(self.last_ts if replay_now else time.time())
+                next_housekeeping = now + HOUSEKEEPING_INTERVAL
+            if now >= next_status:
+                self.log_status()
+                next_status = now + self.status_interval
+        self.shutdown()
+
+    def handle(self, item):
+        kind = item[0]
+        if kind == "price":
+            _, b_id, bid, ask, _, ts = item
+            self.ticks += 1
+            self.last_ts = ts
+            self.pipeline.on_tick(b_id, bid, ask, ts)
+        elif kind == "status":
+            self.pipeline.on_status(item[1], item[2])
+        elif kind == "transition":
+            self.pipeline.on_transition(item[1])
+            self.on_alert_transition(item[1])
+        elif kind == "rule":
+            ev = item[1]
+            self.pipeline.on_rule_event(ev)
+            state = "成立" if ev.active else "解除"
+            self.log(f"[{self.registry.name(ev.b_id)}] 規則{state}: {ev.rule} (數值 {ev.value:.2f})")
+        elif kind == "log":
+            self.log(item[1])
+        elif kind == "reload":
+            self.reload()
+
+    def drain(self):
+        while True:
+            try:
+                item = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if item[0] not in ("finished", "stop", "reload"):
+                self.handle(item)
+
+    def on_alert_transition(self, tr):
+        if tr.fired:
+            self.alerts += 1
+            self.log(f"[{self.registry.name(tr.b_id)}] 警報觸發! 點差: {tr.spread:.2f}")
+
+    def log_status(self):
+        suspect = ", ".join(self.registry.name(b) for b in self.pipeline.suspect_brokers) or "無"
+        self.log(f"[狀態] tick {self.ticks} 筆，警報 {self.alerts} 次，可疑券商: {suspect}")
+        if self.feed and self.feed.running:
+            st = self.feed.stats()
+            self.log(f"[狀態] 串流訂閱者 {st['subscribers']} 個，已發布 {st['published']} 則，"
+                     f"斷線 (過慢) {st['dropped_clients']} 次")
+        if self.web and self.web.running:
+            st = self.web.stats()
+            self.log(f"[狀態] 網頁觀看者 {st['viewers']} 個，已推送 {st['frames']} 幀，"
+                     f"斷線 (過慢) {st['dropped_viewers']} 次")
+
+    def shutdown(self):
+        for e in self.engines:
+            e.stop()
+        deadline = time.monotonic() + ENGINE_JOIN_TIMEOUT
+        for e in self.engines:
+            e.join(max(0.0, deadline - time.monotonic()))
+        # 停止期間仍送達的報價照常處理完；警報執行緒評估完剩餘 tick 後，再輸出其警報事件
+        self.drain()
+        self.pipeline.close()
+        self.alert_evaluator.stop()
+        self.alert_evaluator.join(5.0)
+        self.drain()
+        if self.feed: self.feed.stop()
+        if self.web: self.web.stop()
+        self.drain()
+        if self.quotes: self.quotes.close()
+        self.notifier.stop()
+        self.log(f">>> 監控已停止 (tick {self.ticks} 筆，警報 {self.alerts} 次)")
+        self.log_writer.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="無介面黃金點差監控 (伺服器部署)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help=f"設定檔 (預設 {DEFAULT_CONFIG})")
+    parser.add_argument("--engine", help="single / per-site / workers:N / replay (預設為設定檔 engine.layout)")
+    parser.add_argument("--replay", nargs="+", default=[], help="replay 引擎使用的 tick 紀錄檔")
+    parser.add_argument("--speed", default="1", help="回放倍速，max 為極速")
+    parser.add_argument("--webhook", action="append", help="附加 webhook 通道 (可重複)")
+    parser.add_argument("--telegram", action="append", help="附加 Telegram 通道: TOKEN,CHAT_ID")
+    parser.add_argument("--syslog", action="append", help="附加 syslog 通道: HOST[:PORT]")
+    parser.add_argument("--feed", help="發布報價串流: tcp:HOST:PORT 或 unix:PATH")
+    parser.add_argument("--shm", help="共享記憶體報價表名稱 (例如 spread_quotes)")
+    parser.add_argument("--web", help="網頁看板位址: HOST:PORT (例如 0.0.0.0:8080)")
+    parser.add_argument("--web-token", help="網頁看板存取權杖 (網址需帶 ?token=...)")
+    parser.add_argument("--no-notify", action="store_true", help="停用所有通知通道")
+    parser.add_argument("--no-record", action="store_true", help="不寫入 tick 紀錄")
+    parser.add_argument("--no-bars", action="store_true", help="不寫入 K 棒")
+    parser.add_argument("--show-browser", action="store_true", help="顯示瀏覽器視窗 (除錯用)")
+    parser.add_argument("--log-prefix", default=DEFAULT_LOG_PREFIX, help="日誌檔名前綴")
+    parser.add_argument("--status-interval", type=float, default=DEFAULT_STATUS_INTERVAL,
+                        help="狀態摘要間隔秒數")
+    parser.add_argument("--quiet", action="store_true", help="不輸出到標準輸出 (只寫日誌檔)")
+    args = parser.parse_args(argv)
+
+    speed = SPEED_MAX if args.speed.lower() == "max" else float(args.speed)
+    try:
+        daemon = MonitorDaemon(args.config, args.engine, notify_extra=cli_sinks(args), notify=not args.no_notify,
+                               record=not args.no_record, bars=not args.no_bars, log_prefix=args.log_prefix,
+                               quiet=args.quiet, replay_paths=args.replay, speed=speed,
+                               status_interval=args.status_interval, headless=not args.show_browser,
+                               feed_address=args.feed, shm_name=args.shm,
+                               web_address=args.web, web_token=args.web_token)
+    except Exception as e:
+        print(f"啟動失敗: {e}", file=sys.stderr)
+        return 2
+    daemon.install_signal_handlers()
+    daemon.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+警報通知分送 (Webhook / Telegram / SMTP / Syslog)
+1. publish() 只把通知放進各通道的有界佇列 (滿了丟棄並計數)，永遠不會阻塞呼叫端
+2. 背景執行緒跑 asyncio 事件迴圈，每個通道有自己的併發數，
+   佇列中的通知合併成批次送出 (batch_size / batch_wait)
+3. 失敗時以指數退避重試，超過次數放棄並計數
+4. HTTP 通道重用 keep-alive 連線 (連線池大小 = 併發數)，SMTP 保持登入的連線
+實際的網路 I/O 為阻塞呼叫，放在執行緒池中執行，不佔用事件迴圈
+
+設定格式 (monitor 設定檔的 "notify" 欄位):
+    [{"type": "webhook", "url": "https://example.com/hook"},
+     {"type": "telegram", "token": "123:ABC", "chat_id": "-100123"},
+     {"type": "smtp", "host": "smtp.example.com", "port": 587, "sender": "a@b.c",
+      "recipients": ["x@y.z"], "username": "...", "password": "...", "tls": true},
+     {"type": "syslog", "host": "127.0.0.1", "port": 514}]
+每個通道皆可加上 concurrency / batch_size / batch_wait / max_retries / queue_size
+"""
+
+import json
+import time
+import queue
+import random
+import socket
+import asyncio
+import smtplib
+import threading
+import http.client
+from collections import namedtuple
+from email.message import EmailMessage
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_BATCH_WAIT = 1.0     # 收到第一筆後最多再等幾秒湊批次
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 1.0        # 第一次重試等待秒數，之後加倍
+MAX_BACKOFF = 60.0
+DEFAULT_TIMEOUT = 10.0
+
+# kind: "alert" (層級警報) / "rule" (進階規則)
+Notification = namedtuple("Notification", ["kind", "b_id", "title", "message", "level", "ts"])
+
+
+def from_transition(tr, name=None):
+    """AlertTransition -> Notification"""
+    who = name or tr.b_id
+    return Notification("alert", tr.b_id, f"[{who}] 點差警報 層級 {tr.level + 1}",
+                        f"[{who}] 點差 {tr.spread:.2f} 大於 層級 {tr.level + 1} 門檻 {tr.threshold:g}",
+                        tr.level, tr.ts)
+
+
+def from_rule_event(ev, name=None):
+    """RuleEvent -> Notification (只送成立事件)"""
+    who = name or ev.b_id
+    return Notification("rule", ev.b_id, f"[{who}] 規則成立",
+                        f"[{who}] 規則成立: {ev.rule} (數值 {ev.value:.2f})", 0, ev.ts)
+
+
+def format_line(n):
+    return f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(n.ts))} {n.message}"
+
+
+# ==========================================
+#  通道
+# ==========================================
+
+class Sink:
+    """通道基底類別：send_batch(items) 為阻塞呼叫，失敗時拋出例外"""
+    kind = "sink"
+
+    def __init__(self, name=None, concurrency=1, batch_size=DEFAULT_BATCH_SIZE, batch_wait=DEFAULT_BATCH_WAIT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF, queue_size=DEFAULT_QUEUE_SIZE,
+                 timeout=DEFAULT_TIMEOUT):
+        self.name = name or self.kind
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = float(batch_wait)
+        self.max_retries = int(max_retries)
+        self.backoff = float(backoff)
+        self.queue_size = int(queue_size)
+        self.timeout = float(timeout)
+
+    def send_batch(self, items):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class HTTPPool:
+    """keep-alive 連線池：每個併發工作者取用一條連線，用完歸還"""
+
+    def __init__(self, url, size, timeout):
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or "/"
+        if parts.query: self.path += "?" + parts.query
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def post(self, body, headers, path=None):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            conn.request("POST", path or self.path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            try:
+                self.idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+        if resp.status >= 300:
+            raise IOError(f"HTTP {resp.status}: {data[:200]!r}")
+        return data
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class WebhookSink(Sink):
+    """POST JSON: {"alerts": [{kind, broker, title, message, level, ts}, ...]}"""
+    kind = "webhook"
+
+    def __init__(self, url, headers=None, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = HTTPPool(url, self.concurrency, self.timeout)
+        self.headers = {"Content-Type": "application/json"}
+        self.headers.update(headers or {})
+
+    def send_batch(self, items):
+        body = json.dumps({"alerts": [{"kind": n.kind, "broker": n.b_id, "title": n.title, "message": n.message,
+                                       "level": n.level, "ts": n.ts} for n in items]}, ensure_ascii=False)
+        self.pool.post(body.encode("utf-8"), self.headers)
+
+    def close(self):
+        self.pool.close()
+
+
+class TelegramSink(Sink):
+    """Bot API sendMessage，一批合併成一則訊息"""
+    kind = "telegram"
+
+    def __init__(self, token, chat_id, api_base="https://api.telegram.org", **kwargs):
+        super().__init__(**kwargs)
+        self.chat_id = chat_id
+        self.pool = HTTPPool(api_base, self.concurrency, self.timeout)
+        self.path = f"{self.pool.path.rstrip('/')}/bot{token}/sendMessage"
+
+    def send_batch(self, items):
+        text = "\n".join(format_line(n) for n in items)
+        body = json.dumps({"chat_id": self.chat_id, "text": text}, ensure_ascii=False).encode("utf-8")
+        self.pool.post(body, {"Content-Type": "application/json"}, self.path)
+
+    def close(self):
+        self.pool.close()
+
+
+class SmtpSink(Sink):
+    """一批寄一封信；連線保持登入，失效時重新連線"""
+    kind = "smtp"
+
+    def __init__(self, host, sender, recipients, port=587, username=None, password=None, tls=True,
+                 subject="XAUUSD 點差警報", **kwargs):
+        kwargs.setdefault("batch_wait", 10.0)
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = int(port)
+        self.sender = sender
+        self.recipients = [recipients] if isinstance(recipients, str) else list(recipients)
+        self.username = username
+        self.password = password
+        self.tls = tls
+        self.subject = subject
+        self.lock = threading.Lock()   # smtplib 連線不可多執行緒共用
+        self.conn = None
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.tls: conn.starttls()
+        if self.username: conn.login(self.username, self.password or "")
+        return conn
+
+    def send_batch(self, items):
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = ", ".join(self.recipients)
+        msg["Subject"] = items[0].title if len(items) == 1 else f"{self.subject} ({len(items)} 筆)"
+        msg.set_content("\n".join(format_line(n) for n in items))
+        with self.lock:
+            try:
+                if self.conn is None: self.conn = self._connect()
+                self.conn.send_message(msg)
+            except Exception:
+                self.close_conn()
+                raise
+
+    def close_conn(self):
+        if self.conn is not None:
+            try:
+                self.conn.quit()
+            except Exception:
+                pass
+        self.conn = None
+
+    def close(self):
+        with self.lock:
+            self.close_conn()
+
+
+class SyslogSink(Sink):
+    """RFC 3164 UDP，每筆一個封包 (不需要連線，批次只是減少喚醒次數)"""
+    kind = "syslog"
+    FACILITY_USER = 1
+    SEVERITY = {0: 4, 1: 3, 2: 2}   # 層級 1/2/3 -> warning / error / critical
+
+    def __init__(self, host="127.0.0.1", port=514, app="spread-monitor", **kwargs):
+        super().__init__(**kwargs)
+        self.addr = (host, int(port))
+        self.app = app
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send_batch(self, items):
+        hostname = socket.gethostname()
+        for n in items:
+            pri = self.FACILITY_USER * 8 + self.SEVERITY.get(n.level, 5)
+            stamp = time.strftime("%b %d %H:%M:%S", time.localtime(n.ts))
+            self.sock.sendto(f"<{pri}>{stamp} {hostname} {self.app}: {n.message}".encode("utf-8"), self.addr)
+
+    def close(self):
+        self.sock.close()
+
+
+SINK_TYPES = {"webhook": WebhookSink, "telegram": TelegramSink, "smtp": SmtpSink, "syslog": SyslogSink}
+
+
+def build_sinks(config):
+    """由設定列表建立通道，回傳 (通道列表, 錯誤訊息列表)"""
+    sinks, errors = [], []
+    for i, item in enumerate(config or []):
+        params = dict(item)
+        kind = params.pop("type", "")
+        if params.pop("enabled", True) is False: continue
+        cls = SINK_TYPES.get(kind)
+        if cls is None:
+            errors.append(f"通知設定第 {i + 1} 筆: 未知類型 {kind!r}")
+            continue
+        params.setdefault("name", f"{kind}#{i + 1}")
+        try:
+            sinks.append(cls(**params))
+        except Exception as e:
+            errors.append(f"通知設定第 {i + 1} 筆 ({kind}): {e}")
+    return sinks, errors
+
+
+# ==========================================
+#  分送中心
+# ==========================================
+
+class SinkStats:
+    __slots__ = ("sent", "batches", "retries", "failed", "dropped")
+
+    def __init__(self):
+        self.sent = self.batches = self.retries = self.failed = self.dropped = 0
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class NotificationHub:
+    """
+    用法:
+        hub = NotificationHub(sinks, log=callback).start()
+        hub.publish(notification)   # 任何執行緒，不阻塞
+        hub.stop()
+    """
+
+    def __init__(self, sinks, log=None):
+        self.sinks = list(sinks)
+        self.log = log
+        self.names = {}   # b_id -> 顯示名稱 (選填)
+        self.stats = {s.name: SinkStats() for s in self.sinks}
+        self.loop = None
+        self.queues = {}
+        self.thread = None
+        self.ready = threading.Event()
+        workers = sum(s.concurrency for s in self.sinks) or 1
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="notify")
+
+    def _log(self, msg):
+        if self.log:
+            try:
+                self.log(msg)
+            except Exception:
+                pass
+
+    def start(self):
+        if not self.sinks: return self
+        self.thread = threading.Thread(target=self._run, daemon=True, name="notify-hub")
+        self.thread.start()
+        self.ready.wait(5)
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        for sink in self.sinks:
+            q = asyncio.Queue(maxsize=sink.queue_size)
+            self.queues[sink.name] = q
+            for _ in range(sink.concurrency):
+                self.loop.create_task(self._worker(sink, q))
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+
+    def publish_alert(self, item):
+        """AlertEvaluator 的 notify 回呼：AlertTransition 或 RuleEvent"""
+        name = self.names.get(item.b_id)
+        self.publish(from_transition(item, name) if hasattr(item, "tiers") else from_rule_event(item, name))
+
+    def publish(self, notification):
+        if self.loop is None or self.loop.is_closed(): return
+        try:
+            self.loop.call_soon_threadsafe(self._enqueue, notification)
+        except RuntimeError:
+            pass   # 事件迴圈已關閉
+
+    def _enqueue(self, notification):
+        for sink in self.sinks:
+            try:
+                self.queues[sink.name].put_nowait(notification)
+            except asyncio.QueueFull:
+                self.stats[sink.name].dropped += 1
+
+    async def _worker(self, sink, q):
+        stats = self.stats[sink.name]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await q.get()]
+            deadline = loop.time() + sink.batch_wait
+            while len(batch) < sink.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0: break
+                try:
+                    batch.append(await asyncio.wait_for(q.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            for attempt in range(sink.max_retries + 1):
+                try:
+                    await loop.run_in_executor(self.executor, sink.send_batch, batch)
+                    stats.sent += len(batch)
+                    stats.batches += 1
+                    break
+                except Exception as e:
+                    if attempt >= sink.max_retries:
+                        stats.failed += len(batch)
+                        self._log(f"通知 [{sink.name}] 放棄 {len(batch)} 筆: {e}")
+                        break
+                    stats.retries += 1
+                    delay = min(sink.backoff * (2 ** attempt), MAX_BACKOFF)
+                    await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    def snapshot(self):
+        return {name: s.as_dict() for name, s in self.stats.items()}
+
+    def stop(self):
+        """停止事件迴圈並關閉通道連線 (尚未送出的通知會被放棄)"""
+        if self.loop is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+            except RuntimeError:
+                pass
+        if self.thread is not None:
+            self.thread.join(5)
+        self.executor.shutdown(wait=False)
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception:
+                pass
@@ -2,7 +2,6 @@ import sys
 import os
 import json
 import time
-import threading
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QLineEdit, QPushButton, 
                              QTextEdit, QTabWidget, QGroupBox, QGridLayout, 
@@ -16,7 +15,9 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from playsound import playsound
+
+from audio_engine import AudioEngine
+from config_schema import read_document, compile_config, format_number
 
 # --- 設定檔名稱 ---
 CONFIG_FILE = "monitor_config.json"
@@ -120,6 +121,8 @@ class CrawlerThread(QThread):
 
 # --- 主視窗 ---
 class GoldMonitorApp(QMainWindow):
+    audio_log_signal = pyqtSignal(str)  # 音效執行緒 -> 日誌
+
     def __init__(self):
         super().__init__()
         
@@ -128,6 +131,11 @@ class GoldMonitorApp(QMainWindow):
         
         self.crawler_thread = None
 
+        # 音效預先載入，單一播放執行緒 (取代每次警報開新執行緒 + playsound 讀檔)
+        self.audio = AudioEngine(log=self.audio_log_signal.emit)
+        self.audio_log_signal.connect(self.log_message)
+        self.audio.start()
+
         # 初始化 UI
         self.init_ui()
         
@@ -356,7 +364,7 @@ class GoldMonitorApp(QMainWindow):
                     
                     # 加入播放清單
                     if tier['sound']:
-                        sounds_to_play.append((threshold, tier['sound']))
+                        sounds_to_play.append((threshold, tier['sound'], i))
                 
                 # 如果已經是 "已播放"，則什麼都不做 (靜音保持狀態)
 
@@ -374,8 +382,11 @@ class GoldMonitorApp(QMainWindow):
             # 排序：根據 threshold (item[0]) 由大到小
             sounds_to_play.sort(key=lambda x: x[0], reverse=True)
             
-            best_sound_path = sounds_to_play[0][1]
-            threading.Thread(target=self.play_sound_task, args=(best_sound_path, 2), daemon=True).start()
+            _, best_sound_path, level = sounds_to_play[0]
+            if os.path.exists(best_sound_path):
+                self.audio.play(best_sound_path, priority=level, repeat=2)
+            else:
+                self.log_message(f"找不到音效檔: {best_sound_path}")
 
     def get_tier_settings(self):
         data = []
@@ -388,17 +399,6 @@ class GoldMonitorApp(QMainWindow):
             data.append({"diff": val, "sound": path})
         return data
 
-    def play_sound_task(self, path, repeat_count):
-        if not os.path.exists(path):
-            self.log_message(f"找不到音效檔: {path}")
-            return
-        
-        try:
-            for i in range(repeat_count):
-                playsound(path)
-        except Exception as e:
-            self.log_message(f"播放失敗: {e}")
-
     def start_monitor(self):
         base_path = self.get_base_path()
         driver_path = os.path.join(base_path, "chromedriver.exe")
@@ -408,6 +408,7 @@ class GoldMonitorApp(QMainWindow):
             return
 
         self.save_settings()
+        self.audio.preload(t['sound'] for t in self.get_tier_settings())
 
         self.btn_start.setEnabled(False)
         self.btn_stop.setEnabled(True)
@@ -445,20 +446,25 @@ class GoldMonitorApp(QMainWindow):
             self.log_message(f"設定儲存失敗: {e}")
 
     def load_settings(self):
+        """讀取設定檔 (經 config_schema 轉換與驗證，只取永豐 WF 的門檻)"""
         if not os.path.exists(CONFIG_FILE):
             return
         
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            for i, item in enumerate(data):
-                if i < len(self.tiers):
-                    if item['diff'] > 0:
-                        self.tiers[i]['diff'].setText(str(item['diff']))
-                    self.tiers[i]['sound'].setText(item.get('sound', ''))
+            doc, source = read_document(CONFIG_FILE)
         except Exception as e:
             self.log_message(f"讀取設定失敗: {e}")
+            return
+        config, errors = compile_config(doc, source)
+        for msg in errors:
+            self.log_message(msg)
+
+        policy = config.alerts.get("WF")
+        if policy is None: return
+        for i, tier in enumerate(policy.tiers):
+            if i < len(self.tiers):
+                self.tiers[i]['diff'].setText(format_number(tier.diff))
+                self.tiers[i]['sound'].setText(tier.sound)
 
     def closeEvent(self, event):
         if self.crawler_thread and self.crawler_thread.isRunning():
@@ -469,11 +475,13 @@ class GoldMonitorApp(QMainWindow):
                 self.crawler_thread.stop()
                 self.crawler_thread.wait()
                 self.save_settings()
+                self.audio.stop()
                 event.accept()
             else:
                 event.ignore()
         else:
             self.save_settings()
+            self.audio.stop()
             event.accept()
 
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+共享記憶體最新報價表 (同機程式零序列化讀取，不依賴 Qt)
+監控端 (S.py / monitor_daemon.py) 每筆 tick 覆寫對應券商的列，其他程式直接映射同一塊記憶體輪詢，
+不經過 socket、不需要解碼訊息
+
+配置 (little-endian，C 程式可依此自行映射):
+    表頭 32 bytes   <4sIIIQQ>  magic "SPQT", 版本, 列數上限, 每列大小, generation, 已使用列數
+    每列 96 bytes   <QdddII48s8x>  seq, ts, bid, ask, status, ticks(累計筆數, 32-bit 迴繞), 報價代號 (券商[:商品])
+報價代號以 UTF-8 存放，最長 48 bytes；超過的代號不寫入 (不截斷，避免不同代號截斷後相同)
+generation 在新增 / 移除券商列時遞增，讀取端據此更新「券商 -> 列」對照；
+移除的列清空代號 (讀取端略過)，之後新增的券商優先沿用空出的列
+
+Seqlock (每列一個 seq，單一寫入端):
+    寫入: seq += 1 (奇數，寫入中) -> 寫入欄位 -> seq += 1 (偶數，完成)
+    讀取: 讀 seq (奇數則重試) -> 讀欄位 -> 再讀 seq，兩次相同才採用，否則重試
+    讀取端不加鎖、不阻塞寫入端；x86 的寫入順序保證足以讓上述流程成立
+
+用法:
+    table = QuoteTable().open()         # 寫入端
+    table.update("WF", bid, ask, ts)
+    reader = QuoteReader()              # 讀取端 (另一個程式)
+    reader.get("WF") -> Quote(b_id, bid, ask, ts, status, ticks) 或 None
+    python quote_shm.py                 # 終端機即時顯示
+"""
+
+import heapq
+import struct
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+DEFAULT_NAME = "spread_quotes"
+DEFAULT_CAPACITY = 64
+VERSION = 2   # 2: 報價代號欄位 16 -> 48 bytes
+MAGIC = b"SPQT"
+
+HEADER = struct.Struct("<4sIIIQQ")
+KEY_SIZE = 48
+ROW = struct.Struct(f"<QdddII{KEY_SIZE}s8x")
+SEQ = struct.Struct("<Q")
+FIELDS = struct.Struct(f"<dddII{KEY_SIZE}s")   # ROW 去掉 seq 與尾端補齊
+MAX_RETRIES = 1000
+
+STATUS_EMPTY, STATUS_OK, STATUS_SUSPECT, STATUS_WAITING, STATUS_ERROR = range(5)
+STATUS_NAMES = ["空", "正常", "可疑", "等待", "異常"]
+
+Quote = namedtuple("Quote", ["b_id", "bid", "ask", "ts", "status", "ticks"])
+
+
+def status_code(msg):
+    """UnifiedMonitor 的狀態文字 -> 狀態碼"""
+    if msg == "監控中": return STATUS_OK
+    if msg == "等待數據": return STATUS_WAITING
+    return STATUS_ERROR
+
+
+def _attach(name):
+    """以讀取端身分映射既有區塊；避免 resource_tracker 在讀取端結束時把區塊刪除"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+class QuoteTable:
+    """寫入端；只能在單一執行緒呼叫 (GUI 執行緒或 daemon 主迴圈)"""
+
+    def __init__(self, name=DEFAULT_NAME, capacity=DEFAULT_CAPACITY, log=None):
+        self.name = name
+        self.capacity = capacity
+        self.log = log
+        self.shm = None
+        self.buf = None
+        self.rows = {}    # b_id -> 列索引
+        self.state = {}   # b_id -> [bid, ask, ts, status, ticks]
+        self.keys = {}    # b_id -> 編碼後的報價代號
+        self.free = []    # 已移除券商空出的列 (heap，優先使用最前面的列)
+        self.used = 0     # 曾經使用過的列數 (表頭的已使用列數，讀取端只掃描到這裡)
+        self.rejected = set()  # 代號過長而不寫入的券商
+        self.generation = 0
+
+    def open(self):
+        size = HEADER.size + ROW.size * self.capacity
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # 上次異常結束留下的區塊：大小足夠就沿用並清空，否則刪除重建
+            self.shm = _attach(self.name)
+            if self.shm.size < size:
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.buf[:size] = bytes(size)
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, self.capacity, ROW.size, 0, 0)
+        return self
+
+    def _write(self, b_id, st):
+        row = self.rows.get(b_id)
+        new = row is None
+        if new:
+            if b_id in self.rejected or (not self.free and self.used >= self.capacity): return
+            key = b_id.encode("utf-8")
+            if len(key) > KEY_SIZE:
+                self.rejected.add(b_id)
+                if self.log: self.log(f"報價表: 代號 {b_id} 超過 {KEY_SIZE} bytes，不寫入共享記憶體")
+                return
+            self.keys[b_id] = key
+            if self.free:
+                row = heapq.heappop(self.free)
+            else:
+                row = self.used
+                self.used += 1
+            self.rows[b_id] = row
+        buf = self.buf
+        off = HEADER.size + row * ROW.size
+        seq = SEQ.unpack_from(buf, off)[0]
+        SEQ.pack_into(buf, off, seq + 1)
+        FIELDS.pack_into(buf, off + SEQ.size, st[2], st[0], st[1], st[3], st[4] & 0xFFFFFFFF,
+                         self.keys[b_id])
+        SEQ.pack_into(buf, off, seq + 2)
+        if new:
+            # 列內容寫好之後才公布，讀取端看到新的 generation 時一定讀得到券商代號
+            self._publish()
+
+    def _publish(self):
+        self.generation += 1
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, self.capacity, ROW.size, self.generation, self.used)
+
+    def remove(self, b_id):
+        """券商被移除：清空其列 (讀取端不再看到這個代號)，列留給之後新增的券商"""
+        self.state.pop(b_id, None)
+        self.keys.pop(b_id, None)
+        self.rejected.discard(b_id)
+        row = self.rows.pop(b_id, None)
+        if row is None or self.buf is None: return
+        buf = self.buf
+        off = HEADER.size + row * ROW.size
+        seq = SEQ.unpack_from(buf, off)[0]
+        SEQ.pack_into(buf, off, seq + 1)
+        FIELDS.pack_into(buf, off + SEQ.size, 0.0, 0.0, 0.0, STATUS_EMPTY, 0, b"")
+        SEQ.pack_into(buf, off, seq + 2)
+        heapq.heappush(self.free, row)
+        self._publish()
+
+    def update(self, b_id, bid, ask, ts, status=STATUS_OK):
+        if self.buf is None: return
+        st = self.state.get(b_id)
+        if st is None:
+            st = self.state[b_id] = [bid, ask, ts, status, 0]
+        st[0], st[1], st[2], st[3] = bid, ask, ts, status
+        st[4] += 1
+        self._write(b_id, st)
+
+    def set_status(self, b_id, status):
+        if self.buf is None: return
+        st = self.state.get(b_id)
+        if st is None:
+            st = self.state[b_id] = [0.0, 0.0, 0.0, status, 0]
+        elif st[3] == status:
+            return
+        st[3] = status
+        self._write(b_id, st)
+
+    def close(self):
+        if self.shm is None: return
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = None
+
+
+class QuoteReader:
+    """讀取端；不加鎖，任何程式 / 執行緒皆可建立"""
+
+    def __init__(self, name=DEFAULT_NAME):
+        self.shm = _attach(name)
+        self.buf = self.shm.buf
+        magic, version, self.capacity, row_size, _, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION or row_size != ROW.size:
+            self.close()
+            raise ValueError(f"{name} 不是相容的報價表 (版本 {version})")
+        self.generation = -1
+        self.rows = {}
+
+    def refresh(self):
+        """券商列有增加時重建對照表"""
+        _, _, _, _, generation, count = HEADER.unpack_from(self.buf, 0)
+        if generation == self.generation: return
+        rows = {}
+        for row in range(min(count, self.capacity)):
+            quote = self.read(row)
+            if quote is not None and quote.b_id: rows[quote.b_id] = row
+        self.rows = rows
+        self.generation = generation
+
+    def read(self, row):
+        """一致的單列快照；寫入端持續寫入同一列時重試，超過次數回傳 None"""
+        buf = self.buf
+        off = HEADER.size + row * ROW.size
+        for _ in range(MAX_RETRIES):
+            s1 = SEQ.unpack_from(buf, off)[0]
+            if s1 & 1: continue
+            ts, bid, ask, status, ticks, raw = FIELDS.unpack_from(buf, off + SEQ.size)
+            if SEQ.unpack_from(buf, off)[0] == s1:
+                return Quote(raw.rstrip(b"\0").decode("utf-8", "replace"), bid, ask, ts, status, ticks)
+        return None
+
+    def get(self, b_id):
+        self.refresh()
+        row = self.rows.get(b_id)
+        return None if row is None else self.read(row)
+
+    def snapshot(self):
+        """所有券商的最新報價 {b_id: Quote}"""
+        self.refresh()
+        out = {}
+        for b_id, row in self.rows.items():
+            quote = self.read(row)
+            if quote is not None: out[b_id] = quote
+        return out
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    import time
+    import argparse
+    parser = argparse.ArgumentParser(description="顯示共享記憶體報價表")
+    parser.add_argument("--name", default=DEFAULT_NAME)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args(argv)
+    with QuoteReader(args.name) as reader:
+        while True:
+            now = time.time()
+            lines = [f"{'券商':<20}{'Bid':>10}{'Ask':>10}{'點差':>8}{'秒前':>8}  狀態"]
+            for b_id, q in sorted(reader.snapshot().items()):
+                age = now - q.ts if q.ts else float("nan")
+                lines.append(f"{b_id:<20}{q.bid:>10.2f}{q.ask:>10.2f}{q.ask - q.bid:>8.2f}{age:>8.1f}  "
+                             f"{STATUS_NAMES[q.status]}")
+            print("\n".join(lines) + "\n", flush=True)
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
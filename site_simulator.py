@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+本機券商網站模擬器 (壓力測試 / 回歸測試用)
+1. 內建 HTTP 伺服器，每個模擬站台重現對應券商的價格 DOM 結構：
+   WF #pm-llg 多行文字、IG .price-ticket__price、Oanda 表格列、Forex mp__td、
+   MW XAUUSD1/2、Axi .price、Capital 按鈕多行、KVB style_price、VT data-symbol、
+   Markets data-sell/data-buy、IFC current_instrument、CMC data-jsonfeed、MF iframe ticker
+2. 頁面內的 JS 依設定頻率輪詢 /quote/<站台>，就地更新 DOM (與真實網站推播後改寫 DOM 的效果相同)
+3. 價格來源：共同隨機漫步 + 各站台基差/點差雜訊，或由 tick 紀錄檔 (ticks_<日期>.csv) 驅動
+4. 伺服器端保留每個站台產生過的報價 (序號)，供基準測試計算掉 tick 率
+
+用法:
+    python site_simulator.py --sites 12 --rate 2 --port 8765
+    python site_simulator.py --sites 50 --record ticks/ticks_20260101.csv --print-config
+"""
+
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_PORT = 8765
+DEFAULT_RATE = 2.0        # 每個站台每秒報價次數
+DEFAULT_POLL_MS = 100     # 頁面 JS 輪詢間隔
+BASE_PRICE = 2350.0
+HISTORY_SIZE = 5000       # 每個站台保留的報價歷史筆數 (不同的 bid/ask 組合)
+
+# ==========================================
+#  各券商 DOM 樣板
+#  data-sim="bid"/"ask" 標記由 JS 更新的元素，不影響原本的選擇器
+# ==========================================
+
+def _tpl_wf(b, a):
+    return ('<div id="pm-llg"><div>倫敦金 LLG</div><div>買入 / 賣出</div>'
+            f'<div data-sim="bid">{b}</div><div data-sim="ask">{a}</div></div>')
+
+
+def _tpl_ig(b, a):
+    return ('<div class="price-ticket">'
+            f'<div class="price-ticket__button price-ticket__button--sell"><span>賣出</span>'
+            f'<div class="price-ticket__price" data-sim="bid">{b}</div></div>'
+            f'<div class="price-ticket__button price-ticket__button--buy"><span>買入</span>'
+            f'<div class="price-ticket__price" data-sim="ask">{a}</div></div></div>')
+
+
+def _tpl_oanda(b, a):
+    return ('<table><tr><th>Instrument</th><th>Sell</th><th>Buy</th></tr>'
+            '<tr><td><span>Silver</span></td><td>29.512</td><td>29.541</td></tr>'
+            f'<tr><td><span>Gold</span></td><td data-sim="bid">{b}</td><td data-sim="ask">{a}</td></tr>'
+            '<tr><td><span>Platinum</span></td><td>981.20</td><td>984.10</td></tr></table>')
+
+
+def _tpl_forex(b, a):
+    return ('<table class="mp__table"><tr><td><a title="XAG USD">XAG/USD</a></td>'
+            '<td class="mp__td--Bid">29.51</td><td class="mp__td--Offer">29.54</td></tr>'
+            f'<tr><td><a title="XAU USD">XAU/USD</a></td><td class="mp__td--Bid" data-sim="bid">{b}</td>'
+            f'<td class="mp__td--Offer" data-sim="ask">{a}</td></tr></table>')
+
+
+def _tpl_mw(b, a):
+    return (f'<div class="quote"><span id="XAUUSD1" data-sim="bid">{b}</span> / '
+            f'<span id="XAUUSD2" data-sim="ask">{a}</span></div>')
+
+
+def _tpl_axi(b, a):
+    return ('<table><tr><td><span id="XAGUSD">XAGUSD</span></td><td class="price">29.51</td>'
+            '<td class="price">29.54</td></tr>'
+            f'<tr><td><span id="XAUUSD">XAUUSD</span></td><td class="price" data-sim="bid">{b}</td>'
+            f'<td class="price" data-sim="ask">{a}</td></tr></table>')
+
+
+def _tpl_capital(b, a):
+    blk = 'style="display:block"'
+    return (f'<button class="market-card"><span {blk}>Gold Spot</span><span {blk}>XAU/USD</span>'
+            f'<span {blk} data-sim="bid">{b}</span><span {blk} data-sim="ask">{a}</span></button>')
+
+
+def _tpl_kvb(b, a):
+    return ('<table><tr><td>XAGUSD</td><td><div class="style_price__a1">29.51</div></td>'
+            '<td><div class="style_price__a1">29.54</div></td></tr>'
+            f'<tr><td>XAUUSD</td><td><div class="style_price__a1" data-sim="bid">{b}</div></td>'
+            f'<td><div class="style_price__a1" data-sim="ask">{a}</div></td></tr></table>')
+
+
+def _tpl_vt(b, a):
+    return ('<table><tr><td data-symbol="XAUUSD">XAUUSD</td>'
+            f'<td class="bid_text" data="{b}" data-sim="bid">{b}</td>'
+            f'<td class="ask_text" data="{a}" data-sim="ask">{a}</td></tr></table>')
+
+
+def _tpl_markets(b, a):
+    return ('<div class="instrument-buttons">'
+            f'<div class="cta-sell">Sell <span data-sell="" data-sim="bid">{b}</span></div>'
+            f'<div class="cta-buy">Buy <span data-buy="" data-sim="ask">{a}</span></div></div>')
+
+
+def _tpl_ifc(b, a):
+    return (f'<div><span class="current_instrument_bid" data-sim="bid">{b}</span>'
+            f'<span class="current_instrument_ask" data-sim="ask">{a}</span></div>')
+
+
+def _tpl_cmc(b, a):
+    return (f'<div><span data-jsonfeed="sell" data-sim="bid">{b}</span>'
+            f'<span data-jsonfeed="buy" data-sim="ask">{a}</span></div>')
+
+
+def _tpl_mf_frame(b, a):
+    return (f'<div class="ticker"><span id="ticker_bid_375" data-sim="bid">{b}</span>'
+            f'<span id="ticker_ask_375" data-sim="ask">{a}</span></div>')
+
+
+# key -> (名稱, 樣板, 價格格式, S.py 通用爬蟲規則 或 None)
+TEMPLATES = {
+    "WF": ("永豐金業", _tpl_wf, "{:.2f}",
+           {"bid_type": "id", "bid_selector": "pm-llg", "ask_type": "id", "ask_selector": "pm-llg"}),
+    "IG": ("IG Markets", _tpl_ig, "{:,.2f}",
+           {"bid_type": "css", "bid_selector": ".price-ticket__button--sell .price-ticket__price",
+            "ask_type": "css", "ask_selector": ".price-ticket__button--buy .price-ticket__price"}),
+    "Oanda": ("Oanda", _tpl_oanda, "{:.3f}",
+              {"bid_type": "xpath", "bid_selector": "//tr[.//span[contains(text(), 'Gold')]]/td[2]",
+               "ask_type": "xpath", "ask_selector": "//tr[.//span[contains(text(), 'Gold')]]/td[3]"}),
+    "Forex": ("Forex.com", _tpl_forex, "{:.2f}",
+              {"bid_type": "xpath", "bid_selector": "//tr[.//a[@title='XAU USD']]/td[contains(@class, 'mp__td--Bid')]",
+               "ask_type": "xpath", "ask_selector": "//tr[.//a[@title='XAU USD']]/td[contains(@class, 'mp__td--Offer')]"}),
+    "MW": ("英皇金業", _tpl_mw, "{:.2f}",
+           {"bid_type": "id", "bid_selector": "XAUUSD1", "ask_type": "id", "ask_selector": "XAUUSD2"}),
+    "Axi": ("Axi", _tpl_axi, "{:.2f}",
+            {"bid_type": "xpath", "bid_selector": "//tr[.//span[@id='XAUUSD']]/td[contains(@class, 'price')][1]",
+             "ask_type": "xpath", "ask_selector": "//tr[.//span[@id='XAUUSD']]/td[contains(@class, 'price')][2]"}),
+    "Capital": ("Capital.com", _tpl_capital, "{:.2f}",
+                {"bid_type": "xpath", "bid_selector": "//span[contains(text(), 'Gold Spot')]/ancestor::button",
+                 "ask_type": "xpath", "ask_selector": "//span[contains(text(), 'Gold Spot')]/ancestor::button"}),
+    "KVB": ("KVB Plus", _tpl_kvb, "{:.2f}",
+            {"bid_type": "xpath", "bid_selector": "//tr[td[text()='XAUUSD']]//div[contains(@class, 'style_price')]",
+             "ask_type": "xpath", "ask_selector": "(//tr[td[text()='XAUUSD']]//div[contains(@class, 'style_price')])[2]"}),
+    "VT": ("VT Markets", _tpl_vt, "{:.2f}",
+           {"bid_type": "xpath", "bid_selector": "//td[@data-symbol='XAUUSD']/ancestor::tr/td[contains(@class, 'bid_text')]",
+            "ask_type": "xpath", "ask_selector": "//td[@data-symbol='XAUUSD']/ancestor::tr/td[contains(@class, 'ask_text')]"}),
+    "Markets": ("Markets.com", _tpl_markets, "{:.2f}",
+                {"bid_type": "css", "bid_selector": ".instrument-buttons .cta-sell span[data-sell]",
+                 "ask_type": "css", "ask_selector": ".instrument-buttons .cta-buy span[data-buy]"}),
+    "IFC": ("IFC Markets", _tpl_ifc, "{:.2f}",
+            {"bid_type": "css", "bid_selector": ".current_instrument_bid",
+             "ask_type": "css", "ask_selector": ".current_instrument_ask"}),
+    "CMC": ("CMC Markets", _tpl_cmc, "{:,.2f}",
+            {"bid_type": "css", "bid_selector": "span[data-jsonfeed='sell']",
+             "ask_type": "css", "ask_selector": "span[data-jsonfeed='buy']"}),
+    # MF 價格在 iframe 內，S.py 的通用爬蟲無法處理
+    "MF": ("Mega Fusion", None, "{:.2f}", None),
+}
+
+# 頁面輪詢 JS (注意: 不可出現 XAUUSD 字樣，以免被 KVB 的 contains(text()) 選到)
+POLL_JS = """<script>
+(function () {
+  var site = "%(sid)s";
+  function put(sel, v) {
+    document.querySelectorAll('[data-sim="' + sel + '"]').forEach(function (e) {
+      e.textContent = v;
+      if (e.hasAttribute("data")) e.setAttribute("data", v);
+    });
+  }
+  function tick() {
+    fetch("/quote/" + site).then(function (r) { return r.json(); }).then(function (q) {
+      put("bid", q.bid); put("ask", q.ask);
+      document.body.setAttribute("data-seq", q.seq);
+    }).catch(function () {}).then(function () { setTimeout(tick, %(poll)d); });
+  }
+  setTimeout(tick, %(poll)d);
+})();
+</script>"""
+
+
+class SimulatedSite:
+    """單一模擬站台的即時報價與歷史"""
+
+    def __init__(self, sid, template, offset, base_spread):
+        self.sid = sid
+        self.template = template
+        self.name = TEMPLATES[template][0]
+        self.fmt = TEMPLATES[template][2]
+        self.offset = offset
+        self.base_spread = base_spread
+        self.bid = BASE_PRICE + offset
+        self.ask = self.bid + base_spread
+        self.seq = 0
+        self.history = OrderedDict()  # (bid, ask) -> (ts, seq)，同一報價只保留最近一次，最舊在前
+        self.lock = threading.Lock()
+
+    def set_quote(self, bid, ask, ts):
+        with self.lock:
+            self.bid = round(bid, 2)
+            self.ask = round(ask, 2)
+            self.seq += 1
+            key = (self.bid, self.ask)
+            self.history[key] = (ts, self.seq)
+            self.history.move_to_end(key)
+            if len(self.history) > HISTORY_SIZE:
+                self.history.popitem(last=False)
+
+    def lookup(self, bid, ask):
+        """報價 -> 最近一次產生的 (ts, seq)，O(1)；找不到回傳 None"""
+        with self.lock:
+            return self.history.get((round(bid, 2), round(ask, 2)))
+
+    def quote(self):
+        with self.lock:
+            return {"bid": self.fmt.format(self.bid), "ask": self.fmt.format(self.ask), "seq": self.seq,
+                    "raw_bid": self.bid, "raw_ask": self.ask}
+
+
+class PriceFeed(threading.Thread):
+    """
+    報價產生器：單一執行緒以排程堆積輪流更新所有站台
+    record_events 不為 None 時依紀錄檔的各券商中價/點差序列依序播放
+    """
+
+    def __init__(self, sites, rate=DEFAULT_RATE, volatility=0.15, record_events=None, seed=None):
+        super().__init__(daemon=True)
+        self.sites = sites
+        self.rate = rate
+        self.volatility = volatility
+        self.running = True
+        self.rng = random.Random(seed)
+        self.mid = BASE_PRICE
+        self.recorded = self._split_record(record_events) if record_events else None
+
+    def _split_record(self, events):
+        """依券商拆成 (bid, ask) 序列，再循環分配給模擬站台"""
+        per_broker = {}
+        for ts, source, bid, ask, status in events:
+            if bid > 0 and ask > 0:
+                per_broker.setdefault(source, []).append((bid, ask))
+        series = [v for _, v in sorted(per_broker.items()) if v]
+        if not series: return None
+        return {s.sid: [series[i % len(series)], 0] for i, s in enumerate(self.sites)}
+
+    def next_quote(self, site):
+        if self.recorded:
+            seq, pos = self.recorded[site.sid]
+            bid, ask = seq[pos % len(seq)]
+            self.recorded[site.sid][1] = pos + 1
+            return bid, ask
+        noise = self.rng.gauss(0, 0.03)
+        spread = max(0.05, site.base_spread + abs(self.rng.gauss(0, 0.05)))
+        bid = self.mid + site.offset + noise - spread / 2
+        return bid, bid + spread
+
+    def run(self):
+        period = 1.0 / self.rate if self.rate > 0 else 1.0
+        now = time.perf_counter()
+        # 錯開各站台的第一次更新時間
+        heap = [(now + self.rng.random() * period, i) for i in range(len(self.sites))]
+        heapq.heapify(heap)
+        last_walk = now
+
+        while self.running and heap:
+            due, i = heap[0]
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(min(delay, 0.05))
+                continue
+            heapq.heapreplace(heap, (due + period, i))
+
+            # 共同中價隨機漫步 (依經過時間縮放)
+            t = time.perf_counter()
+            dt = t - last_walk
+            if dt > 0:
+                self.mid += self.rng.gauss(0, self.volatility * dt ** 0.5)
+                last_walk = t
+
+            site = self.sites[i]
+            bid, ask = self.next_quote(site)
+            site.set_quote(bid, ask, time.time())
+
+    def stop(self):
+        self.running = False
+
+
+class SiteSimulator:
+    """
+    模擬器本體
+    用法: sim = SiteSimulator(12); sim.start(); ... sim.brokers_config() ...; sim.stop()
+    """
+
+    def __init__(self, count=12, rate=DEFAULT_RATE, port=DEFAULT_PORT, host="127.0.0.1",
+                 poll_ms=DEFAULT_POLL_MS, record_events=None, seed=None):
+        self.host = host
+        self.port = port
+        self.poll_ms = poll_ms
+        rng = random.Random(seed)
+        keys = list(TEMPLATES.keys())
+        self.sites = []
+        for i in range(count):
+            key = keys[i % len(keys)]
+            sid = key if i < len(keys) else f"{key}{i // len(keys) + 1}"
+            self.sites.append(SimulatedSite(sid, key, rng.uniform(-0.3, 0.3), rng.uniform(0.15, 0.6)))
+        self.site_map = {s.sid: s for s in self.sites}
+        self.feed = PriceFeed(self.sites, rate, record_events=record_events, seed=seed)
+        self.server = None
+        self.server_thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def url_for(self, site):
+        return f"{self.base_url}/site/{site.sid}"
+
+    # ---------------------------
+    #    頁面產生
+    # ---------------------------
+    def render_page(self, site):
+        q = site.quote()
+        if site.template == "MF":
+            body = f'<h3>Precious Metals</h3><iframe src="/frame/{site.sid}" width="600" height="120"></iframe>'
+            script = ""
+        else:
+            body = TEMPLATES[site.template][1](q["bid"], q["ask"])
+            script = POLL_JS % {"sid": site.sid, "poll": self.poll_ms}
+        return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{site.name} (模擬)</title></head>'
+                f'<body data-seq="{q["seq"]}">{body}{script}</body></html>')
+
+    def render_frame(self, site):
+        q = site.quote()
+        body = _tpl_mf_frame(q["bid"], q["ask"])
+        script = POLL_JS % {"sid": site.sid, "poll": self.poll_ms}
+        return f'<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>{body}{script}</body></html>'
+
+    def stats(self):
+        return {s.sid: {"template": s.template, "seq": s.seq} for s in self.sites}
+
+    # ---------------------------
+    #    匯出給各引擎的設定
+    # ---------------------------
+    def brokers_config(self):
+        """S.py (monitor_config_v11_dynamic.json) 格式的券商列表；MF 因 iframe 不支援而略過"""
+        result = []
+        for s in self.sites:
+            rules = TEMPLATES[s.template][3]
+            if rules is None: continue
+            entry = {"id": s.sid, "name": f"{s.name} [{s.sid}]", "url": self.url_for(s)}
+            entry.update(rules)
+            result.append(entry)
+        return result
+
+    def sites_config(self):
+        """G9/G15/GOLD_PRO 格式：{key: {url, handle, name, scraper}}，scraper 為對應的 scrape_<key> 名稱"""
+        return {s.sid: {"url": self.url_for(s), "handle": None, "name": s.name, "scraper": s.template}
+                for s in self.sites}
+
+    # ---------------------------
+    #    啟動/停止
+    # ---------------------------
+    def start(self):
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                pass  # 壓測時不輸出每個請求
+
+            def send_body(self, body, ctype):
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                site = sim.site_map.get(parts[1]) if len(parts) == 2 else None
+                if parts[0] == "quote" and site:
+                    self.send_body(json.dumps(site.quote()), "application/json")
+                elif parts[0] == "site" and site:
+                    self.send_body(sim.render_page(site), "text/html; charset=utf-8")
+                elif parts[0] == "frame" and site:
+                    self.send_body(sim.render_frame(site), "text/html; charset=utf-8")
+                elif parts == ["api", "stats"]:
+                    self.send_body(json.dumps(sim.stats()), "application/json")
+                elif parts == [""]:
+                    links = "".join(f'<li><a href="/site/{s.sid}">{s.name} [{s.sid}]</a></li>' for s in sim.sites)
+                    self.send_body(f"<html><body><ul>{links}</ul></body></html>", "text/html; charset=utf-8")
+                else:
+                    self.send_error(404)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]  # port=0 時取得系統分配的埠
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.feed.start()
+        return self
+
+    def stop(self):
+        self.feed.stop()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本機券商網站模擬器")
+    parser.add_argument("--sites", type=int, default=12, help="模擬站台數 (依序循環使用各券商樣板)")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="每個站台每秒報價次數")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--poll-ms", type=int, default=DEFAULT_POLL_MS, help="頁面 JS 輪詢間隔 (毫秒)")
+    parser.add_argument("--record", nargs="*", help="以 tick 紀錄檔驅動報價 (取代隨機漫步)")
+    parser.add_argument("--print-config", action="store_true", help="輸出 S.py 格式的券商設定 JSON")
+    args = parser.parse_args(argv)
+
+    events = None
+    if args.record:
+        from tick_replay import load_session
+        events = load_session(args.record)
+
+    sim = SiteSimulator(args.sites, args.rate, args.port, poll_ms=args.poll_ms, record_events=events).start()
+    if args.print_config:
+        print(json.dumps({"brokers": sim.brokers_config()}, ensure_ascii=False, indent=4))
+    print(f"模擬器已啟動: {sim.base_url}/ ({len(sim.sites)} 個站台, 每站 {args.rate:g} tick/秒)，Ctrl+C 結束")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+即時點差 / 中價圖表
+1. 每個券商一個固定大小的 NumPy 環形緩衝區 (時間、中價、點差)，寫入 O(1)，記憶體固定不增長
+2. 繪圖前以 min/max 抽樣 (decimation) 壓縮到像素寬度：每個像素欄只保留該區間的最高與最低，
+   尖峰不會被抽掉，繪圖成本只和圖表寬度有關，與時間窗內的 tick 數量無關
+3. 抽樣結果以「絕對時間對齊的桶」快取，畫面隨時間平移時已完成的桶直接重用，
+   每幀只重算最後一桶之後的新 tick (切換時間窗時才整段重算一次)
+4. 點陣直接寫入 QPolygonF 的記憶體 (不逐點建立 QPointF)；QTimer 每幀重繪一次 (預設 30 fps)，
+   沒有新資料或分頁隱藏時不重繪
+5. 不同商品的價格尺度不同 (XAUUSD / XAGUSD)，一次只畫同一商品的報價代號，以 set_instrument 切換
+"""
+
+import math
+import datetime
+
+import numpy as np
+
+from PyQt6.QtCore import Qt, QTimer, QPointF, QRectF
+from PyQt6.QtGui import QPainter, QPen, QColor, QFont, QPolygonF
+from PyQt6.QtWidgets import QWidget
+
+from config_schema import split_key
+from spread_stats import instrument_decimals
+
+# 每個券商保留的 tick 數 (約 52 萬筆 ≈ 24 小時平均每秒 6 筆；每筆 16 bytes)
+DEFAULT_CAPACITY = 1 << 19
+DEFAULT_FPS = 30
+
+# 可選時間窗: (顯示名稱, 秒數)
+WINDOWS = [
+    ("1 分鐘", 60),
+    ("5 分鐘", 5 * 60),
+    ("15 分鐘", 15 * 60),
+    ("1 小時", 60 * 60),
+    ("4 小時", 4 * 60 * 60),
+    ("24 小時", 24 * 60 * 60),
+]
+DEFAULT_WINDOW = 15 * 60
+
+SERIES_MID, SERIES_SPREAD = 0, 1
+SERIES_NAMES = ["中價 (Mid)", "點差 (Spread)"]
+
+PALETTE = ["#4ec9b0", "#f44747", "#dcdcaa", "#569cd6", "#c586c0", "#ce9178",
+           "#b5cea8", "#9cdcfe", "#ff9800", "#d7ba7d", "#6a9955", "#e06c75"]
+
+MARGIN_L, MARGIN_R, MARGIN_T, MARGIN_B = 70, 10, 24, 22
+PANE_GAP = 16
+MID_RATIO = 0.6  # 中價面板佔的高度比例
+
+
+# ==========================================
+#  環形緩衝區
+# ==========================================
+
+class TickRing:
+    """
+    單一券商的 tick 環形緩衝區
+    total 為累計寫入筆數，最新一筆位於 (total - 1) % capacity；時間戳保持遞增以便二分搜尋
+    """
+    __slots__ = ("capacity", "ts", "mid", "spread", "total")
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, np.float64)
+        self.mid = np.zeros(capacity, np.float32)
+        self.spread = np.zeros(capacity, np.float32)
+        self.total = 0
+
+    def append(self, ts, bid, ask):
+        if self.total:
+            # 時間倒退的 tick (時鐘校正) 併入最後時間點，維持遞增
+            ts = max(ts, self.ts[(self.total - 1) % self.capacity])
+        i = self.total % self.capacity
+        self.ts[i] = ts
+        self.mid[i] = (bid + ask) * 0.5
+        self.spread[i] = abs(ask - bid)
+        self.total += 1
+
+    def clear(self):
+        self.total = 0
+
+    def last_ts(self):
+        if not self.total: return None
+        return float(self.ts[(self.total - 1) % self.capacity])
+
+    def spans(self, t0):
+        """回傳時間 >= t0 的索引區段 [(a, b)]，依時間順序，最多兩段 (緩衝區繞回時)"""
+        if self.total <= self.capacity:
+            spans = [(0, self.total)]
+        else:
+            s = self.total % self.capacity
+            spans = [(s, self.capacity), (0, s)] if s else [(0, self.capacity)]
+        out = []
+        for a, b in spans:
+            if b <= a or self.ts[b - 1] < t0: continue
+            out.append((a + int(np.searchsorted(self.ts[a:b], t0, "left")), b))
+        return out
+
+
+# ==========================================
+#  min/max 抽樣
+# ==========================================
+
+class MinMaxDecimator:
+    """
+    單一序列的 min/max 抽樣快取
+    桶以絕對時間 floor(ts / dt) 編號，k0 為畫面最左邊的桶；
+    畫面平移時快取陣列跟著平移，只重算「上次最後一桶」(可能尚未完成) 之後的 tick
+    """
+    __slots__ = ("dt", "k0", "lo", "hi", "next_k", "total")
+
+    def __init__(self):
+        self.dt = None
+        self.k0 = 0
+        self.lo = None
+        self.hi = None
+        self.next_k = 0   # 需要重算的第一個桶
+        self.total = 0    # 上次計算時緩衝區的累計筆數
+
+    def update(self, ring, values, dt, k0, nb):
+        """回傳 (lo, hi)，長度 nb，對應桶 k0 .. k0+nb-1 (無資料為 NaN)"""
+        if dt != self.dt or self.lo is None or len(self.lo) != nb or ring.total < self.total:
+            self.dt = dt
+            self.k0 = k0
+            self.lo = np.full(nb, np.nan)
+            self.hi = np.full(nb, np.nan)
+            self.next_k = k0
+            self.total = 0
+        elif k0 != self.k0:
+            self._shift(k0 - self.k0)
+            self.k0 = k0
+
+        if ring.total == self.total: return self.lo, self.hi
+
+        j = max(self.next_k - k0, 0)
+        self.lo[j:] = np.nan
+        self.hi[j:] = np.nan
+        for a, b in ring.spans((k0 + j) * dt):
+            idx = np.floor(ring.ts[a:b] / dt).astype(np.int64) - k0
+            np.clip(idx, 0, nb - 1, out=idx)
+            v = values[a:b]
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(idx)) + 1))
+            buckets = idx[starts]
+            # 兩段區間可能落在同一桶，以 fmin / fmax 合併
+            self.lo[buckets] = np.fmin(self.lo[buckets], np.minimum.reduceat(v, starts))
+            self.hi[buckets] = np.fmax(self.hi[buckets], np.maximum.reduceat(v, starts))
+        self.total = ring.total
+        self.next_k = int(math.floor(ring.last_ts() / dt))
+        return self.lo, self.hi
+
+    def _shift(self, shift):
+        nb = len(self.lo)
+        if abs(shift) >= nb:
+            self.lo.fill(np.nan)
+            self.hi.fill(np.nan)
+        elif shift > 0:
+            self.lo[:-shift] = self.lo[shift:]
+            self.hi[:-shift] = self.hi[shift:]
+            self.lo[-shift:] = np.nan
+            self.hi[-shift:] = np.nan
+        else:
+            self.lo[-shift:] = self.lo[:shift].copy()
+            self.hi[-shift:] = self.hi[:shift].copy()
+            self.lo[:-shift] = np.nan
+            self.hi[:-shift] = np.nan
+        # 平移後最左邊之前的 tick 不再需要
+        self.next_k = max(self.next_k, self.k0 + shift)
+
+
+def _polygon(xy):
+    """由 (n, 2) 陣列建立 QPolygonF，直接寫入其記憶體"""
+    n = len(xy)
+    poly = QPolygonF()
+    poly.fill(QPointF(), n)
+    buf = poly.data()
+    buf.setsize(n * 16)
+    np.frombuffer(buf, np.float64).reshape(n, 2)[:] = xy
+    return poly
+
+
+# ==========================================
+#  圖表元件
+# ==========================================
+
+class SpreadChart(QWidget):
+    """
+    用法:
+        chart = SpreadChart(); chart.set_brokers([(b_id, name), ...])
+        chart.append(b_id, ts, bid, ask)   # 每筆 tick (只寫入環形緩衝區)
+        chart.set_window(seconds)
+        chart.set_instrument("XAGUSD")     # 切換顯示的商品 (預設為第一個商品)
+    上方面板為中價，下方為點差；時間軸以最新 tick 時間為右端 (重播時同樣適用)
+    """
+
+    def __init__(self, parent=None, capacity=DEFAULT_CAPACITY, fps=DEFAULT_FPS):
+        super().__init__(parent)
+        self.capacity = capacity
+        self.window = DEFAULT_WINDOW
+        self.order = []         # [b_id]
+        self.names = {}
+        self.instrument = None  # 目前顯示的商品
+        self.visible = []       # order 中屬於該商品的報價代號
+        self.fmt = "{:.2f}"     # 縱軸數值格式 (依商品小數位數)
+        self.rings = {}         # b_id -> TickRing
+        self.decimators = {}    # b_id -> [中價, 點差] MinMaxDecimator
+        self.pens = {}
+        self.t_latest = None
+        self.dirty = True
+
+        self.bg = QColor("#1e1e1e")
+        self.grid_pen = QPen(QColor("#3c3c3c"))
+        self.text_color = QColor("#aaaaaa")
+        self.font_axis = QFont("Consolas", 8)
+        self.font_legend = QFont("Microsoft JhengHei", 9, QFont.Weight.Bold)
+        self.setMinimumHeight(240)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        self.timer.start(int(1000 / max(int(fps), 1)))
+
+    def set_brokers(self, brokers):
+        """brokers: [(b_id, name)]；保留的券商沿用既有緩衝區"""
+        self.order = [b for b, _ in brokers]
+        self.names = dict(brokers)
+        for b_id in list(self.rings):
+            if b_id not in self.names:
+                del self.rings[b_id]
+                del self.decimators[b_id]
+        for i, b_id in enumerate(self.order):
+            if b_id not in self.rings:
+                self.rings[b_id] = TickRing(self.capacity)
+                self.decimators[b_id] = [MinMaxDecimator(), MinMaxDecimator()]
+            pen = QPen(QColor(PALETTE[i % len(PALETTE)]))
+            pen.setWidthF(1.2)
+            self.pens[b_id] = pen
+        symbols = self.instruments()
+        self.set_instrument(self.instrument if self.instrument in symbols else (symbols[0] if symbols else None))
+
+    def instruments(self):
+        """目前券商清單中的商品 (依出現順序)"""
+        return list(dict.fromkeys(split_key(b_id)[1] for b_id in self.order))
+
+    def set_instrument(self, symbol):
+        self.instrument = symbol
+        self.visible = [b_id for b_id in self.order if split_key(b_id)[1] == symbol]
+        self.fmt = "{:.%df}" % instrument_decimals(symbol)
+        self.dirty = True
+
+    def append(self, b_id, ts, bid, ask):
+        ring = self.rings.get(b_id)
+        if ring is None: return
+        ring.append(ts, bid, ask)
+        if self.t_latest is None or ts > self.t_latest:
+            self.t_latest = ts
+        self.dirty = True
+
+    def clear(self):
+        for b_id, ring in self.rings.items():
+            ring.clear()
+            self.decimators[b_id] = [MinMaxDecimator(), MinMaxDecimator()]
+        self.t_latest = None
+        self.dirty = True
+
+    def set_window(self, seconds):
+        self.window = seconds
+        self.dirty = True
+
+    def tick(self):
+        if self.dirty and self.isVisible():
+            self.dirty = False
+            self.update()
+
+    def resizeEvent(self, event):
+        self.dirty = True
+        super().resizeEvent(event)
+
+    # ==========================================
+    #  繪圖
+    # ==========================================
+
+    def paintEvent(self, event):
+        p = QPainter(self)
+        p.fillRect(self.rect(), self.bg)
+        nb = self.width() - MARGIN_L - MARGIN_R
+        inner_h = self.height() - MARGIN_T - MARGIN_B - PANE_GAP
+        if nb < 10 or inner_h < 40 or self.t_latest is None:
+            p.setPen(self.text_color)
+            p.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, "等待報價...")
+            p.end()
+            return
+
+        dt = self.window / nb
+        k0 = int(math.floor(self.t_latest / dt)) - nb + 1
+        xs = MARGIN_L + np.arange(nb, dtype=np.float64) + 0.5
+
+        mid_h = inner_h * MID_RATIO
+        panes = [
+            (SERIES_MID, QRectF(MARGIN_L, MARGIN_T, nb, mid_h)),
+            (SERIES_SPREAD, QRectF(MARGIN_L, MARGIN_T + mid_h + PANE_GAP, nb, inner_h - mid_h)),
+        ]
+        p.setRenderHint(QPainter.RenderHint.Antialiasing, False)
+        for series, rect in panes:
+            self._draw_pane(p, series, rect, xs, dt, k0, nb)
+        self._draw_time_axis(p, panes[-1][1])
+        self._draw_legend(p)
+        p.end()
+
+    def _draw_pane(self, p, series, rect, xs, dt, k0, nb):
+        data = []
+        for b_id in self.visible:
+            ring = self.rings[b_id]
+            if not ring.total: continue
+            values = ring.mid if series == SERIES_MID else ring.spread
+            lo, hi = self.decimators[b_id][series].update(ring, values, dt, k0, nb)
+            data.append((b_id, lo, hi))
+
+        p.setPen(self.grid_pen)
+        p.drawRect(rect)
+        p.setFont(self.font_axis)
+        p.setPen(self.text_color)
+        p.drawText(QRectF(rect.left() + 4, rect.top() + 2, 200, 14),
+                   Qt.AlignmentFlag.AlignLeft, SERIES_NAMES[series])
+
+        lows = [lo[~np.isnan(lo)] for _, lo, _ in data]
+        highs = [hi[~np.isnan(hi)] for _, _, hi in data]
+        lows = np.concatenate(lows) if lows else np.empty(0)
+        highs = np.concatenate(highs) if highs else np.empty(0)
+        if not lows.size: return
+        vmin, vmax = float(lows.min()), float(highs.max())
+        if vmax - vmin < 1e-9:
+            vmin -= 0.5
+            vmax += 0.5
+        pad = (vmax - vmin) * 0.05
+        vmin -= pad
+        vmax += pad
+        scale = rect.height() / (vmax - vmin)
+        bottom = rect.bottom()
+
+        fmt = self.fmt
+        p.drawText(QRectF(0, rect.top() - 6, MARGIN_L - 6, 14), Qt.AlignmentFlag.AlignRight, fmt.format(vmax))
+        p.drawText(QRectF(0, rect.bottom() - 8, MARGIN_L - 6, 14), Qt.AlignmentFlag.AlignRight, fmt.format(vmin))
+
+        p.save()
+        p.setClipRect(rect)
+        for b_id, lo, hi in data:
+            mask = ~np.isnan(lo)
+            m = int(mask.sum())
+            if not m: continue
+            # 每個像素欄一條 (最低 -> 最高) 的垂直線段，連成一條折線
+            xy = np.empty((2 * m, 2))
+            xy[0::2, 0] = xy[1::2, 0] = xs[mask]
+            xy[0::2, 1] = bottom - (lo[mask] - vmin) * scale
+            xy[1::2, 1] = bottom - (hi[mask] - vmin) * scale
+            p.setPen(self.pens[b_id])
+            p.drawPolyline(_polygon(xy))
+        p.restore()
+
+    def _draw_time_axis(self, p, rect):
+        p.setFont(self.font_axis)
+        p.setPen(self.text_color)
+        t1 = self.t_latest
+        fmt = "%H:%M:%S" if self.window < 4 * 3600 else "%m-%d %H:%M"
+        for i in range(5):
+            x = rect.left() + rect.width() * i / 4
+            t = t1 - self.window * (4 - i) / 4
+            label = datetime.datetime.fromtimestamp(t).strftime(fmt)
+            p.drawText(QRectF(x - 50, rect.bottom() + 4, 100, 14), Qt.AlignmentFlag.AlignCenter, label)
+
+    def _draw_legend(self, p):
+        p.setFont(self.font_legend)
+        x = MARGIN_L
+        fm = p.fontMetrics()
+        for b_id in self.visible:
+            name = self.names.get(b_id, b_id)
+            p.setPen(self.pens[b_id].color())
+            p.drawText(QPointF(x, MARGIN_T - 8), name)
+            x += fm.horizontalAdvance(name) + 16
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+點差即時統計引擎 (增量計算)
+每個券商各自維護多個時間窗 (1m / 15m / 1h / session) 的統計量：
+1. EWMA 平均與變異數
+2. 單調佇列 (monotonic deque) 滾動最大/最小值
+3. 固定解析度直方圖 + Fenwick 樹的串流分位數 (HDR 風格)
+每筆 tick 的更新成本為攤銷 O(1)，查詢不需要重新掃描歷史資料。
+"""
+
+import math
+import time
+from collections import deque
+
+# 預設時間窗 (秒)，None 代表整個交易時段 (session) 不過期
+DEFAULT_WINDOWS = {
+    "1m": 60,
+    "15m": 15 * 60,
+    "1h": 60 * 60,
+    "session": None,
+}
+
+# 直方圖解析度與上限 (XAUUSD 點差以 0.01 為單位)
+DEFAULT_STEP = 0.01
+DEFAULT_MAX_SPREAD = 50.0
+
+# 各商品的最小報價跳動 (直方圖解析度與顯示位數)；未列出的商品沿用 DEFAULT_STEP
+INSTRUMENT_STEPS = {
+    "XAUUSD": 0.01,
+    "XAGUSD": 0.001,
+    "XPTUSD": 0.01,
+    "XPDUSD": 0.01,
+    "EURUSD": 0.00001,
+    "GBPUSD": 0.00001,
+    "USDJPY": 0.001,
+}
+
+
+def instrument_step(symbol):
+    return INSTRUMENT_STEPS.get(symbol, DEFAULT_STEP)
+
+
+def instrument_decimals(symbol):
+    """報價顯示的小數位數 (由最小跳動推得，XAUUSD 為 2、XAGUSD 為 3)"""
+    return max(0, int(round(-math.log10(instrument_step(symbol)))))
+
+
+class EWMA:
+    """
+    以時間衰減的指數移動平均與變異數
+    tau 為時間常數 (秒)；tau=None 時退化為整段累積平均 (Welford)
+    """
+
+    def __init__(self, tau=None):
+        self.tau = tau
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+        self.last_ts = None
+
+    def update(self, x, ts):
+        self.count += 1
+        if self.count == 1:
+            self.mean = x
+            self.var = 0.0
+            self.last_ts = ts
+            return
+
+        if self.tau is None:
+            alpha = 1.0 / self.count
+        else:
+            dt = max(ts - self.last_ts, 0.0)
+            alpha = 1.0 - math.exp(-dt / self.tau) if dt > 0 else 1.0 / min(self.count, 1000)
+        self.last_ts = ts
+
+        diff = x - self.mean
+        incr = alpha * diff
+        self.mean += incr
+        self.var = (1.0 - alpha) * (self.var + diff * incr)
+
+    @property
+    def std(self):
+        return math.sqrt(self.var) if self.var > 0 else 0.0
+
+
+class MonotonicMinMax:
+    """
+    滾動窗口最大/最小值：兩條單調佇列，每個元素最多進出一次 (攤銷 O(1))
+    window=None 時只保留全時段極值
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.min_q = deque()  # (ts, value) 值遞增
+        self.max_q = deque()  # (ts, value) 值遞減
+
+    def push(self, x, ts):
+        if self.window is None:
+            if not self.min_q or x < self.min_q[0][1]:
+                self.min_q.clear()
+                self.min_q.append((ts, x))
+            if not self.max_q or x > self.max_q[0][1]:
+                self.max_q.clear()
+                self.max_q.append((ts, x))
+            return
+
+        while self.min_q and self.min_q[-1][1] >= x:
+            self.min_q.pop()
+        self.min_q.append((ts, x))
+        while self.max_q and self.max_q[-1][1] <= x:
+            self.max_q.pop()
+        self.max_q.append((ts, x))
+        self.expire(ts)
+
+    def expire(self, now):
+        if self.window is None: return
+        limit = now - self.window
+        while self.min_q and self.min_q[0][0] <= limit:
+            self.min_q.popleft()
+        while self.max_q and self.max_q[0][0] <= limit:
+            self.max_q.popleft()
+
+    @property
+    def min(self):
+        return self.min_q[0][1] if self.min_q else 0.0
+
+    @property
+    def max(self):
+        return self.max_q[0][1] if self.max_q else 0.0
+
+
+class SpreadHistogram:
+    """
+    固定解析度的計數直方圖，以 Fenwick 樹維護前綴和
+    add/remove/quantile/rank 皆為 O(log B)，B 為桶數 (常數)
+    """
+
+    def __init__(self, step=DEFAULT_STEP, max_value=DEFAULT_MAX_SPREAD):
+        self.step = step
+        self.size = int(round(max_value / step)) + 1
+        self.tree = [0] * (self.size + 1)
+        self.counts = [0] * self.size
+        self.total = 0
+
+    def bucket(self, x):
+        idx = int(round(x / self.step))
+        if idx < 0: return 0
+        if idx >= self.size: return self.size - 1
+        return idx
+
+    def _add(self, idx, delta):
+        self.counts[idx] += delta
+        self.total += delta
+        i = idx + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & (-i)
+
+    def _prefix(self, idx):
+        """桶 0..idx 的累積數量"""
+        s = 0
+        i = idx + 1
+        while i > 0:
+            s += self.tree[i]
+            i -= i & (-i)
+        return s
+
+    def add(self, x):
+        idx = self.bucket(x)
+        self._add(idx, 1)
+        return idx
+
+    def remove_bucket(self, idx):
+        self._add(idx, -1)
+
+    def quantile(self, q):
+        """回傳第 q 分位的點差 (0 <= q <= 1)"""
+        if self.total == 0: return 0.0
+        target = max(1, int(math.ceil(q * self.total)))
+        # Fenwick 二分搜尋：找第一個前綴和 >= target 的桶
+        pos = 0
+        bit = 1 << (self.size.bit_length())
+        while bit:
+            nxt = pos + bit
+            if nxt <= self.size and self.tree[nxt] < target:
+                pos = nxt
+                target -= self.tree[nxt]
+            bit >>= 1
+        return min(pos, self.size - 1) * self.step
+
+    def rank(self, x):
+        """x 在分布中的百分位排名 (0~100)，同值桶取一半"""
+        if self.total == 0: return 0.0
+        idx = self.bucket(x)
+        below = self._prefix(idx - 1) if idx > 0 else 0
+        return 100.0 * (below + 0.5 * self.counts[idx]) / self.total
+
+
+class WindowStats:
+    """單一時間窗的統計量組合"""
+
+    def __init__(self, window=None, step=DEFAULT_STEP, max_value=DEFAULT_MAX_SPREAD):
+        self.window = window
+        self.ewma = EWMA(tau=window)
+        self.minmax = MonotonicMinMax(window)
+        self.hist = SpreadHistogram(step, max_value)
+        self.samples = deque()  # (ts, bucket)，僅有限窗口需要，用於過期移除
+
+    def update(self, x, ts):
+        self.ewma.update(x, ts)
+        self.minmax.push(x, ts)
+        idx = self.hist.add(x)
+        if self.window is not None:
+            self.samples.append((ts, idx))
+            self.expire(ts)
+
+    def expire(self, now):
+        if self.window is None: return
+        limit = now - self.window
+        while self.samples and self.samples[0][0] <= limit:
+            _, idx = self.samples.popleft()
+            self.hist.remove_bucket(idx)
+        self.minmax.expire(now)
+
+    @property
+    def count(self):
+        return self.hist.total
+
+    def median(self):
+        return self.hist.quantile(0.5)
+
+    def snapshot(self, current=None):
+        data = {
+            "count": self.hist.total,
+            "mean": self.ewma.mean,
+            "std": self.ewma.std,
+            "min": self.minmax.min,
+            "max": self.minmax.max,
+            "median": self.hist.quantile(0.5),
+            "p90": self.hist.quantile(0.9),
+            "p99": self.hist.quantile(0.99),
+        }
+        if current is not None:
+            data["rank"] = self.hist.rank(current)
+            data["vs_median"] = current / data["median"] if data["median"] > 0 else 0.0
+        return data
+
+
+class BrokerSpreadStats:
+    """單一券商的多時間窗統計"""
+
+    def __init__(self, windows=None, step=DEFAULT_STEP, max_value=DEFAULT_MAX_SPREAD):
+        windows = DEFAULT_WINDOWS if windows is None else windows
+        self.windows = {name: WindowStats(sec, step, max_value) for name, sec in windows.items()}
+        self.last_spread = 0.0
+        self.last_ts = None
+
+    def update(self, spread, ts):
+        self.last_spread = spread
+        self.last_ts = ts
+        for w in self.windows.values():
+            w.update(spread, ts)
+
+    def median(self, window="1h"):
+        w = self.windows.get(window)
+        return w.median() if w else 0.0
+
+    def rank(self, window="1h", spread=None):
+        w = self.windows.get(window)
+        if not w: return 0.0
+        return w.hist.rank(self.last_spread if spread is None else spread)
+
+    def vs_median(self, window="1h"):
+        med = self.median(window)
+        return self.last_spread / med if med > 0 else 0.0
+
+    def snapshot(self, window="1h"):
+        w = self.windows.get(window)
+        return w.snapshot(self.last_spread) if w else {}
+
+
+class SpreadStatsEngine:
+    """
+    全部券商的統計引擎
+    用法: engine.update(b_id, spread) 後以 engine.get(b_id) 查詢結果
+    step_for: 報價代號 -> 直方圖解析度 (選填，不同商品的點差單位不同)；
+              上限依解析度等比例縮放，每個直方圖的桶數維持一致
+    """
+
+    def __init__(self, windows=None, step=DEFAULT_STEP, max_value=DEFAULT_MAX_SPREAD, step_for=None):
+        self.windows = DEFAULT_WINDOWS if windows is None else dict(windows)
+        self.step = step
+        self.max_value = max_value
+        self.step_for = step_for
+        self.brokers = {}
+
+    def update(self, b_id, spread, ts=None):
+        if ts is None: ts = time.time()
+        stats = self.brokers.get(b_id)
+        if stats is None:
+            step, max_value = self.step, self.max_value
+            if self.step_for is not None:
+                step = self.step_for(b_id)
+                max_value = self.max_value * step / self.step
+            stats = BrokerSpreadStats(self.windows, step, max_value)
+            self.brokers[b_id] = stats
+        stats.update(spread, ts)
+        return stats
+
+    def get(self, b_id):
+        return self.brokers.get(b_id)
+
+    def remove(self, b_id):
+        self.brokers.pop(b_id, None)
+
+    def reset_session(self):
+        """新交易時段開始時清空所有統計"""
+        self.brokers.clear()
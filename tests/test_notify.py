@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+notify.NotificationHub 測試：各通道對本機的替身伺服器實際送出
+    HTTP (asyncio) -> Webhook / Telegram (api_base 指向本機)
+    SMTP (asyncio，只實作 EHLO/MAIL/RCPT/DATA/RSET/NOOP/QUIT)
+    UDP            -> Syslog
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import threading
+from email import message_from_bytes, policy
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notify import (Notification, NotificationHub, WebhookSink, TelegramSink, SmtpSink, SyslogSink,
+                    build_sinks, format_line)
+from alert_engine import AlertTransition
+from alert_rules import RuleEvent
+
+TS = 1700000000.0
+
+
+def note(i, level=0, b_id="WF"):
+    return Notification("alert", b_id, f"[{b_id}] 點差警報 {i}", f"[{b_id}] 訊息 {i}", level, TS + i)
+
+
+def wait_until(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond(): return True
+        time.sleep(0.01)
+    return cond()
+
+
+# ==========================================
+#  替身伺服器
+# ==========================================
+
+class LoopThread:
+    """在背景執行緒跑一個 asyncio 事件迴圈，替身伺服器都掛在上面"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(5)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        # 還掛著的連線處理協程先取消再關閉迴圈
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+
+class HTTPStub:
+    """
+    最小的 HTTP/1.1 接收端 (支援 keep-alive)
+    statuses: 依序回應的狀態碼，用完後一律 200
+    hold: threading.Event，設定後每個請求都要等它被 set 才回應
+    """
+
+    def __init__(self, lt, statuses=(), hold=None):
+        self.lt = lt
+        self.statuses = list(statuses)
+        self.hold = hold
+        self.requests = []      # (path, headers, body, 收到時間)
+        self.connections = 0
+        self.received = threading.Event()
+        self.server = lt.call(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                path = lines[0].split(" ")[1]
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests.append((path, headers, body, time.monotonic()))
+                self.received.set()
+                if self.hold is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, self.hold.wait, 5)
+                status = self.statuses.pop(0) if self.statuses else 200
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok".encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.server.close()
+        if self.hold is not None: self.hold.set()
+
+
+class SMTPStub:
+    """最小的 SMTP 接收端；messages 為 (寄件者, 收件者列表, 原始信件 bytes)"""
+
+    def __init__(self, lt):
+        self.messages = []
+        self.connections = 0
+        self.server = lt.call(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+
+        def reply(text):
+            writer.write(text.encode() + b"\r\n")
+
+        reply("220 stub ESMTP")
+        sender, rcpts = None, []
+        try:
+            while True:
+                line = (await reader.readline()).decode().rstrip("\r\n")
+                if not line: break
+                cmd = line[:4].upper()
+                if cmd in ("EHLO", "HELO"):
+                    reply("250 stub")
+                elif cmd == "MAIL":
+                    sender, rcpts = line.split(":", 1)[1].strip().strip("<>"), []
+                    reply("250 OK")
+                elif cmd == "RCPT":
+                    rcpts.append(line.split(":", 1)[1].strip().strip("<>"))
+                    reply("250 OK")
+                elif cmd == "DATA":
+                    reply("354 end with .")
+                    data = await reader.readuntil(b"\r\n.\r\n")
+                    self.messages.append((sender, rcpts, data[:-5].replace(b"\r\n..", b"\r\n.")))
+                    reply("250 queued")
+                elif cmd in ("RSET", "NOOP"):
+                    reply("250 OK")
+                elif cmd == "QUIT":
+                    reply("221 bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 not implemented")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def lt():
+    lt = LoopThread()
+    yield lt
+    lt.close()
+
+
+@pytest.fixture
+def hubs():
+    """測試結束時一律停止建立的 hub"""
+    created = []
+
+    def make(sinks, **kwargs):
+        hub = NotificationHub(sinks, **kwargs).start()
+        created.append(hub)
+        return hub
+
+    yield make
+    for hub in created:
+        hub.stop()
+
+
+# ==========================================
+#  Webhook
+# ==========================================
+
+def test_webhook_payload_and_batching(lt, hubs):
+    srv = HTTPStub(lt)
+    sink = WebhookSink(srv.url + "/hook?k=1", headers={"X-Token": "abc"}, batch_size=3, batch_wait=0.3)
+    hub = hubs([sink])
+    for i in range(7):
+        hub.publish(note(i, level=i % 3))
+
+    assert wait_until(lambda: hub.stats[sink.name].sent == 7)
+    assert [len(json.loads(r[2])["alerts"]) for r in srv.requests] == [3, 3, 1]
+    path, headers, body, _ = srv.requests[0]
+    assert path == "/hook?k=1"
+    assert headers["content-type"] == "application/json"
+    assert headers["x-token"] == "abc"
+    first = json.loads(body.decode("utf-8"))["alerts"][0]
+    assert first == {"kind": "alert", "broker": "WF", "title": "[WF] 點差警報 0", "message": "[WF] 訊息 0",
+                     "level": 0, "ts": TS}
+    # keep-alive：三批共用同一條連線
+    assert srv.connections == 1
+    assert hub.snapshot()[sink.name] == {"sent": 7, "batches": 3, "retries": 0, "failed": 0, "dropped": 0}
+    srv.close()
+
+
+def test_webhook_batch_wait_flushes_partial_batch(lt, hubs):
+    srv = HTTPStub(lt)
+    sink = WebhookSink(srv.url, batch_size=50, batch_wait=0.2)
+    hub = hubs([sink])
+    start = time.monotonic()
+    hub.publish(note(0))
+    hub.publish(note(1))
+
+    assert wait_until(lambda: len(srv.requests) == 1)
+    assert srv.requests[0][3] - start >= 0.15
+    assert len(json.loads(srv.requests[0][2])["alerts"]) == 2
+    srv.close()
+
+
+def test_webhook_retry_with_backoff(lt, hubs):
+    srv = HTTPStub(lt, statuses=[500, 503])
+    sink = WebhookSink(srv.url, batch_size=5, batch_wait=0.0, backoff=0.2, max_retries=3)
+    hub = hubs([sink])
+    hub.publish(note(0))
+
+    assert wait_until(lambda: hub.stats[sink.name].sent == 1)
+    assert len(srv.requests) == 3
+    assert hub.stats[sink.name].retries == 2
+    # 每次等待為 backoff * 2^attempt 乘上 0.5 ~ 1 的抖動
+    gaps = [b[3] - a[3] for a, b in zip(srv.requests, srv.requests[1:])]
+    assert 0.1 <= gaps[0] <= 0.2 + 0.15
+    assert 0.2 <= gaps[1] <= 0.4 + 0.15
+    # 重送的是同一批內容
+    assert srv.requests[0][2] == srv.requests[2][2]
+    srv.close()
+
+
+def test_webhook_gives_up_after_max_retries(lt, hubs):
+    srv = HTTPStub(lt, statuses=[500] * 10)
+    logs = []
+    sink = WebhookSink(srv.url, batch_size=5, batch_wait=0.05, backoff=0.01, max_retries=2)
+    hub = hubs([sink], log=logs.append)
+    hub.publish(note(0))
+    hub.publish(note(1))
+
+    assert wait_until(lambda: hub.stats[sink.name].failed == 2)
+    assert len(srv.requests) == 3
+    assert hub.snapshot()[sink.name] == {"sent": 0, "batches": 0, "retries": 2, "failed": 2, "dropped": 0}
+    assert len(logs) == 1 and "放棄 2 筆" in logs[0] and "HTTP 500" in logs[0]
+    srv.close()
+
+
+def test_queue_full_drops_without_blocking(lt, hubs):
+    hold = threading.Event()
+    srv = HTTPStub(lt, hold=hold)
+    sink = WebhookSink(srv.url, batch_size=1, batch_wait=0.0, queue_size=2)
+    hub = hubs([sink])
+    hub.publish(note(0))
+    assert srv.received.wait(5)   # 第一筆已被取出並卡在送出中
+
+    start = time.monotonic()
+    for i in range(1, 6):
+        hub.publish(note(i))
+    assert time.monotonic() - start < 0.1
+    assert wait_until(lambda: hub.stats[sink.name].dropped == 3)
+
+    hold.set()
+    assert wait_until(lambda: hub.stats[sink.name].sent == 3)
+    sent = [json.loads(r[2])["alerts"][0]["message"] for r in srv.requests]
+    assert sent == ["[WF] 訊息 0", "[WF] 訊息 1", "[WF] 訊息 2"]
+    srv.close()
+
+
+def test_slow_sink_does_not_delay_others(lt, hubs):
+    hold = threading.Event()
+    slow = HTTPStub(lt, hold=hold)
+    fast = HTTPStub(lt)
+    a = WebhookSink(slow.url, name="slow", batch_size=1, batch_wait=0.0)
+    b = WebhookSink(fast.url, name="fast", batch_size=1, batch_wait=0.0)
+    hub = hubs([a, b])
+    for i in range(3):
+        hub.publish(note(i))
+
+    assert wait_until(lambda: hub.stats["fast"].sent == 3)
+    assert hub.stats["slow"].sent == 0
+    hold.set()
+    assert wait_until(lambda: hub.stats["slow"].sent == 3)
+    slow.close()
+    fast.close()
+
+
+# ==========================================
+#  Telegram
+# ==========================================
+
+def test_telegram_send_message(lt, hubs):
+    srv = HTTPStub(lt)
+    sink = TelegramSink("123:ABC", "-100200", api_base=srv.url + "/tg/", batch_size=10, batch_wait=0.2)
+    hub = hubs([sink])
+    items = [note(0), note(1, b_id="IG")]
+    for n in items:
+        hub.publish(n)
+
+    assert wait_until(lambda: hub.stats[sink.name].sent == 2)
+    assert len(srv.requests) == 1
+    path, headers, body, _ = srv.requests[0]
+    assert path == "/tg/bot123:ABC/sendMessage"
+    assert headers["content-type"] == "application/json"
+    payload = json.loads(body.decode("utf-8"))
+    assert payload == {"chat_id": "-100200", "text": "\n".join(format_line(n) for n in items)}
+    srv.close()
+
+
+def test_publish_alert_uses_display_names(lt, hubs):
+    srv = HTTPStub(lt)
+    sink = WebhookSink(srv.url, batch_size=2, batch_wait=0.5)
+    hub = hubs([sink])
+    hub.names = {"WF": "Wells Fargo"}
+    hub.publish_alert(AlertTransition("WF", 1, 0, (0, 1), 0.85, TS, True, "", True, 0.8, False))
+    hub.publish_alert(RuleEvent("spread(IG) > 0.5", "IG", True, 0.61, TS + 1, ""))
+
+    assert wait_until(lambda: hub.stats[sink.name].sent == 2)
+    alerts = json.loads(srv.requests[0][2])["alerts"]
+    assert alerts[0]["kind"] == "alert" and alerts[0]["level"] == 1
+    assert alerts[0]["title"] == "[Wells Fargo] 點差警報 層級 2"
+    assert alerts[0]["message"] == "[Wells Fargo] 點差 0.85 大於 層級 2 門檻 0.8"
+    assert alerts[1]["kind"] == "rule" and alerts[1]["broker"] == "IG"
+    assert alerts[1]["message"] == "[IG] 規則成立: spread(IG) > 0.5 (數值 0.61)"
+    srv.close()
+
+
+# ==========================================
+#  SMTP
+# ==========================================
+
+def test_smtp_one_mail_per_batch(lt, hubs):
+    srv = SMTPStub(lt)
+    sink = SmtpSink("127.0.0.1", "mon@example.com", ["a@example.com", "b@example.com"], port=srv.port,
+                    tls=False, batch_size=10, batch_wait=0.2)
+    hub = hubs([sink])
+    for i in range(3):
+        hub.publish(note(i))
+    assert wait_until(lambda: hub.stats[sink.name].sent == 3)
+
+    assert len(srv.messages) == 1
+    sender, rcpts, raw = srv.messages[0]
+    assert sender == "mon@example.com"
+    assert rcpts == ["a@example.com", "b@example.com"]
+    msg = message_from_bytes(raw, policy=policy.default)
+    assert msg["Subject"] == "XAUUSD 點差警報 (3 筆)"
+    assert msg["To"] == "a@example.com, b@example.com"
+    assert msg.get_content().splitlines() == [format_line(note(i)) for i in range(3)]
+
+    # 單筆時主旨用通知標題，且沿用已登入的連線
+    hub.publish(note(9))
+    assert wait_until(lambda: len(srv.messages) == 2)
+    msg = message_from_bytes(srv.messages[1][2], policy=policy.default)
+    assert msg["Subject"] == "[WF] 點差警報 9"
+    assert srv.connections == 1
+    srv.close()
+
+
+def test_smtp_reconnects_after_failure(lt, hubs):
+    # 先指向沒有人監聽的埠：連線失敗 -> 重試；之後換成真的伺服器
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    dead_port = probe.getsockname()[1]
+    probe.close()
+    srv = SMTPStub(lt)
+    sink = SmtpSink("127.0.0.1", "mon@example.com", "a@example.com", port=dead_port, tls=False,
+                    batch_size=1, batch_wait=0.0, backoff=0.2, max_retries=3, timeout=1.0)
+    hub = hubs([sink])
+    hub.publish(note(0))
+    assert wait_until(lambda: hub.stats[sink.name].retries >= 1)
+    sink.port = srv.port
+
+    assert wait_until(lambda: hub.stats[sink.name].sent == 1)
+    assert srv.messages[0][1] == ["a@example.com"]
+    srv.close()
+
+
+# ==========================================
+#  Syslog
+# ==========================================
+
+def test_syslog_datagrams():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.settimeout(5)
+    sink = SyslogSink(port=listener.getsockname()[1], app="spread-test", batch_size=10, batch_wait=0.1)
+    hub = NotificationHub([sink]).start()
+    try:
+        for level in (0, 1, 2, 7):
+            hub.publish(note(level, level=level))
+        packets = [listener.recv(2048).decode("utf-8") for _ in range(4)]
+        assert wait_until(lambda: hub.stats[sink.name].sent == 4)
+    finally:
+        hub.stop()
+        listener.close()
+
+    # facility user(1) * 8 + severity：層級 1/2/3 -> 4/3/2，其他 -> 5
+    assert [p[:p.index(">") + 1] for p in packets] == ["<12>", "<11>", "<10>", "<13>"]
+    stamp = time.strftime("%b %d %H:%M:%S", time.localtime(TS))
+    assert packets[0] == f"<12>{stamp} {socket.gethostname()} spread-test: [WF] 訊息 0"
+    assert hub.stats[sink.name].batches == 1
+
+
+# ==========================================
+#  設定
+# ==========================================
+
+def test_build_sinks_from_config():
+    sinks, errors = build_sinks([
+        {"type": "webhook", "url": "http://127.0.0.1:1/x", "concurrency": 3},
+        {"type": "syslog", "enabled": False},
+        {"type": "pager"},
+        {"type": "telegram", "token": "t"},
+        {"type": "smtp", "host": "h", "sender": "s", "recipients": "r"},
+    ])
+    try:
+        assert [s.name for s in sinks] == ["webhook#1", "smtp#5"]
+        assert sinks[0].concurrency == 3 and sinks[0].pool.idle.maxsize == 3
+        assert sinks[1].batch_wait == 10.0 and sinks[1].recipients == ["r"]
+        assert len(errors) == 2
+        assert "未知類型 'pager'" in errors[0]
+        assert errors[1].startswith("通知設定第 4 筆 (telegram)")
+    finally:
+        for s in sinks:
+            s.close()
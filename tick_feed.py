@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+本機報價 / 警報發布伺服器 (不依賴 Qt)
+一組爬蟲同時供應多個下游程式 (下單機器人、紀錄、儀表板)，訊框格式與客戶端見 feed_client.py
+
+1. 背景執行緒跑 asyncio 事件迴圈，監聽 Unix socket 或 TCP (預設只綁 127.0.0.1)
+2. publish_*() 任何執行緒皆可呼叫且不阻塞：訊息只編碼一次放進佇列，
+   每批喚醒事件迴圈一次，依各訂閱者的篩選條件 (類型 / 券商 / 商品) 合併成一次寫出
+3. 訂閱者處理太慢、未送出的資料超過 max_buffer 時直接斷線，不拖慢發布端與其他訂閱者
+"""
+
+import os
+import json
+import stat
+import time
+import socket
+import asyncio
+import threading
+from collections import deque
+
+from feed_client import (DEFAULT_ADDRESS, DEFAULT_INSTRUMENT, PROTOCOL_VERSION, KINDS, MSG_TICK, MSG_ALERT,
+                         MSG_RULE, MSG_STATUS, MSG_HELLO, MSG_SUBSCRIBE, FrameReader, parse_address,
+                         encode_tick, encode_alert, encode_rule, encode_status, encode_json)
+
+DEFAULT_MAX_BUFFER = 1024 * 1024   # 每個訂閱者最多累積的未送出位元組
+MAX_CONTROL_BUFFER = 64 * 1024     # 訂閱者送來的控制訊息上限 (超過視為異常連線)
+ALL_KINDS = frozenset(KINDS.values())
+
+
+class Subscriber(asyncio.Protocol):
+    """單一訂閱者連線；篩選條件為 None 代表全部，收到第一個 SUBSCRIBE 之前不送任何訊息"""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.reader = FrameReader()
+        self.kinds = frozenset()
+        self.brokers = None
+        self.instruments = None
+        self.peer = "?"
+        self.out = []
+        self.sent = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = str(transport.get_extra_info("peername") or "unix")
+        sock = transport.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.subscribers.add(self)
+        transport.write(encode_json(MSG_HELLO, self.server.hello()))
+        self.server._log(f"[串流] 訂閱者連線: {self.peer} (共 {len(self.server.subscribers)} 個)")
+
+    def connection_lost(self, exc):
+        self.server.subscribers.discard(self)
+
+    def data_received(self, data):
+        self.reader.feed(data)
+        if len(self.reader.buf) > MAX_CONTROL_BUFFER:
+            self.transport.abort()
+            return
+        for msg_type, payload in self.reader.frames():
+            if msg_type == MSG_SUBSCRIBE:
+                self.apply_filters(payload)
+
+    def apply_filters(self, payload):
+        try:
+            data = json.loads(payload.decode("utf-8"))
+            kinds = data.get("kinds")
+            self.kinds = ALL_KINDS if kinds is None else frozenset(KINDS[k] for k in kinds)
+            brokers = data.get("brokers")
+            self.brokers = None if brokers is None else frozenset(brokers)
+            instruments = data.get("instruments")
+            self.instruments = None if instruments is None else frozenset(instruments)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.server._log(f"[串流] {self.peer} 訂閱條件錯誤: {e}")
+
+    def wants(self, msg_type, broker, instrument):
+        return (msg_type in self.kinds
+                and (self.brokers is None or broker in self.brokers)
+                and (instrument is None or self.instruments is None or instrument in self.instruments))
+
+
+class FeedServer:
+    """
+    用法:
+        feed = FeedServer("tcp:127.0.0.1:7410", log=callback).start()
+        feed.publish_tick(b_id, bid, ask, ts)      # 任何執行緒，不阻塞
+        feed.publish_transition(tr) / feed.publish_rule(ev) / feed.publish_status(b_id, msg)
+        feed.stop()
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, log=None, max_buffer=DEFAULT_MAX_BUFFER):
+        self.address = address
+        self.family, self.bind = parse_address(address)
+        self.log = log
+        self.max_buffer = max_buffer
+        self.names = {}   # b_id -> 顯示名稱 (隨 HELLO 送給訂閱者)
+        self.instruments = {}   # b_id -> [商品, ...] (隨 HELLO 送給訂閱者)
+        self.subscribers = set()
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.published = 0
+        self.dropped_clients = 0
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+
+    def _log(self, msg):
+        if self.log:
+            try:
+                self.log(msg)
+            except Exception:
+                pass
+
+    def hello(self):
+        return {"version": PROTOCOL_VERSION, "brokers": self.names, "instruments": self.instruments,
+                "kinds": list(KINDS)}
+
+    # ==========================================
+    #  生命週期
+    # ==========================================
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True, name="tick-feed")
+        self.thread.start()
+        self.ready.wait(5)
+        if self.error:
+            self._log(f"[串流] 無法監聽 {self.address}: {self.error}")
+        else:
+            self._log(f"[串流] 發布於 {self.address}")
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(self._listen())
+        except Exception as e:
+            self.error = e
+            self.loop.close()
+            self.ready.set()
+            return
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            for sub in list(self.subscribers):
+                sub.transport.abort()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+            if self.family == "unix": self._remove_socket_file()
+
+    async def _listen(self):
+        factory = lambda: Subscriber(self)
+        if self.family == "unix":
+            self._remove_socket_file()
+            return await self.loop.create_unix_server(factory, self.bind)
+        return await self.loop.create_server(factory, *self.bind, reuse_address=True)
+
+    def _remove_socket_file(self):
+        # 上次異常結束留下的 socket 檔會讓 bind 失敗
+        try:
+            if stat.S_ISSOCK(os.stat(self.bind).st_mode): os.remove(self.bind)
+        except OSError:
+            pass
+
+    @property
+    def running(self):
+        return self.loop is not None and not self.loop.is_closed() and self.error is None
+
+    def stop(self):
+        if self.running:
+            try:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+            except RuntimeError:
+                pass
+        if self.thread is not None:
+            self.thread.join(5)
+
+    # ==========================================
+    #  發布
+    # ==========================================
+
+    def publish_tick(self, b_id, bid, ask, ts, instrument=DEFAULT_INSTRUMENT, suspect=False):
+        self._publish(MSG_TICK, b_id, instrument, encode_tick(ts, b_id, bid, ask, instrument, suspect))
+
+    def publish_transition(self, tr, instrument=DEFAULT_INSTRUMENT):
+        self._publish(MSG_ALERT, tr.b_id, instrument,
+                      encode_alert(tr.ts, tr.b_id, tr.level, tr.prev_level, tr.spread, tr.threshold,
+                                   tr.fired, tr.suppressed, instrument))
+
+    def publish_rule(self, ev, instrument=DEFAULT_INSTRUMENT):
+        self._publish(MSG_RULE, ev.b_id, instrument,
+                      encode_rule(ev.ts, ev.b_id, ev.rule, ev.active, ev.value, instrument))
+
+    def publish_status(self, b_id, msg, ts=None, instrument=DEFAULT_INSTRUMENT):
+        ts = time.time() if ts is None else ts
+        self._publish(MSG_STATUS, b_id, instrument, encode_status(ts, b_id, msg, instrument))
+
+    def _publish(self, msg_type, broker, instrument, data):
+        if not self.running: return
+        self.queue.append((msg_type, broker, instrument, data))
+        with self.lock:
+            if self.scheduled: return
+            self.scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self._flush)
+        except RuntimeError:
+            pass   # 事件迴圈已關閉
+
+    def _flush(self):
+        with self.lock:
+            self.scheduled = False
+        batch = []
+        queue = self.queue
+        while queue:
+            batch.append(queue.popleft())
+        self.published += len(batch)
+        subscribers = self.subscribers
+        if not subscribers: return
+
+        for msg_type, broker, instrument, data in batch:
+            for sub in subscribers:
+                if sub.wants(msg_type, broker, instrument):
+                    sub.out.append(data)
+        for sub in list(subscribers):
+            if not sub.out: continue
+            out, sub.out = sub.out, []
+            sub.transport.write(b"".join(out))
+            sub.sent += len(out)
+            if sub.transport.get_write_buffer_size() > self.max_buffer:
+                # 消化太慢：斷線並丟棄其緩衝，不讓它拖住其他訂閱者
+                self.dropped_clients += 1
+                subscribers.discard(sub)
+                sub.transport.abort()
+                self._log(f"[串流] 訂閱者 {sub.peer} 處理過慢，已中斷連線")
+
+    def stats(self):
+        return {"subscribers": len(self.subscribers), "published": self.published,
+                "dropped_clients": self.dropped_clients}
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tick 紀錄器
+將 (時間戳, 券商, Bid, Ask) 串流與狀態變化緩衝後批次寫入 CSV：ticks/ticks_<日期>.csv
+供離線分析 (lead_lag.py) 與回放 (tick_replay.py) 使用
+狀態列的 bid/ask 為 0，只記錄狀態「有變化」的那一筆
+"""
+
+import os
+import csv
+import time
+import datetime
+
+# 輸出資料夾
+TICK_DIR = "ticks"
+
+TICK_FIELDS = ["ts", "source", "bid", "ask", "status"]
+
+# 緩衝筆數達到此值即寫入硬碟
+FLUSH_ROWS = 500
+
+
+class TickRecorder:
+    """
+    用法: recorder.record(source, bid, ask) 每筆呼叫；
+    計時器定期呼叫 flush()，停止監控時呼叫 close()
+    """
+
+    def __init__(self, folder=TICK_DIR, flush_rows=FLUSH_ROWS):
+        self.folder = folder
+        self.flush_rows = flush_rows
+        self.buffer = []
+        self.last_status = {}
+
+    def path_for(self, ts):
+        day = datetime.datetime.fromtimestamp(ts).strftime("%Y%m%d")
+        return os.path.join(self.folder, f"ticks_{day}.csv")
+
+    def record(self, source, bid, ask, ts=None):
+        if ts is None: ts = time.time()
+        self.buffer.append((ts, source, bid, ask, ""))
+        if len(self.buffer) >= self.flush_rows:
+            self.flush()
+
+    def record_status(self, source, msg, ts=None):
+        if self.last_status.get(source) == msg: return
+        self.last_status[source] = msg
+        if ts is None: ts = time.time()
+        self.buffer.append((ts, source, 0, 0, msg))
+
+    def flush(self):
+        if not self.buffer: return 0
+        os.makedirs(self.folder, exist_ok=True)
+
+        # 依日期分組 (跨午夜時寫到兩個檔案)
+        groups = {}
+        for row in self.buffer:
+            groups.setdefault(self.path_for(row[0]), []).append(row)
+
+        for path, rows in groups.items():
+            is_new = not os.path.exists(path)
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if is_new:
+                    writer.writerow(TICK_FIELDS)
+                writer.writerows((f"{ts:.3f}", src, bid, ask, st) for ts, src, bid, ask, st in rows)
+
+        count = len(self.buffer)
+        self.buffer = []
+        return count
+
+    def close(self):
+        return self.flush()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Tick 紀錄回放引擎
+讀取 TickRecorder 產生的 ticks/ticks_<日期>.csv，依原始 tick 間隔回放：
+1. speed=1 / 10 / 100 依倍速重現原始節奏 (以絕對排程補償，不會累積漂移)
+2. speed=0 為「極速」模式，不等待，用於吞吐量測試
+回放函式本身不依賴 Qt，由呼叫端提供 on_price / on_status 回呼；
+GUI 端以 QThread 包裝後發出與爬蟲相同的 price_signal / status_signal
+
+用法 (吞吐量測試):
+    python tick_replay.py ticks/ticks_20260101.csv --speed 0
+"""
+
+import sys
+import csv
+import time
+import argparse
+
+# 極速模式
+SPEED_MAX = 0
+
+# 檢查停止旗標的最長等待片段 (秒)
+SLEEP_SLICE = 0.1
+
+
+def load_session(paths):
+    """
+    讀取一或多個 tick CSV，回傳依時間排序的事件列表
+    每筆為 (ts, source, bid, ask, status)；價格列 status 為空字串
+    """
+    if isinstance(paths, str): paths = [paths]
+    events = []
+    for path in paths:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    ts = float(row["ts"])
+                    bid = float(row["bid"] or 0)
+                    ask = float(row["ask"] or 0)
+                except (KeyError, ValueError):
+                    continue
+                events.append((ts, row["source"], bid, ask, row.get("status") or ""))
+    # 多檔合併後依時間排序 (穩定排序保留同時間戳的原始順序)
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def replay_session(events, on_price, on_status=None, speed=1.0, should_stop=None):
+    """
+    依原始節奏回放事件
+    on_price(source, bid, ask, time_str, ts)；on_status(source, msg, ts)
+    should_stop() 回傳 True 時中止；回傳已回放的事件數
+    """
+    if not events: return 0
+    t0 = events[0][0]
+    wall0 = time.perf_counter()
+    count = 0
+
+    for ts, source, bid, ask, status in events:
+        if speed:
+            # 絕對排程：目標牆鐘時間 = 起點 + (原始經過時間 / 倍速)
+            target = wall0 + (ts - t0) / speed
+            while True:
+                if should_stop and should_stop(): return count
+                delay = target - time.perf_counter()
+                if delay <= 0: break
+                time.sleep(min(delay, SLEEP_SLICE))
+        elif should_stop and (count & 0x3FF) == 0 and should_stop():
+            return count
+
+        if status:
+            if on_status: on_status(source, status, ts)
+        elif bid > 0 and ask > 0:
+            on_price(source, bid, ask, time.strftime("%H:%M:%S", time.localtime(ts)), ts)
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tick 紀錄回放 (吞吐量測試)")
+    parser.add_argument("files", nargs="+", help="tick CSV 檔")
+    parser.add_argument("--speed", type=float, default=SPEED_MAX, help="回放倍速，0 = 極速")
+    args = parser.parse_args(argv)
+
+    t_load = time.perf_counter()
+    events = load_session(args.files)
+    t_start = time.perf_counter()
+    sources = set()
+    count = replay_session(events, lambda src, b, a, t, ts: sources.add(src), speed=args.speed)
+    elapsed = time.perf_counter() - t_start
+
+    span = events[-1][0] - events[0][0] if events else 0.0
+    print(f"載入 {len(events)} 筆 ({t_start - t_load:.2f} 秒)，券商 {len(sources)} 家")
+    print(f"回放 {count} 筆，耗時 {elapsed:.2f} 秒，原始時長 {span / 3600:.2f} 小時，"
+          f"{count / elapsed if elapsed > 0 else 0:.0f} 筆/秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
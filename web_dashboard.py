@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+內建網頁看板 (筆電 / 手機遠端觀看，只用標準函式庫，不依賴 Qt)
+1. 背景執行緒跑 asyncio HTTP 伺服器：/ 為看板頁面，/ws 為 WebSocket，/snapshot.json 為目前快照
+2. publish_*() 只把事件放進佇列 (任何執行緒、不阻塞、不喚醒事件迴圈)；
+   事件迴圈每幀取出一次，合併成「這一幀有變動的券商」差量
+3. 每幀只做一次 JSON 序列化與 WebSocket 封包，所有觀看者共用同一份位元組，
+   觀看者數量只影響寫出次數；送不出去 (累積超過 max_buffer) 的觀看者直接斷線
+4. 新連線先收到完整快照，之後只收差量
+5. 設定 token 時，頁面與 WebSocket 都需要 ?token=... (開放給其他機器時建議設定)
+
+用法:
+    web = WebDashboard("0.0.0.0:8080", token="secret", log=callback).start()
+    web.publish_tick(b_id, bid, ask, ts) / publish_status / publish_transition / publish_rule
+    web.stop()
+"""
+
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+from quote_shm import STATUS_OK, STATUS_SUSPECT, STATUS_NAMES, status_code
+from spread_stats import INSTRUMENT_STEPS, instrument_decimals
+
+DEFAULT_ADDRESS = "127.0.0.1:8080"
+DEFAULT_FPS = 4
+DEFAULT_MAX_BUFFER = 512 * 1024
+MAX_REQUEST = 8192
+EVENT_HISTORY = 50
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def parse_host_port(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def ws_frame(opcode, payload):
+    """伺服器送出的 WebSocket 訊框 (FIN，不遮罩)"""
+    n = len(payload)
+    if n < 126:
+        head = bytes((0x80 | opcode, n))
+    elif n < 65536:
+        head = bytes((0x80 | opcode, 126)) + n.to_bytes(2, "big")
+    else:
+        head = bytes((0x80 | opcode, 127)) + n.to_bytes(8, "big")
+    return head + payload
+
+
+async def ws_read(reader):
+    """讀取客戶端訊框；回傳 (opcode, payload)，連線結束時拋出 IncompleteReadError"""
+    b0, b1 = await reader.readexactly(2)
+    n = b1 & 0x7F
+    if n == 126:
+        n = int.from_bytes(await reader.readexactly(2), "big")
+    elif n == 127:
+        n = int.from_bytes(await reader.readexactly(8), "big")
+    if n > MAX_REQUEST: raise ValueError("訊框過大")
+    mask = await reader.readexactly(4) if b1 & 0x80 else None
+    data = await reader.readexactly(n)
+    if mask:
+        data = bytes(b ^ mask[i & 3] for i, b in enumerate(data))
+    return b0 & 0x0F, data
+
+
+class Viewer:
+    __slots__ = ("writer", "peer")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername")
+
+
+class WebDashboard:
+
+    def __init__(self, address=DEFAULT_ADDRESS, token=None, log=None, fps=DEFAULT_FPS,
+                 max_buffer=DEFAULT_MAX_BUFFER, title="XAUUSD 點差看板"):
+        self.host, self.port = parse_host_port(address)
+        self.token = token
+        self.log = log
+        self.interval = 1.0 / fps
+        self.max_buffer = max_buffer
+        self.title = title
+        self.names = {}        # b_id -> 顯示名稱
+        self.inbox = deque()   # 其他執行緒放入的事件，每幀取出
+        self.quotes = {}       # b_id -> {"b", "a", "t", "s", "l"}
+        self.events = deque(maxlen=EVENT_HISTORY)
+        self.pending_events = []   # 本幀新增的事件
+        self.viewers = set()
+        self.frames = 0
+        self.dropped_viewers = 0
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+        self.accepting = False   # 伺服器執行中才收事件，避免 inbox 無限增長
+
+    def _log(self, msg):
+        if self.log:
+            try:
+                self.log(msg)
+            except Exception:
+                pass
+
+    # ==========================================
+    #  生命週期
+    # ==========================================
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True, name="web-dashboard")
+        self.thread.start()
+        self.ready.wait(5)
+        if self.error:
+            self._log(f"[網頁看板] 無法監聽 {self.host}:{self.port}: {self.error}")
+        else:
+            self._log(f"[網頁看板] http://{self.host}:{self.port}/")
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, reuse_address=True))
+        except Exception as e:
+            self.error = e
+            self.loop.close()
+            self.ready.set()
+            return
+        ticker = self.loop.create_task(self._ticker())
+        self.accepting = True
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            ticker.cancel()
+            self.server.close()
+            for v in list(self.viewers):
+                v.writer.transport.abort()
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+
+    @property
+    def running(self):
+        return self.loop is not None and not self.loop.is_closed() and self.error is None
+
+    def stop(self):
+        self.accepting = False
+        if self.running:
+            try:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+            except RuntimeError:
+                pass
+        if self.thread is not None:
+            self.thread.join(5)
+
+    # ==========================================
+    #  發布 (任何執行緒)
+    # ==========================================
+
+    def publish_tick(self, b_id, bid, ask, ts, suspect=False):
+        if self.accepting: self.inbox.append(("q", b_id, bid, ask, ts, STATUS_SUSPECT if suspect else STATUS_OK))
+
+    def publish_status(self, b_id, msg, ts=None):
+        if self.accepting: self.inbox.append(("s", b_id, status_code(msg), msg, time.time() if ts is None else ts))
+
+    def publish_transition(self, tr):
+        if self.accepting: self.inbox.append(("a", tr))
+
+    def publish_rule(self, ev):
+        if self.accepting: self.inbox.append(("r", ev))
+
+    def remove(self, b_id):
+        """券商被移除：看板刪除該列 (不再參與最佳買賣價)"""
+        if self.accepting: self.inbox.append(("d", b_id))
+
+    # ==========================================
+    #  每幀合併與分送 (事件迴圈執行緒)
+    # ==========================================
+
+    def _apply(self, item, changed, removed):
+        kind, b_id = item[0], (item[1] if item[0] in ("q", "s", "d") else item[1].b_id)
+        if kind == "d":
+            self.quotes.pop(b_id, None)
+            changed.discard(b_id)
+            removed.add(b_id)
+            return
+        removed.discard(b_id)
+        q = self.quotes.get(b_id)
+        if q is None:
+            q = self.quotes[b_id] = {"b": None, "a": None, "t": 0.0, "s": 0, "l": -1}
+        if kind == "q":
+            q["b"], q["a"], q["t"], q["s"] = item[2], item[3], item[4], item[5]
+        elif kind == "s":
+            # 可疑期間的「監控中」不覆蓋可疑狀態
+            if not (q["s"] == STATUS_SUSPECT and item[2] == STATUS_OK):
+                if item[2] != q["s"] and item[2] != STATUS_OK:
+                    self._event(item[4], b_id, "status", item[3])
+                q["s"] = item[2]
+        elif kind == "a":
+            tr = item[1]
+            q["l"] = tr.level
+            if tr.fired:
+                self._event(tr.ts, b_id, "alert",
+                            f"警報 L{tr.level + 1} 點差 {tr.spread:.2f} (門檻 {tr.threshold:.2f})")
+        elif kind == "r":
+            ev = item[1]
+            self._event(ev.ts, b_id, "rule", f"規則{'成立' if ev.active else '解除'}: {ev.rule} ({ev.value:.2f})")
+        changed.add(b_id)
+
+    def _event(self, ts, b_id, kind, text):
+        ev = {"t": ts, "id": b_id, "k": kind, "m": text}
+        self.events.append(ev)
+        self.pending_events.append(ev)
+
+    async def _ticker(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            inbox = self.inbox
+            if not inbox: continue
+            changed, removed = set(), set()
+            self.pending_events = []
+            while inbox:
+                self._apply(inbox.popleft(), changed, removed)
+            if not self.viewers: continue
+            msg = {"type": "delta", "q": {b: self.quotes[b] for b in changed}}
+            if removed: msg["del"] = sorted(removed)
+            if self.pending_events: msg["ev"] = self.pending_events
+            # 一幀只序列化一次，所有觀看者共用
+            data = json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._broadcast(ws_frame(OP_TEXT, data))
+
+    def _broadcast(self, data):
+        self.frames += 1
+        for v in list(self.viewers):
+            transport = v.writer.transport
+            transport.write(data)
+            if transport.get_write_buffer_size() > self.max_buffer:
+                self.dropped_viewers += 1
+                self.viewers.discard(v)
+                transport.abort()
+                self._log(f"[網頁看板] 觀看者 {v.peer} 網路過慢，已中斷連線")
+
+    def snapshot(self):
+        # digits: 商品 -> 報價小數位數 (未列出的商品頁面以 2 位顯示)
+        return {"type": "snap", "title": self.title, "names": self.names, "status": STATUS_NAMES,
+                "digits": {s: instrument_decimals(s) for s in INSTRUMENT_STEPS},
+                "q": self.quotes, "ev": list(self.events)}
+
+    # ==========================================
+    #  HTTP / WebSocket
+    # ==========================================
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            writer.close()
+            return
+        headers = {}
+        for line in lines[1:]:
+            k, sep, v = line.partition(":")
+            if sep: headers[k.strip().lower()] = v.strip()
+        url = urlsplit(target)
+        if self.token and parse_qs(url.query).get("token", [None])[0] != self.token:
+            self._respond(writer, "403 Forbidden", "text/plain", b"forbidden")
+        elif method != "GET":
+            self._respond(writer, "405 Method Not Allowed", "text/plain", b"")
+        elif url.path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+            await self._websocket(reader, writer, headers)
+            return
+        elif url.path == "/":
+            self._respond(writer, "200 OK", "text/html; charset=utf-8", PAGE.encode("utf-8"))
+        elif url.path == "/snapshot.json":
+            self._respond(writer, "200 OK", "application/json; charset=utf-8",
+                          json.dumps(self.snapshot(), ensure_ascii=False).encode("utf-8"))
+        else:
+            self._respond(writer, "404 Not Found", "text/plain", b"not found")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def _respond(self, writer, status, ctype, body):
+        writer.write((f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                      "Cache-Control: no-store\r\nConnection: close\r\n\r\n").encode("latin-1") + body)
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        writer.write(ws_frame(OP_TEXT, json.dumps(self.snapshot(), ensure_ascii=False).encode("utf-8")))
+        viewer = Viewer(writer)
+        self.viewers.add(viewer)
+        self._log(f"[網頁看板] 觀看者連線: {viewer.peer} (共 {len(self.viewers)} 個)")
+        try:
+            while True:
+                opcode, data = await ws_read(reader)
+                if opcode == OP_CLOSE:
+                    writer.write(ws_frame(OP_CLOSE, data[:2]))
+                    break
+                if opcode == OP_PING:
+                    writer.write(ws_frame(OP_PONG, data))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            writer.close()
+
+    def stats(self):
+        return {"viewers": len(self.viewers), "frames": self.frames, "dropped_viewers": self.dropped_viewers}
+
+
+# ==========================================
+#  看板頁面 (單一 HTML，無外部資源)
+# ==========================================
+
+PAGE = r"""<!DOCTYPE html>
+<html lang="zh-Hant"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>點差看板</title>
+<style>
+body{margin:0;background:#1e1e1e;color:#ddd;font:14px Consolas,monospace}
+header{display:flex;justify-content:space-between;padding:8px 12px;background:#2d2d30}
+#conn{color:#f44747}#conn.ok{color:#4caf50}
+table{width:100%;border-collapse:collapse}
+th,td{padding:6px 8px;text-align:right;border-bottom:1px solid #333}
+th:first-child,td:first-child{text-align:left}
+tr.alert td{background:#5a1d1d}tr.suspect td{color:#ff9800}tr.err td{color:#888}
+td.best{color:#4fc3f7;font-weight:bold}
+#bbo{padding:6px 12px;color:#dcdcaa}
+#events{padding:0 12px;color:#aaa;max-height:40vh;overflow:auto}
+#events div.alert{color:#f44747}#events div.rule{color:#dcdcaa}
+</style></head><body>
+<header><b id="title">點差看板</b><span id="conn">連線中...</span></header>
+<div id="bbo"></div>
+<table><thead><tr><th>券商</th><th>Bid</th><th>Ask</th><th>點差</th><th>更新</th><th>狀態</th></tr></thead>
+<tbody id="rows"></tbody></table>
+<div id="events"></div>
+<script>
+let names={}, statusNames=[], quotes={}, digits={};
+const rows=document.getElementById("rows"), cells={};
+function fmt(v,id){return v==null?"-":v.toFixed(digits[sym(id)]??2)}
+function hms(t){return t?new Date(t*1000).toLocaleTimeString():"-"}
+function row(id){
+  if(cells[id])return cells[id];
+  const tr=document.createElement("tr"), c=[];
+  for(let i=0;i<6;i++){c.push(tr.insertCell())}
+  c[0].textContent=names[id]||id;
+  const ids=Object.keys(quotes).sort((a,b)=>(names[a]||a).localeCompare(names[b]||b));
+  const next=ids.slice(ids.indexOf(id)+1).find(x=>cells[x]);
+  rows.insertBefore(tr,next?cells[next].tr:null);
+  return cells[id]={tr,c};
+}
+function sym(id){const i=id.indexOf(":");return i<0?"XAUUSD":id.slice(i+1)}
+function paint(ids){
+  // 報價代號 = 券商[:商品]，最佳買賣價依商品分開計算
+  const best={};
+  for(const [id,q] of Object.entries(quotes)){
+    if(q.s!==1||q.b==null)continue;
+    const m=best[sym(id)]||(best[sym(id)]={bb:null,ba:null});
+    if(!m.bb||q.b>quotes[m.bb].b)m.bb=id;
+    if(!m.ba||q.a<quotes[m.ba].a)m.ba=id;
+  }
+  for(const id of ids){
+    const q=quotes[id], r=row(id);
+    r.c[1].textContent=fmt(q.b,id); r.c[2].textContent=fmt(q.a,id);
+    r.c[3].textContent=q.b==null?"-":fmt(q.a-q.b,id);
+    r.c[4].textContent=hms(q.t); r.c[5].textContent=statusNames[q.s]||"";
+    r.tr.className=q.l>=0?"alert":q.s===2?"suspect":q.s>2?"err":"";
+  }
+  for(const [id,r] of Object.entries(cells)){
+    const m=best[sym(id)]||{};
+    r.c[1].className=id===m.bb?"best":""; r.c[2].className=id===m.ba?"best":"";
+  }
+  const syms=Object.keys(best).sort();
+  document.getElementById("bbo").textContent=syms.map(k=>{
+    const {bb,ba}=best[k], tag=syms.length>1?`${k} `:"";
+    return `${tag}最佳 Bid ${fmt(quotes[bb].b,bb)} (${names[bb]||bb}) / 最佳 Ask ${fmt(quotes[ba].a,ba)} (${names[ba]||ba})`;
+  }).join("　|　");
+}
+function addEvents(evs){
+  const box=document.getElementById("events");
+  for(const e of evs){
+    const d=document.createElement("div"); d.className=e.k;
+    d.textContent=`[${hms(e.t)}] [${names[e.id]||e.id}] ${e.m}`;
+    box.prepend(d);
+  }
+  while(box.childNodes.length>50)box.removeChild(box.lastChild);
+}
+function connect(){
+  const ws=new WebSocket((location.protocol==="https:"?"wss://":"ws://")+location.host+"/ws"+location.search);
+  const conn=document.getElementById("conn");
+  ws.onopen=()=>{conn.textContent="即時";conn.className="ok"};
+  ws.onclose=()=>{conn.textContent="已斷線，重新連線中...";conn.className="";setTimeout(connect,2000)};
+  ws.onmessage=(m)=>{
+    const msg=JSON.parse(m.data);
+    if(msg.type==="snap"){
+      names=msg.names; statusNames=msg.status; quotes=msg.q; digits=msg.digits||{};
+      document.getElementById("title").textContent=msg.title; document.title=msg.title;
+      rows.innerHTML=""; for(const k in cells)delete cells[k];
+      document.getElementById("events").innerHTML="";
+      paint(Object.keys(quotes)); addEvents(msg.ev||[]);
+    }else{
+      for(const id of msg.del||[]){
+        delete quotes[id];
+        if(cells[id]){cells[id].tr.remove(); delete cells[id];}
+      }
+      Object.assign(quotes,msg.q); paint(Object.keys(msg.q)); if(msg.ev)addEvents(msg.ev);
+    }
+  };
+}
+connect();
+</script></body></html>
+"""
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+瀏覽器工作者數量自動調整
+依執行中的量測值決定要增加或退役瀏覽器 (Worker)：
+1. 最大報價年齡 (所有站台距上次更新的最長秒數) 與目標值比較
+2. 各 Worker 輪詢週期與各站台抓取延遲
+3. CPU 餘裕與 Chrome 記憶體 (需要 psutil；未安裝時不檢查資源限制)
+調整後以各站台延遲做負載重新分配 (只搬動必要的站台)，
+每次決策都寫入 JSON Lines 紀錄，方便追查為何在某台機器上選了 N 個 Worker
+"""
+
+import json
+import time
+from collections import deque
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 預設值
+DEFAULT_TARGET_AGE = 3.0      # 目標最大報價年齡 (秒)
+DEFAULT_WINDOW = 6            # 取最近幾次取樣做判斷
+DEFAULT_COOLDOWN = 60.0       # 調整後的冷卻時間 (新瀏覽器需要暖機)
+DEFAULT_CPU_LIMIT = 85.0      # CPU 使用率超過此值不再增加 Worker
+DEFAULT_MIN_FREE_MB = 1024    # 可用記憶體低於此值不再增加 Worker
+DEFAULT_SITE_LATENCY = 0.5    # 尚未量測到延遲的站台預設值 (秒)
+SHRINK_RATIO = 0.4            # 報價年齡低於目標的此比例才考慮減少 Worker
+LOG_FILE = "worker_tuner_log.jsonl"
+
+ACTION_ADD = "add"
+ACTION_RETIRE = "retire"
+ACTION_HOLD = "hold"
+
+
+def measure_resources():
+    """回傳 (系統 CPU %, Chrome 相關行程 RSS MB, 可用記憶體 MB)；無 psutil 時皆為 None"""
+    if psutil is None:
+        return None, None, None
+    cpu = psutil.cpu_percent(None)
+    chrome_mb = 0.0
+    try:
+        for p in psutil.Process().children(recursive=True):
+            try:
+                chrome_mb += p.memory_info().rss / 1048576.0
+            except Exception:
+                pass
+    except Exception:
+        pass
+    free_mb = psutil.virtual_memory().available / 1048576.0
+    return cpu, chrome_mb, free_mb
+
+
+def worker_loads(assignment, latency):
+    """每個 Worker 的預估週期 = 負責站台延遲總和"""
+    return {w: sum(latency.get(k, DEFAULT_SITE_LATENCY) for k in keys) for w, keys in assignment.items()}
+
+
+def rebalance(assignment, latency, min_gain=0.2):
+    """
+    將站台從最忙的 Worker 搬到最閒的 Worker，直到無法再降低最大負載
+    assignment: {worker_id: [site keys]} (不會被修改)
+    只有在最大負載能降低 min_gain 比例以上時才搬動，避免來回震盪
+    回傳搬移清單 [(key, from_worker, to_worker)]
+    """
+    plan = {w: list(keys) for w, keys in assignment.items()}
+    if len(plan) < 2: return []
+    loads = worker_loads(plan, latency)
+    before = max(loads.values())
+    moves = []
+
+    while True:
+        busiest = max(loads, key=loads.get)
+        idlest = min(loads, key=loads.get)
+        if busiest == idlest or len(plan[busiest]) <= 1: break
+        gap = loads[busiest] - loads[idlest]
+        # 選一個搬過去後能讓兩者最接近的站台
+        best_key, best_cost = None, None
+        for k in plan[busiest]:
+            cost = latency.get(k, DEFAULT_SITE_LATENCY)
+            if cost < gap and (best_cost is None or abs(gap - 2 * cost) < abs(gap - 2 * best_cost)):
+                best_key, best_cost = k, cost
+        if best_key is None: break
+
+        plan[busiest].remove(best_key)
+        plan[idlest].append(best_key)
+        loads[busiest] -= best_cost
+        loads[idlest] += best_cost
+        moves.append((best_key, busiest, idlest))
+
+    after = max(loads.values())
+    if before <= 0 or (before - after) / before < min_gain:
+        # 新加入的空 Worker 一定要分配站台，不受 min_gain 限制
+        if not any(len(keys) == 0 for keys in assignment.values()):
+            return []
+    return moves
+
+
+def plan_retire(assignment, worker_id, latency):
+    """退役 worker_id：把它的站台依延遲由大到小分給目前最閒的 Worker"""
+    others = {w: list(keys) for w, keys in assignment.items() if w != worker_id}
+    if not others: return []
+    loads = worker_loads(others, latency)
+    moves = []
+    for k in sorted(assignment.get(worker_id, []), key=lambda x: -latency.get(x, DEFAULT_SITE_LATENCY)):
+        target = min(loads, key=loads.get)
+        loads[target] += latency.get(k, DEFAULT_SITE_LATENCY)
+        moves.append((k, worker_id, target))
+    return moves
+
+
+def pick_retiree(assignment, latency):
+    """退役負載最輕的 Worker (搬動成本最小)"""
+    loads = worker_loads(assignment, latency)
+    return min(loads, key=loads.get) if loads else None
+
+
+class WorkerAutoTuner:
+    """
+    用法 (每隔數秒):
+        tuner.add_sample(max_age, cycle_times)
+        action, reason, metrics = tuner.decide(current_worker_count)
+    """
+
+    def __init__(self, min_workers=1, max_workers=4, target_age=DEFAULT_TARGET_AGE, window=DEFAULT_WINDOW,
+                 cooldown=DEFAULT_COOLDOWN, cpu_limit=DEFAULT_CPU_LIMIT, min_free_mb=DEFAULT_MIN_FREE_MB,
+                 log_path=LOG_FILE):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.target_age = target_age
+        self.cooldown = cooldown
+        self.cpu_limit = cpu_limit
+        self.min_free_mb = min_free_mb
+        self.log_path = log_path
+
+        self.ages = deque(maxlen=window)
+        self.cycles = deque(maxlen=window)
+        self.last_change = time.time()
+        self.last_reason = None
+
+    def add_sample(self, max_age, cycle_times=()):
+        self.ages.append(max_age)
+        if cycle_times:
+            self.cycles.append(max(cycle_times))
+
+    def reset(self):
+        self.ages.clear()
+        self.cycles.clear()
+        self.last_change = time.time()
+
+    def decide(self, current, now=None):
+        if now is None: now = time.time()
+        cpu, chrome_mb, free_mb = measure_resources()
+        metrics = {
+            "workers": current,
+            "max_age": max(self.ages) if self.ages else None,
+            "min_age": min(self.ages) if self.ages else None,
+            "max_cycle": max(self.cycles) if self.cycles else None,
+            "cpu": cpu, "chrome_mb": chrome_mb, "free_mb": free_mb,
+        }
+
+        if len(self.ages) < self.ages.maxlen:
+            return self._log(ACTION_HOLD, "取樣不足", metrics, now)
+        if now - self.last_change < self.cooldown:
+            return self._log(ACTION_HOLD, "冷卻中", metrics, now)
+
+        # 以窗口內「最好」的一次 (最小值) 判斷是否持續落後，避免單次尖峰觸發
+        age = metrics["min_age"]
+        if current < self.min_workers:
+            return self._change(ACTION_ADD, f"低於下限 {self.min_workers}", metrics, now)
+
+        if age > self.target_age:
+            if current >= self.max_workers:
+                return self._log(ACTION_HOLD, f"報價年齡 {age:.1f}s 超標但已達上限 {self.max_workers}", metrics, now)
+            if cpu is not None and cpu >= self.cpu_limit:
+                return self._log(ACTION_HOLD, f"報價年齡 {age:.1f}s 超標但 CPU {cpu:.0f}% 無餘裕", metrics, now)
+            if free_mb is not None and free_mb < self.min_free_mb:
+                return self._log(ACTION_HOLD, f"報價年齡 {age:.1f}s 超標但可用記憶體僅 {free_mb:.0f}MB", metrics, now)
+            return self._change(ACTION_ADD, f"報價年齡 {age:.1f}s > 目標 {self.target_age:.1f}s", metrics, now)
+
+        if current > self.max_workers:
+            return self._change(ACTION_RETIRE, f"高於上限 {self.max_workers}", metrics, now)
+
+        # 減少後每個 Worker 負擔變重，預估年齡約放大 current/(current-1) 倍
+        if current > self.min_workers and metrics["max_age"] is not None:
+            projected = metrics["max_age"] * current / (current - 1)
+            if metrics["max_age"] < self.target_age * SHRINK_RATIO and projected < self.target_age:
+                return self._change(ACTION_RETIRE, f"報價年齡 {metrics['max_age']:.1f}s 遠低於目標，"
+                                                   f"減少後預估 {projected:.1f}s", metrics, now)
+
+        return self._log(ACTION_HOLD, "報價年齡在目標內", metrics, now)
+
+    def _change(self, action, reason, metrics, now):
+        self.last_change = now
+        self.ages.clear()
+        self.cycles.clear()
+        return self._log(action, reason, metrics, now)
+
+    def _log(self, action, reason, metrics, now):
+        # 維持不變且理由相同時不重複寫入
+        if action != ACTION_HOLD or reason != self.last_reason:
+            self.last_reason = reason
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+                                            "action": action, "reason": reason, **metrics},
+                                           ensure_ascii=False) + "\n")
+                except OSError:
+                    pass
+        return action, reason, metrics